@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_paid_orders(apps, schema_editor):
+    Account = apps.get_model('accounts', 'Account')
+    Order = apps.get_model('orders', 'Order')
+
+    counts = Order.objects.filter(is_ordered=True, user__isnull=False).values('user').annotate(n=Count('id'))
+    for row in counts:
+        Account.objects.filter(id=row['user']).update(order_count=row['n'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_alter_account_groups'),
+        ('orders', '0007_order_user_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='order_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_paid_orders, migrations.RunPython.noop),
+    ]
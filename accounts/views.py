@@ -3,11 +3,17 @@ from .forms import RegistrationForm, UserForm, UserProfileForm
 from .models import Account, UserProfile
 from django.contrib import messages, auth
 from django.contrib.auth.decorators import login_required
-from carts.models import Cart, CartItem
-from carts.views import _cart_id
+from django.db import transaction
+from carts.backends import get_cart_store
+from carts.guest import GuestCart
+from carts.merge import merge_guest_cart
+from carts.utils import invalidate_cart_count
 import requests
-from orders.models import Order, OrderProduct
+from orders.models import Order
+from orders.receipts import display_receipt, get_receipt
 
+from core.mail import queue_email
+from core.pagination import KeysetPaginator
 from core.utils import log_event
 
 ## Email Verification libraries
@@ -16,10 +22,11 @@ from django.template.loader import render_to_string
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import EmailMessage
 
 # Create your views here.
 
+ORDERS_PER_PAGE = 20
+
 def send_verification_email(request, user, to_email):
     ## Sending Verification Link To Email
     current_site = get_current_site(request)
@@ -30,8 +37,7 @@ def send_verification_email(request, user, to_email):
         "uid": urlsafe_base64_encode(force_bytes(user.pk)),
         "token": default_token_generator.make_token(user) 
     })
-    send_email = EmailMessage(mail_subject, message, to=[to_email])
-    send_email.send()
+    queue_email(mail_subject, message, [to_email])
 
 def register(request):
     if request.method == "POST":
@@ -53,25 +59,26 @@ def register(request):
             
             username = email.split("@")[0]
 
-            user = Account.objects.create_user(
-                first_name=first_name,
-                last_name=last_name,
-                email=email,
-                username=username,
-                password=password
-            )
-            user.mobile_number = mobile_number
-            user.save()
+            with transaction.atomic():
+                user = Account.objects.create_user(
+                    first_name=first_name,
+                    last_name=last_name,
+                    email=email,
+                    username=username,
+                    password=password
+                )
+                user.mobile_number = mobile_number
+                user.save()
 
-            ## Creating User Profile
-            user_profile = UserProfile()
-            user_profile.user_id = user.id
-            user_profile.profile_picture = "default/default_user.png"
-            user_profile.save()
+                ## Creating User Profile
+                user_profile = UserProfile()
+                user_profile.user_id = user.id
+                user_profile.profile_picture = "default/default_user.png"
+                user_profile.save()
 
-            ## Sending Verification Link To Email
-            to_mail = email
-            send_verification_email(request, user, to_mail)
+                ## Sending Verification Link To Email (queued with the new account)
+                to_mail = email
+                send_verification_email(request, user, to_mail)
             return redirect('/accounts/login/?command=verification&email='+to_email)
     else:
         form = RegistrationForm()
@@ -88,45 +95,16 @@ def login(request):
 
         user = auth.authenticate(email=email, password=password)
         if user is not None:
-            try:
-                cart = Cart.objects.get(cart_id=_cart_id(request))
-                is_cart_item_exists = CartItem.objects.filter(cart=cart).exists()
-                if is_cart_item_exists:
-                    cart_item = CartItem.objects.filter(cart=cart)
-
-                    ##Bring all the variations from cart by cart id
-                    product_variation = []
-                    for item in cart_item:
-                        variation = item.variations.all()
-                        product_variation.append(list(variation))
-                    
-                    ##Get cart item from the user to acces his all product variations
-                    cart_item = CartItem.objects.filter(user=user)
-                    ex_var_list = []
-                    id = []
-                    for item in cart_item:
-                        existing_variation = item.variations.all()
-                        ex_var_list.append(list(existing_variation))
-                        id.append(item.id)
-                    
-                    for pv in product_variation:
-                        if pv in ex_var_list:
-                            # increase the cart item quantity
-                            index = ex_var_list.index(pv)
-                            item_id = id[index]
-                            item = CartItem.objects.get(id=item_id)
-                            item.quantity += 1
-                            item.user = user
-                            item.save()
-                        else:
-                            cart_item = CartItem.objects.filter(cart=cart)
-                            for item in cart_item:
-                                item.user = user
-                                item.save()
+            ## Move the cookie cart of the guest into the user's cart.
+            ## The cart store writes its copy back first so the merged rows are reloaded.
+            get_cart_store().forget(user)
+            GuestCart.from_request(request).materialize(user)
+
+            ## Carts stored in the database before the cookie cart existed
+            session_key = request.session.session_key
+            if session_key and merge_guest_cart(session_key, user):
+                invalidate_cart_count(user_id=user.id)
 
-            except:
-                pass
-            
             auth.login(request, user)
             messages.success(request, "You are logged in successfuly.")
             log_event(
@@ -192,8 +170,7 @@ def activate(request, uidb64, token):
 
 @login_required(login_url='login')
 def dashboard(request):
-    orders = Order.objects.order_by('-created_at').filter(user_id=request.user.id, is_ordered=True)
-    total_orders = orders.count()
+    total_orders = request.user.order_count  # kept by orders.checkout, no COUNT per visit
     try:
         user_profile = UserProfile.objects.get(user_id=request.user.id)
     except UserProfile.DoesNotExist:
@@ -221,8 +198,7 @@ def forgotPassword(request):
             })
 
             to_email = email
-            send_email = EmailMessage(mail_subject, message, to=[to_email])
-            send_email.send()
+            queue_email(mail_subject, message, [to_email])
 
             # messages.success(request, f"Thank you for registering with us. We have sent you a verification email to your {to_email} email address. Please verify it.")
             # return redirect('/accounts/login/?command=reset_password&email='+to_email)
@@ -303,9 +279,13 @@ def resetPassword(request):
 
 @login_required(login_url='login')
 def my_orders(request):
-    orders = Order.objects.filter(user_id=request.user.id, is_ordered=True).order_by('-created_at')
+    ## Keyset pagination over the (user, is_ordered, created_at, id) index: flat cost however long the history
+    orders = Order.objects.filter(user_id=request.user.id, is_ordered=True).only(
+        'order_number', 'first_name', 'last_name', 'phone', 'order_total', 'created_at',
+    )
+    paginator = KeysetPaginator(orders, ORDERS_PER_PAGE, ordering=('-created_at', '-id'))
     context = {
-        "orders": orders
+        "orders": paginator.get_page(request.GET.get('cursor')),
     }
     return render(request, 'accounts/my_orders.html', context)
 
@@ -370,17 +350,10 @@ def change_password(request):
 @login_required(login_url='login')
 def order_detail(request, order_id):
     order = Order.objects.get(order_number=order_id)
-    order_detail = OrderProduct.objects.filter(order=order)
-    # order_detail = OrderProduct.objects.filter(order__order_number=order_id)
-
-    subtotal = 0
-    for i in order_detail:
-        subtotal += i.product_price * i.quantity
 
     context = {
-        "order_detail": order_detail,
         "order": order,
-        "subtotal": subtotal
+        "receipt": display_receipt(get_receipt(order)),  # snapshot taken at payment, no per-line queries
     }
 
     return render(request, 'accounts/order_detail.html', context)
@@ -0,0 +1,373 @@
+import threading
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from store.models import Product, Variation
+from .guest import GuestCart
+from .models import CartItem
+from .utils import add_cart_line, get_cart_count, invalidate_cart_count, set_cart_line, variation_signature
+
+KV_CART_TIMEOUT = 60 * 60 * 24 * 30  # 30 days
+
+
+class CartStore:
+    # Common interface of the cart storage backends (carts of logged in users).
+    # Line ids are whatever the backend hands out in contents(); they're used in
+    # the remove_cart / remove_cart_item urls.
+    # CartItem rows stay the source of truth for orders: call flush() before
+    # reading them and forget() before writing them outside of the store.
+    name = None
+
+    def add(self, user, product_id, variation_ids, quantity=1):
+        raise NotImplementedError
+
+    def set_quantity(self, user, product_id, variation_ids, quantity):
+        # 0 removes the line
+        raise NotImplementedError
+
+    def set_quantities(self, user, quantities):
+        # Several lines at once, all or nothing: {(product_id, variation ids): quantity}
+        with transaction.atomic():
+            for (product_id, variation_ids), quantity in quantities.items():
+                self.set_quantity(user, product_id, variation_ids, quantity)
+
+    def remove(self, user, product_id, line_id, quantity=1):
+        raise NotImplementedError
+
+    def delete(self, user, product_id, line_id):
+        raise NotImplementedError
+
+    def count(self, user):
+        raise NotImplementedError
+
+    def contains_product(self, user, product_id):
+        raise NotImplementedError
+
+    def contents(self, user):
+        # (lines, total in paise, total quantity)
+        raise NotImplementedError
+
+    def clear(self, user):
+        raise NotImplementedError
+
+    def flush(self, user):
+        pass
+
+    def forget(self, user):
+        pass
+
+
+class ORMCartStore(CartStore):
+    # CartItem rows, written on every change
+    name = 'orm'
+
+    def add(self, user, product_id, variation_ids, quantity=1):
+        add_cart_line(product_id, variation_ids, quantity, user=user)
+        invalidate_cart_count(user_id=user.id)
+
+    def set_quantity(self, user, product_id, variation_ids, quantity):
+        set_cart_line(product_id, variation_ids, quantity, user=user)
+        invalidate_cart_count(user_id=user.id)
+
+    def remove(self, user, product_id, line_id, quantity=1):
+        cart_item = CartItem.objects.filter(user=user, product_id=product_id, id=line_id).first()
+        if cart_item is None:
+            return
+        if cart_item.quantity > quantity:
+            cart_item.quantity -= quantity
+            cart_item.save()
+        else:
+            cart_item.delete()
+        invalidate_cart_count(user_id=user.id)
+
+    def delete(self, user, product_id, line_id):
+        CartItem.objects.filter(user=user, product_id=product_id, id=line_id).delete()
+        invalidate_cart_count(user_id=user.id)
+
+    def count(self, user):
+        return get_cart_count(user)
+
+    def contains_product(self, user, product_id):
+        return CartItem.objects.filter(user=user, product_id=product_id).exists()
+
+    def contents(self, user):
+        # Totals in one aggregate query, lines with product and variations prefetched
+        # so templates don't query per line
+        cart_items = CartItem.objects.filter(user=user, is_active=True)
+        totals = cart_items.aggregate(
+            total_paise=Sum(F('quantity') * F('product__price') * 100),
+            quantity=Sum('quantity'),
+        )
+        items = list(cart_items.select_related('product').prefetch_related('variations').order_by('id'))
+        return items, totals['total_paise'] or 0, totals['quantity'] or 0
+
+    def clear(self, user):
+        CartItem.objects.filter(user=user).delete()
+        invalidate_cart_count(user_id=user.id)
+
+
+class LocalKV:
+    # In-process stand-in for the subset of the Redis hash commands KVCartStore
+    # uses. Values are kept as strings like a decode_responses=True client.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data.get(key, {}))
+
+    def hexists(self, key, field):
+        with self._lock:
+            return field in self._data.get(key, {})
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            values = dict(mapping or {})
+            if field is not None:
+                values[field] = value
+            self._data.setdefault(key, {}).update({f: str(v) for f, v in values.items()})
+            return len(values)
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            hash_ = self._data.setdefault(key, {})
+            if field in hash_:
+                return 0
+            hash_[field] = str(value)
+            return 1
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            hash_ = self._data.setdefault(key, {})
+            value = int(hash_.get(field, 0)) + amount
+            hash_[field] = str(value)
+            return value
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            hash_ = self._data.get(key, {})
+            removed = sum(1 for field in fields if hash_.pop(field, None) is not None)
+            if not hash_:
+                self._data.pop(key, None)
+            return removed
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._data.pop(key, None) is not None)
+
+    def expire(self, key, seconds):
+        return key in self._data
+
+
+class KVCartStore(CartStore):
+    # One hash per user cart in a key-value store: field "product_id:variation_id.variation_id",
+    # value the quantity. Loaded from CartItem on first use and written back to
+    # CartItem by flush() (checkout), so cart changes never touch the database.
+    name = 'kv'
+    LOADED = '_loaded'
+    DIRTY = '_dirty'
+
+    def __init__(self, client=None):
+        self.client = client if client is not None else self._default_client()
+
+    @staticmethod
+    def _default_client():
+        # Redis at REDIS_URL. LocalKV keeps carts per worker and loses them on restart,
+        # so it's only used when passed in explicitly (tests, bench_cart_store).
+        url = getattr(settings, 'REDIS_URL', None)
+        if not url:
+            raise ImproperlyConfigured("CART_BACKEND = 'kv' needs REDIS_URL to be set.")
+        import redis
+        return redis.Redis.from_url(url, decode_responses=True)
+
+    ## Hash layout
+    @staticmethod
+    def _key(user):
+        return f'carts:kv:{user.id}'
+
+    @staticmethod
+    def _field(product_id, variation_ids):
+        return f"{product_id}:{'.'.join(map(str, sorted(variation_ids)))}"
+
+    @staticmethod
+    def _parse_field(field):
+        product_id, variation_ids = field.split(':')
+        return int(product_id), tuple(int(v) for v in variation_ids.split('.') if v)
+
+    def _quantities(self, user):
+        # {(product_id, variation ids): quantity} of the cart, loading it first if needed
+        values = self.client.hgetall(self._key(user))
+        if self.LOADED not in values:
+            self._load(user)
+            values = self.client.hgetall(self._key(user))
+        return {
+            self._parse_field(field): int(quantity)
+            for field, quantity in values.items()
+            if not field.startswith('_') and int(quantity) > 0
+        }
+
+    def _load(self, user):
+        # Copy the user's CartItem rows into the hash: two queries.
+        # hsetnx so a change made meanwhile by another request isn't overwritten.
+        key = self._key(user)
+        variations = {}
+        for item_id, variation_id in CartItem.variations.through.objects.filter(cartitem__user=user).values_list('cartitem_id', 'variation_id'):
+            variations.setdefault(item_id, []).append(variation_id)
+        for item_id, product_id, quantity in CartItem.objects.filter(user=user).values_list('id', 'product_id', 'quantity'):
+            self.client.hsetnx(key, self._field(product_id, variations.get(item_id, ())), quantity)
+        self.client.hset(key, self.LOADED, 1)
+        self.client.expire(key, KV_CART_TIMEOUT)
+
+    def _field_for_line(self, user, product_id, line_id):
+        for (item_product_id, variation_ids) in self._quantities(user):
+            if item_product_id == product_id and GuestCart.line_id(item_product_id, variation_ids) == line_id:
+                return self._field(item_product_id, variation_ids)
+        return None
+
+    def _touch(self, user):
+        key = self._key(user)
+        self.client.hset(key, self.DIRTY, 1)
+        self.client.expire(key, KV_CART_TIMEOUT)
+
+    ## Cart operations
+    def add(self, user, product_id, variation_ids, quantity=1):
+        if not self.client.hexists(self._key(user), self.LOADED):
+            self._load(user)
+        self.client.hincrby(self._key(user), self._field(product_id, set(variation_ids)), quantity)
+        self._touch(user)
+
+    def set_quantity(self, user, product_id, variation_ids, quantity):
+        key = self._key(user)
+        if not self.client.hexists(key, self.LOADED):
+            self._load(user)
+        field = self._field(product_id, set(variation_ids))
+        if quantity > 0:
+            self.client.hset(key, field, quantity)
+        else:
+            self.client.hdel(key, field)
+        self._touch(user)
+
+    def set_quantities(self, user, quantities):
+        # One HSET for the whole batch, the dirty flag included, so a failure can't
+        # leave part of it applied. Removed lines are written as 0 (ignored when
+        # reading) and dropped afterwards.
+        if not quantities:
+            return
+        key = self._key(user)
+        if not self.client.hexists(key, self.LOADED):
+            self._load(user)
+        mapping = {self._field(product_id, set(variation_ids)): max(quantity, 0)
+                   for (product_id, variation_ids), quantity in quantities.items()}
+        self.client.hset(key, mapping={**mapping, self.DIRTY: 1})
+        self.client.expire(key, KV_CART_TIMEOUT)
+        removed = [field for field, quantity in mapping.items() if not quantity]
+        if removed:
+            self.client.hdel(key, *removed)
+
+    def remove(self, user, product_id, line_id, quantity=1):
+        field = self._field_for_line(user, product_id, line_id)
+        if field is None:
+            return
+        if self.client.hincrby(self._key(user), field, -quantity) <= 0:
+            self.client.hdel(self._key(user), field)
+        self._touch(user)
+
+    def delete(self, user, product_id, line_id):
+        field = self._field_for_line(user, product_id, line_id)
+        if field is not None:
+            self.client.hdel(self._key(user), field)
+            self._touch(user)
+
+    def count(self, user):
+        return sum(self._quantities(user).values())
+
+    def contains_product(self, user, product_id):
+        return any(key[0] == product_id for key in self._quantities(user))
+
+    def contents(self, user):
+        # Same lines as a guest cart: two queries, totals added up in Python
+        lines = GuestCart(self._quantities(user)).get_lines()
+        total_paise = sum(line.quantity * line.product.price * 100 for line in lines)
+        return lines, total_paise, sum(line.quantity for line in lines)
+
+    def clear(self, user):
+        CartItem.objects.filter(user=user).delete()
+        self.client.delete(self._key(user))
+        invalidate_cart_count(user_id=user.id)
+
+    ## Write-behind
+    def flush(self, user):
+        # Make the user's CartItem rows match the hash, in one transaction and a
+        # fixed number of queries. Nothing to do when the hash didn't change.
+        key = self._key(user)
+        if not self.client.hexists(key, self.DIRTY):
+            return
+        quantities = self._quantities(user)
+        products = set(Product.objects.filter(id__in={product_id for product_id, _ in quantities}).values_list('id', flat=True))
+        variations = set(Variation.objects.filter(id__in={v for _, ids in quantities for v in ids}).values_list('id', flat=True))
+        wanted = {}
+        for (product_id, variation_ids), quantity in quantities.items():
+            if product_id in products:
+                variation_ids = [v for v in variation_ids if v in variations]
+                wanted[(product_id, variation_signature(variation_ids))] = (variation_ids, quantity)
+
+        with transaction.atomic():
+            current = {
+                (item.product_id, item.variation_signature): item
+                for item in CartItem.objects.select_for_update().filter(user=user)
+            }
+            now = timezone.now()
+            changed, stale_ids, new_items, new_variations = [], [], [], []
+            for line_key, item in current.items():
+                if line_key not in wanted:
+                    stale_ids.append(item.id)
+                elif item.quantity != wanted[line_key][1]:
+                    item.quantity = wanted[line_key][1]
+                    item.updated_at = now
+                    changed.append(item)
+            for (product_id, signature), (variation_ids, quantity) in wanted.items():
+                if (product_id, signature) not in current:
+                    new_items.append(CartItem(user=user, product_id=product_id, variation_signature=signature, quantity=quantity))
+                    new_variations.append(variation_ids)
+
+            if stale_ids:
+                CartItem.objects.filter(id__in=stale_ids).delete()
+            if changed:
+                CartItem.objects.bulk_update(changed, ['quantity', 'updated_at'])
+            if new_items:
+                CartItem.objects.bulk_create(new_items)
+                Through = CartItem.variations.through
+                Through.objects.bulk_create(
+                    Through(cartitem_id=item.id, variation_id=variation_id)
+                    for item, variation_ids in zip(new_items, new_variations)
+                    for variation_id in variation_ids
+                )
+
+        self.client.hdel(key, self.DIRTY)
+        invalidate_cart_count(user_id=user.id)
+
+    def forget(self, user):
+        # Write the cart back and drop the hash, so the next read reloads it from CartItem
+        self.flush(user)
+        self.client.delete(self._key(user))
+
+
+BACKENDS = {
+    ORMCartStore.name: ORMCartStore,
+    KVCartStore.name: KVCartStore,
+}
+
+_store = None
+
+
+def get_cart_store():
+    # One store per process, picked from settings.CART_BACKEND
+    global _store
+    if _store is None:
+        _store = BACKENDS[getattr(settings, 'CART_BACKEND', 'orm')]()
+    return _store
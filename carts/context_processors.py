@@ -1,20 +1,11 @@
-from carts.models import Cart, CartItem
-from .views import _cart_id
+from .backends import get_cart_store
+from .guest import GuestCart
 
 def counter(request):
-    cart_count = 0
     if 'admin' in request.path:
         return {}
+    if request.user.is_authenticated:
+        cart_count = get_cart_store().count(request.user)
     else:
-        try:
-            cart = Cart.objects.filter(cart_id=_cart_id(request))
-            if request.user.is_authenticated:
-                cart_items = CartItem.objects.all().filter(user=request.user)
-            else:
-                cart_items = CartItem.objects.all().filter(cart=cart[:1])
-            for cart_item in cart_items:
-                cart_count += cart_item.quantity
-        except Cart.DoesNotExist:
-            cart_count = 0
-
-    return dict(cart_count=cart_count)
\ No newline at end of file
+        cart_count = GuestCart.from_request(request).count()
+    return dict(cart_count=cart_count)
@@ -0,0 +1,223 @@
+import zlib
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Account
+from store.models import Product, Variation
+from .models import CartItem
+from .utils import invalidate_cart_count, variation_signature
+
+GUEST_CART_COOKIE = 'gkart_cart'
+GUEST_CART_SALT = 'carts.guest'
+GUEST_CART_MAX_AGE = 60 * 60 * 24 * 30  # 30 days
+GUEST_CART_MAX_LINES = 50  # keeps the cookie well under 4KB
+
+
+class GuestCartFull(Exception):
+    # A new line would take the cart past GUEST_CART_MAX_LINES
+    pass
+
+
+class VariationList(list):
+    # Lets templates use cart_item.variations.all like on a CartItem
+    def all(self):
+        return self
+
+
+class GuestCartLine:
+    def __init__(self, line_id, product, variations, quantity):
+        self.id = line_id
+        self.product = product
+        self.variations = VariationList(variations)
+        self.quantity = quantity
+
+    def sub_total(self):
+        return self.quantity * self.product.price
+
+
+class GuestCart:
+    # Cart of an anonymous visitor, kept in a signed cookie as
+    # "product_id:variation_id.variation_id:quantity|..." so browsing and adding
+    # to the cart write nothing to the database. Turned into CartItem rows by
+    # materialize() at login or checkout. GuestCartMiddleware writes the cookie back.
+
+    def __init__(self, lines=None):
+        self.lines = lines or {}  # {(product_id, (variation ids)): quantity}
+        self.modified = False
+
+    ## Loading / saving
+    @classmethod
+    def from_request(cls, request):
+        guest_cart = getattr(request, '_guest_cart', None)
+        if guest_cart is None:
+            value = request.get_signed_cookie(GUEST_CART_COOKIE, default=None, salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE)
+            guest_cart = cls(cls._decode(value))
+            request._guest_cart = guest_cart
+        return guest_cart
+
+    @staticmethod
+    def _decode(value):
+        lines = {}
+        for entry in (value or '').split('|'):
+            try:
+                product_id, variation_ids, quantity = entry.split(':')
+                key = (int(product_id), tuple(sorted(int(v) for v in variation_ids.split('.') if v)))
+                quantity = int(quantity)
+            except ValueError:
+                continue
+            if quantity > 0:
+                lines[key] = lines.get(key, 0) + quantity
+        return lines
+
+    def _encode(self):
+        return '|'.join(
+            f"{product_id}:{'.'.join(map(str, variation_ids))}:{quantity}"
+            for (product_id, variation_ids), quantity in self.lines.items()
+        )
+
+    def save(self, response):
+        if not self.modified:
+            return
+        if self.lines:
+            response.set_signed_cookie(
+                GUEST_CART_COOKIE, self._encode(), salt=GUEST_CART_SALT, max_age=GUEST_CART_MAX_AGE,
+                httponly=True, samesite='Lax', secure=not settings.DEBUG,
+            )
+        else:
+            response.delete_cookie(GUEST_CART_COOKIE, samesite='Lax')
+        self.modified = False
+
+    ## Lines
+    @staticmethod
+    def line_id(product_id, variation_ids):
+        return zlib.crc32(f'{product_id}:{variation_signature(variation_ids)}'.encode())
+
+    def _key_for(self, line_id):
+        return next((key for key in self.lines if self.line_id(*key) == line_id), None)
+
+    def _check_room(self, key):
+        if key not in self.lines and len(self.lines) >= GUEST_CART_MAX_LINES:
+            raise GuestCartFull(f'A cart holds at most {GUEST_CART_MAX_LINES} different items.')
+
+    def add(self, product_id, variation_ids, quantity=1):
+        # Raises GuestCartFull instead of adding a line past the cap
+        key = (product_id, tuple(sorted(set(variation_ids))))
+        self._check_room(key)
+        self.lines[key] = self.lines.get(key, 0) + quantity
+        self.modified = True
+
+    def set(self, product_id, variation_ids, quantity):
+        # 0 removes the line; raises GuestCartFull like add
+        key = (product_id, tuple(sorted(set(variation_ids))))
+        if quantity <= 0:
+            if self.lines.pop(key, None) is not None:
+                self.modified = True
+            return
+        self._check_room(key)
+        self.lines[key] = quantity
+        self.modified = True
+
+    def remove(self, line_id, quantity=1):
+        key = self._key_for(line_id)
+        if key is None:
+            return
+        if self.lines[key] > quantity:
+            self.lines[key] -= quantity
+        else:
+            del self.lines[key]
+        self.modified = True
+
+    def delete(self, line_id):
+        key = self._key_for(line_id)
+        if key is not None:
+            del self.lines[key]
+            self.modified = True
+
+    def clear(self):
+        if self.lines:
+            self.lines = {}
+            self.modified = True
+
+    def count(self):
+        return sum(self.lines.values())
+
+    def contains_product(self, product_id):
+        return any(key[0] == product_id for key in self.lines)
+
+    def get_lines(self):
+        # Lines with their products and variations: two queries whatever the size.
+        # Lines of products that no longer exist are dropped.
+        if not self.lines:
+            return []
+        products = Product.objects.in_bulk({product_id for product_id, _ in self.lines})
+        variation_ids = {v for _, ids in self.lines for v in ids}
+        variations = Variation.objects.in_bulk(variation_ids) if variation_ids else {}
+
+        lines = []
+        for (product_id, ids), quantity in self.lines.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            line_variations = [variations[v] for v in ids if v in variations]
+            lines.append(GuestCartLine(self.line_id(product_id, ids), product, line_variations, quantity))
+        return lines
+
+    def materialize(self, user):
+        # Move the cookie lines into the user's CartItem rows: quantities are added to the
+        # user's lines with the same product and variations, the others are created.
+        # One transaction and a fixed number of queries whatever the cart size; the cookie
+        # is emptied once it has committed, so a failed merge can simply be retried.
+        if not self.lines:
+            return
+        with transaction.atomic():
+            # Merges of the same user run one at a time, as in carts.merge
+            Account.objects.select_for_update().filter(id=user.id).values_list('id').first()
+
+            products = set(Product.objects.filter(id__in={product_id for product_id, _ in self.lines}).values_list('id', flat=True))
+            variation_ids = {v for _, ids in self.lines for v in ids}
+            variations = set(Variation.objects.filter(id__in=variation_ids).values_list('id', flat=True)) if variation_ids else set()
+
+            wanted = {}  # {(product_id, variation signature): [variation ids, quantity]}
+            for (product_id, ids), quantity in self.lines.items():
+                if product_id not in products:
+                    continue
+                ids = [v for v in ids if v in variations]
+                line = wanted.setdefault((product_id, variation_signature(ids)), [ids, 0])
+                line[1] += quantity
+            if not wanted:
+                transaction.on_commit(self.clear)
+                return
+
+            existing = {
+                (item.product_id, item.variation_signature): item
+                for item in CartItem.objects.select_for_update()
+                .filter(user=user, product_id__in={product_id for product_id, _ in wanted})
+                .only('id', 'product_id', 'variation_signature', 'quantity')
+            }
+
+            now = timezone.now()
+            updated, created = [], []
+            for (product_id, signature), (ids, quantity) in wanted.items():
+                item = existing.get((product_id, signature))
+                if item is None:
+                    created.append((CartItem(user=user, product_id=product_id, variation_signature=signature, quantity=quantity), ids))
+                else:
+                    item.quantity += quantity
+                    item.updated_at = now
+                    updated.append(item)
+
+            if updated:
+                CartItem.objects.bulk_update(updated, ['quantity', 'updated_at'])
+            if created:
+                CartItem.objects.bulk_create([item for item, _ in created])
+                Through = CartItem.variations.through
+                Through.objects.bulk_create([
+                    Through(cartitem_id=item.id, variation_id=variation_id)
+                    for item, ids in created
+                    for variation_id in ids
+                ])
+
+            transaction.on_commit(self.clear)
+            transaction.on_commit(lambda: invalidate_cart_count(user_id=user.id))
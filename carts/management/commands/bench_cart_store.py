@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import Account
+from carts.backends import KVCartStore, LocalKV, ORMCartStore
+from carts.models import CartItem
+from category.models import Category
+from core.benchmark import benchmark_database, timed
+from store.models import Product, Variation
+
+
+class Command(BaseCommand):
+    help = "Compare the throughput of the cart storage backends on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=20, help="Distinct products cycled through by the adds.")
+        parser.add_argument('--ops', type=int, default=200, help="Operations per timed round.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--redis', action='store_true', help="Also run the KV backend against settings.REDIS_URL.")
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            category = Category.objects.create(category_name='Bench', slug='bench')
+            products = Product.objects.bulk_create([
+                Product(product_name=f'Bench {i}', slug=f'bench-{i}', price=100 + i, stock=100,
+                        category=category, product_images='photos/products/bench.jpg')
+                for i in range(options['products'])
+            ])
+            variations = Variation.objects.bulk_create([
+                Variation(product=product, variation_category='size', variation_value='m') for product in products
+            ])
+
+            stores = [('orm', ORMCartStore()), ('kv (in-process)', KVCartStore(LocalKV()))]
+            if options['redis']:
+                stores.append(('kv (redis)', KVCartStore(KVCartStore._default_client())))
+
+            ops = options['ops']
+            for i, (label, store) in enumerate(stores):
+                user = Account.objects.create_user(email=f'bench{i}@example.com', username=f'bench{i}', first_name='Bench', last_name='User')
+
+                def add():
+                    for n in range(ops):
+                        store.add(user, products[n % len(products)].id, [variations[n % len(products)].id])
+
+                def count():
+                    for _ in range(ops):
+                        store.count(user)
+
+                def view():
+                    # what the cart page does: the summary plus the badge count
+                    for _ in range(ops // 10):
+                        store.contents(user)
+                        store.count(user)
+
+                results = [(name, timed(func, options['repeat']), calls) for name, func, calls in (
+                    ('add', add, ops), ('count', count, ops), ('cart page', view, ops // 10),
+                )]
+                flush_ms = timed(lambda: (store.add(user, products[0].id, []), store.flush(user)), options['repeat'])
+
+                self.stdout.write(label)
+                for name, ms, calls in results:
+                    self.stdout.write(f"  {name:10} {calls / ms * 1000:10.0f} ops/s")
+                self.stdout.write(f"  {'flush':10} {flush_ms:10.2f} ms")
+                self.stdout.write(f"  {CartItem.objects.filter(user=user).count()} CartItem rows after the run")
+                store.clear(user)
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Account
+from carts.models import CartItem
+from carts.summary import get_cart_summary
+from category.models import Category
+from core.benchmark import benchmark_database, timed
+from store.models import Product, Variation
+
+
+class Command(BaseCommand):
+    help = "Benchmark the cart summary service against the old per-line loop on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, nargs='+', default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            user = Account.objects.create_user(email='bench@example.com', username='bench', first_name='Bench', last_name='User')
+            category = Category.objects.create(category_name='Bench', slug='bench')
+            max_lines = max(options['lines'])
+            products = Product.objects.bulk_create([
+                Product(product_name=f'Bench {i}', slug=f'bench-{i}', price=100 + i, stock=100,
+                        category=category, product_images='photos/products/bench.jpg')
+                for i in range(max_lines)
+            ])
+            variations = Variation.objects.bulk_create([
+                Variation(product=product, variation_category=category_name, variation_value=value)
+                for product in products for category_name, value in (('color', 'red'), ('size', 'm'))
+            ])
+
+            factory = RequestFactory()
+            for lines in options['lines']:
+                CartItem.objects.filter(user=user).delete()
+                for i, product in enumerate(products[:lines]):
+                    item = CartItem.objects.create(user=user, product=product, quantity=2)
+                    item.variations.add(*variations[i * 2:i * 2 + 2])
+
+                def new_path():
+                    request = factory.get('/cart/')
+                    request.user = user
+                    summary = get_cart_summary(request)
+                    for item in summary.items:
+                        item.sub_total()
+                        list(item.variations.all())
+
+                old_ms = timed(lambda: self._old_path(user), options['repeat'])
+                new_ms = timed(new_path, options['repeat'])
+                old_queries = self._count_queries(lambda: self._old_path(user))
+                new_queries = self._count_queries(new_path)
+                self.stdout.write(
+                    f"{lines:4} lines | old loop {old_ms:8.2f} ms {old_queries:4} queries "
+                    f"| summary {new_ms:8.2f} ms {new_queries:4} queries"
+                )
+
+    def _old_path(self, user):
+        # The previous carts.views.cart loop plus what the template touched per line
+        total = quantity = 0
+        for item in CartItem.objects.filter(user=user, is_active=True):
+            total += item.product.price * item.quantity
+            quantity += item.quantity
+            item.sub_total()
+            list(item.variations.all())
+        tax = (2 * total) / 100
+        return total + tax
+
+    def _count_queries(self, func):
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        return len(queries.captured_queries)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from carts.purge import purge_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete abandoned guest carts, stale inactive cart lines, orphaned cart lines and expired sessions "
+        "in small batches. Safe to schedule (e.g. from cron) while the site is live."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30, help="Age after which guest carts and inactive lines are removed.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--pause', type=float, default=0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        deleted = purge_carts(days=options['days'], batch_size=options['batch_size'], pause=options['pause'])
+        if not deleted:
+            self.stdout.write("Nothing to purge.")
+            return
+        for table, count in sorted(deleted.items()):
+            self.stdout.write(f"{table}: {count} rows deleted")
+        self.stdout.write(self.style.SUCCESS(f"Purged {sum(deleted.values())} rows."))
@@ -0,0 +1,54 @@
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.models import Account
+from .models import Cart, CartItem
+
+
+def merge_guest_cart(cart_id, user):
+    # Move the lines of a database guest cart into the user's cart.
+    # Lines with the same product and variations are merged by adding up the
+    # quantities, the others are handed over to the user, then the guest cart is
+    # removed. One transaction and a fixed number of queries whatever the cart size.
+    # Returns the number of guest lines moved or merged.
+    with transaction.atomic():
+        # Merges of the same user run one at a time, so two logins can't both
+        # create the same user line
+        Account.objects.select_for_update().filter(id=user.id).values_list('id').first()
+
+        cart = Cart.objects.select_for_update().filter(cart_id=cart_id).first()
+        if cart is None:  # no guest cart, or another login merged it already
+            return 0
+
+        guest_items = list(CartItem.objects.filter(cart=cart).only('id', 'product_id', 'variation_signature', 'quantity'))
+        if not guest_items:
+            cart.delete()
+            return 0
+
+        user_items = {
+            (item.product_id, item.variation_signature): item
+            for item in CartItem.objects.select_for_update()
+            .filter(user=user, product_id__in={item.product_id for item in guest_items})
+            .only('id', 'product_id', 'variation_signature', 'quantity')
+        }
+
+        now = timezone.now()
+        merged, merged_ids, moved_ids = [], [], []
+        for item in guest_items:
+            existing = user_items.get((item.product_id, item.variation_signature))
+            if existing is None:
+                moved_ids.append(item.id)
+            else:
+                existing.quantity += item.quantity
+                existing.updated_at = now
+                merged.append(existing)
+                merged_ids.append(item.id)
+
+        if merged:
+            CartItem.objects.bulk_update(merged, ['quantity', 'updated_at'])
+            CartItem.objects.filter(id__in=merged_ids).delete()
+        if moved_ids:
+            CartItem.objects.filter(id__in=moved_ids).update(user=user, cart=None, updated_at=now)
+        cart.delete()
+
+    return len(guest_items)
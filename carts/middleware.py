@@ -0,0 +1,15 @@
+class GuestCartMiddleware:
+    """
+    Writes the guest cart cookie back when a view changed the cart.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        guest_cart = getattr(request, '_guest_cart', None)
+        if guest_cart is not None:
+            guest_cart.save(response)
+
+        return response
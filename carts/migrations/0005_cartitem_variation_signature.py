@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:16
+
+from django.conf import settings
+import hashlib
+
+from django.db import migrations, models
+
+
+def fill_signatures_and_merge_duplicates(apps, schema_editor):
+    CartItem = apps.get_model('carts', 'CartItem')
+
+    items = list(CartItem.objects.prefetch_related('variations').order_by('id'))
+    for item in items:
+        ids = sorted({v.id for v in item.variations.all()})
+        item.variation_signature = hashlib.sha1(','.join(map(str, ids)).encode()).hexdigest() if ids else ''
+    CartItem.objects.bulk_update(items, ['variation_signature'], batch_size=500)
+
+    # Lines that the new unique constraints would reject are folded into the oldest one
+    kept = {}
+    merged, duplicates = {}, []
+    for item in items:
+        keys = []
+        if item.user_id is not None:
+            keys.append(('user', item.user_id, item.product_id, item.variation_signature))
+        if item.cart_id is not None:
+            keys.append(('cart', item.cart_id, item.product_id, item.variation_signature))
+        original = next((kept[key] for key in keys if key in kept), None)
+        if original is None:
+            for key in keys:
+                kept[key] = item
+        else:
+            original.quantity += item.quantity
+            merged[original.id] = original
+            duplicates.append(item.id)
+    CartItem.objects.bulk_update(list(merged.values()), ['quantity'], batch_size=500)
+    CartItem.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('carts', '0004_cartitem_user_alter_cartitem_cart'),
+        ('store', '0014_product_url_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cartitem',
+            name='variation_signature',
+            field=models.CharField(blank=True, default='', editable=False, max_length=40),
+        ),
+        migrations.RunPython(fill_signatures_and_merge_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'product', 'variation_signature'), name='unique_user_cart_line'),
+        ),
+        migrations.AddConstraint(
+            model_name='cartitem',
+            constraint=models.UniqueConstraint(condition=models.Q(('cart__isnull', False)), fields=('cart', 'product', 'variation_signature'), name='unique_cart_line'),
+        ),
+    ]
@@ -17,6 +17,23 @@ class CartItem(models.Model):
     cart       = models.ForeignKey(Cart, on_delete=models.CASCADE, null=True)
     quantity   = models.IntegerField()
     is_active  = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    ## sha1 of the sorted variation ids ('' for none), see carts.utils.variation_signature
+    variation_signature = models.CharField(max_length=40, blank=True, default='', editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'product', 'variation_signature'],
+                condition=models.Q(user__isnull=False),
+                name='unique_user_cart_line',
+            ),
+            models.UniqueConstraint(
+                fields=['cart', 'product', 'variation_signature'],
+                condition=models.Q(cart__isnull=False),
+                name='unique_cart_line',
+            ),
+        ]
 
     def sub_total(self):
         return self.quantity * self.product.price
@@ -0,0 +1,87 @@
+from store.models import Product
+from store.variations import resolve_variations
+from .backends import get_cart_store
+from .guest import GUEST_CART_MAX_LINES, GuestCart
+from .summary import get_cart_summary
+
+OPERATIONS = ('add', 'set', 'remove')
+MAX_OPERATIONS = 50
+MAX_LINE_QUANTITY = 100
+
+
+class CartMutationError(Exception):
+    pass
+
+
+def parse_operations(payload):
+    # Validate a {"operations": [{"op", "product_id", "quantity", "variations"}, ...]} payload.
+    # Returns [(op, product_id, variation ids, quantity)] or raises CartMutationError.
+    operations = payload.get('operations') if isinstance(payload, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise CartMutationError('"operations" must be a non-empty list.')
+    if len(operations) > MAX_OPERATIONS:
+        raise CartMutationError(f'At most {MAX_OPERATIONS} operations per request.')
+
+    parsed = []
+    for position, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise CartMutationError(f'Operation {position}: "op" must be one of {", ".join(OPERATIONS)}.')
+        try:
+            product_id = int(operation['product_id'])
+            quantity = int(operation.get('quantity', 1))
+        except (KeyError, TypeError, ValueError):
+            raise CartMutationError(f'Operation {position}: "product_id" and "quantity" must be integers.')
+        lowest = 0 if operation['op'] == 'set' else 1
+        if not lowest <= quantity <= MAX_LINE_QUANTITY:
+            raise CartMutationError(f'Operation {position}: "quantity" must be between {lowest} and {MAX_LINE_QUANTITY}.')
+        variations = operation.get('variations') or {}
+        if not isinstance(variations, dict):
+            raise CartMutationError(f'Operation {position}: "variations" must be an object like {{"color": "red"}}.')
+        parsed.append((operation['op'], product_id, variations, quantity))
+
+    product_ids = {product_id for _, product_id, _, _ in parsed}
+    available = set(Product.objects.filter(id__in=product_ids, is_available=True).values_list('id', flat=True))
+    if product_ids - available:
+        raise CartMutationError(f'Unknown or unavailable products: {sorted(product_ids - available)}.')
+
+    return [
+        (op, product_id, tuple(sorted(set(resolve_variations(product_id, variations)))), quantity)
+        for op, product_id, variations, quantity in parsed
+    ]
+
+
+def apply_operations(request, operations):
+    # Work out the final quantity of every touched line first, then write them all,
+    # so a batch is applied entirely or not at all. Returns the new cart summary.
+    if request.user.is_authenticated:
+        current = {
+            (item.product.id, tuple(sorted(v.id for v in item.variations.all()))): item.quantity
+            for item in get_cart_summary(request).items
+        }
+    else:
+        guest_cart = GuestCart.from_request(request)
+        current = dict(guest_cart.lines)
+
+    quantities = {}
+    for op, product_id, variation_ids, quantity in operations:
+        key = (product_id, variation_ids)
+        now = quantities.get(key, current.get(key, 0))
+        if op == 'add':
+            quantities[key] = min(now + quantity, MAX_LINE_QUANTITY)
+        elif op == 'remove':
+            quantities[key] = max(now - quantity, 0)
+        else:
+            quantities[key] = quantity
+    changes = {key: quantity for key, quantity in quantities.items() if quantity != current.get(key, 0)}
+
+    if request.user.is_authenticated:
+        get_cart_store().set_quantities(request.user, changes)  # one call, all or nothing on every backend
+    else:
+        lines = {key for key, quantity in {**current, **changes}.items() if quantity > 0}
+        if len(lines) > GUEST_CART_MAX_LINES:
+            raise CartMutationError(f'A cart holds at most {GUEST_CART_MAX_LINES} different items.')
+        for (product_id, variation_ids), quantity in changes.items():
+            guest_cart.set(product_id, variation_ids, quantity)
+
+    request._cart_summary = None
+    return get_cart_summary(request)
@@ -0,0 +1,48 @@
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Cart, CartItem
+
+
+def _delete_in_batches(queryset, batch_size, pause=0):
+    # Delete the rows of queryset batch_size at a time, each batch in its own short
+    # transaction so no lock is held for long. Returns deleted rows per model label,
+    # cascades included.
+    model = queryset.model
+    deleted = Counter()
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            _, per_model = model.objects.filter(pk__in=ids).delete()
+        deleted.update(per_model)
+        if pause:
+            time.sleep(pause)
+
+
+def purge_carts(days=30, batch_size=500, pause=0, now=None):
+    # Remove what carts leave behind:
+    #  - guest carts (and their lines) created more than `days` ago and none of
+    #    whose lines was touched since
+    #  - inactive lines not touched for `days`
+    #  - lines that belong to neither a user nor a cart
+    #  - expired sessions
+    # Returns the number of deleted rows per table.
+    now = now or timezone.now()
+    cutoff = now - timedelta(days=days)
+
+    deleted = Counter()
+    stale_carts = Cart.objects.filter(date_added__lt=cutoff.date()).exclude(cartitem__updated_at__gte=cutoff)
+    deleted.update(_delete_in_batches(stale_carts, batch_size, pause))
+    deleted.update(_delete_in_batches(CartItem.objects.filter(is_active=False, updated_at__lt=cutoff), batch_size, pause))
+    deleted.update(_delete_in_batches(CartItem.objects.filter(user__isnull=True, cart__isnull=True), batch_size, pause))
+    deleted.update(_delete_in_batches(Session.objects.filter(expire_date__lt=now), batch_size, pause))
+
+    labels = {model._meta.label: model._meta.db_table for model in (Cart, CartItem, CartItem.variations.through, Session)}
+    return {labels.get(label, label): count for label, count in deleted.items()}
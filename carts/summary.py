@@ -0,0 +1,77 @@
+from decimal import Decimal
+
+from .backends import get_cart_store
+from .guest import GuestCart
+
+TAX_PERCENT = 2
+
+
+def _to_rupees(paise):
+    return (Decimal(paise) / 100).quantize(Decimal('0.01'))
+
+
+class CartSummary:
+    # Cart lines plus totals. Amounts are kept in paise (integer minor units)
+    # and exposed in rupees as Decimals.
+    def __init__(self, items, total_paise=0, quantity=0):
+        self.items = items
+        self.quantity = quantity
+        self.total_paise = total_paise
+        self.tax_paise = (total_paise * TAX_PERCENT + 50) // 100  # rounded half up
+        self.grand_total_paise = self.total_paise + self.tax_paise
+
+    @property
+    def total(self):
+        return _to_rupees(self.total_paise)
+
+    @property
+    def tax(self):
+        return _to_rupees(self.tax_paise)
+
+    @property
+    def grand_total(self):
+        return _to_rupees(self.grand_total_paise)
+
+    def as_dict(self):
+        # JSON friendly version, amounts as strings so no precision is lost
+        return {
+            'lines': [
+                {
+                    'line_id': item.id,
+                    'product_id': item.product.id,
+                    'product_name': item.product.product_name,
+                    'url': item.product.get_url(),
+                    'variations': {v.variation_category: v.variation_value for v in item.variations.all()},
+                    'quantity': item.quantity,
+                    'sub_total': str(_to_rupees(item.sub_total() * 100)),
+                }
+                for item in self.items
+            ],
+            'quantity': self.quantity,
+            'total': str(self.total),
+            'tax': str(self.tax),
+            'grand_total': str(self.grand_total),
+        }
+
+
+def _guest_summary(request):
+    # Guest lines come from the cookie; totals are added up in Python
+    lines = GuestCart.from_request(request).get_lines()
+    total_paise = sum(line.quantity * line.product.price * 100 for line in lines)
+    quantity = sum(line.quantity for line in lines)
+    return CartSummary(lines, total_paise, quantity)
+
+
+def get_cart_summary(request):
+    # Lines and totals of the visitor's cart, memoized on the request
+    summary = getattr(request, '_cart_summary', None)
+    if summary is not None:
+        return summary
+
+    if not request.user.is_authenticated:
+        summary = _guest_summary(request)
+    else:
+        summary = CartSummary(*get_cart_store().contents(request.user))
+
+    request._cart_summary = summary
+    return summary
@@ -1,3 +1,545 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError, OperationalError, connection
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Account
+from category.models import Category
+from store.models import Product, Variation
+from . import backends
+from .backends import KVCartStore, LocalKV, ORMCartStore
+from .guest import GUEST_CART_COOKIE, GUEST_CART_MAX_LINES, GuestCart, GuestCartFull
+from .merge import merge_guest_cart
+from .models import Cart, CartItem
+from .mutations import MAX_LINE_QUANTITY, MAX_OPERATIONS
+from .purge import purge_carts
+from .summary import CartSummary, get_cart_summary
+from .utils import add_cart_line, get_cart_count, variation_signature
+
+
+def make_products(count):
+    category = Category.objects.create(category_name='Shirts', slug='shirts')
+    Product.objects.bulk_create(
+        Product(product_name=f'Product {i}', slug=f'product-{i}', price=100, stock=10, category=category,
+                product_images='photos/products/product.jpg')
+        for i in range(count)
+    )
+    return list(Product.objects.order_by('id'))
+
+
+def make_user(username='buyer'):
+    return Account.objects.create_user(
+        email=f'{username}@example.com', username=username, first_name='Test', last_name='User', password='secret',
+    )
+
+
+class MergeGuestCartTest(TestCase):
+    def setUp(self):
+        self.products = make_products(200)
+        self.user = make_user()
+
+    def fill_guest_cart(self, cart_id, products, quantity=1):
+        cart = Cart.objects.create(cart_id=cart_id)
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=p, quantity=quantity) for p in products)
+        return cart
+
+    def test_merges_matching_lines_and_moves_the_rest(self):
+        CartItem.objects.create(user=self.user, product=self.products[0], quantity=2)
+        self.fill_guest_cart('guest', self.products[:3], quantity=1)
+
+        self.assertEqual(merge_guest_cart('guest', self.user), 3)
+
+        quantities = dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {self.products[0].id: 3, self.products[1].id: 1, self.products[2].id: 1})
+        self.assertFalse(Cart.objects.filter(cart_id='guest').exists())
+        self.assertFalse(CartItem.objects.filter(cart__isnull=False).exists())
+
+    def test_lines_with_other_variations_are_not_merged(self):
+        product = self.products[0]
+        CartItem.objects.create(user=self.user, product=product, quantity=1, variation_signature=variation_signature([1]))
+        cart = self.fill_guest_cart('guest', [product])
+
+        merge_guest_cart('guest', self.user)
+
+        self.assertEqual(CartItem.objects.filter(user=self.user, product=product).count(), 2)
+        self.assertFalse(Cart.objects.filter(id=cart.id).exists())
+
+    def test_query_count_does_not_grow_with_the_cart(self):
+        def queries_for(size, cart_id):
+            user = make_user(cart_id)
+            CartItem.objects.bulk_create(CartItem(user=user, product=p, quantity=1) for p in self.products[:size // 2])
+            self.fill_guest_cart(cart_id, self.products[:size])
+            with CaptureQueriesContext(connection) as captured:
+                merge_guest_cart(cart_id, user)
+            self.assertEqual(CartItem.objects.filter(user=user).count(), size)
+            return len(captured.captured_queries)
+
+        self.assertEqual(queries_for(4, 'small'), queries_for(200, 'large'))
+
+    def test_second_login_with_the_same_cart_merges_nothing(self):
+        self.fill_guest_cart('guest', self.products[:3], quantity=2)
+
+        merge_guest_cart('guest', self.user)
+        self.assertEqual(merge_guest_cart('guest', self.user), 0)
+
+        self.assertEqual(list(CartItem.objects.filter(user=self.user).values_list('quantity', flat=True)), [2, 2, 2])
+
+    def test_missing_cart_is_a_no_op(self):
+        CartItem.objects.create(user=self.user, product=self.products[0], quantity=2)
+
+        self.assertEqual(merge_guest_cart('nobody', self.user), 0)
+
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(list(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity')), [(self.products[0].id, 2)])
+
+
+class ConcurrentMergeTest(TransactionTestCase):
+    # Row locks serialize the merges where the database has them; SQLite refuses
+    # the losing writer instead ("database is locked"), which then retries like a
+    # resubmitted login would
+    def test_concurrent_logins(self):
+        products = make_products(20)
+        user = make_user()
+        CartItem.objects.bulk_create(CartItem(user=user, product=p, quantity=1) for p in products[:10])
+        for cart_id in ('browser-a', 'browser-b'):
+            cart = Cart.objects.create(cart_id=cart_id)
+            CartItem.objects.bulk_create(CartItem(cart=cart, product=p, quantity=1) for p in products)
+
+        errors = []
+        barrier = threading.Barrier(4)
+
+        def login(cart_id):
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        merge_guest_cart(cart_id, user)
+                        return
+                    except OperationalError:
+                        time.sleep(0.01)
+                errors.append('gave up')
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        # Two browsers, each submitting the login form twice
+        threads = [threading.Thread(target=login, args=(cart_id,)) for cart_id in ('browser-a', 'browser-b') * 2]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        quantities = dict(CartItem.objects.filter(user=user).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {p.id: 3 if i < 10 else 2 for i, p in enumerate(products)})
+        self.assertFalse(Cart.objects.exists())
+
+
+def cart_lines(store, user):
+    # {(product id, variation ids): quantity} as the store reports it
+    lines, _, _ = store.contents(user)
+    return {(line.product.id, tuple(sorted(v.id for v in line.variations.all()))): line.quantity for line in lines}
+
+
+def cart_rows(user):
+    return {
+        (item.product_id, tuple(sorted(v.id for v in item.variations.all()))): item.quantity
+        for item in CartItem.objects.filter(user=user).prefetch_related('variations')
+    }
+
+
+class CartStoreTest(TestCase):
+    def setUp(self):
+        self.products = make_products(3)
+        self.sizes = Variation.objects.bulk_create(
+            Variation(product=self.products[0], variation_category='size', variation_value=value) for value in ('s', 'm')
+        )
+
+    def run_steps(self, store, user):
+        # The same cart changes on any backend; returns the cart after each step
+        first, second, third = [p.id for p in self.products]
+        small, medium = [v.id for v in self.sizes]
+        snapshots = []
+
+        def line_id(product_id, variation_ids):
+            lines, _, _ = store.contents(user)
+            return next(line.id for line in lines
+                        if line.product.id == product_id and sorted(v.id for v in line.variations.all()) == variation_ids)
+
+        store.add(user, first, [small])
+        store.add(user, first, [small])
+        store.add(user, first, [medium])
+        store.add(user, second, [], quantity=3)
+        snapshots.append(cart_lines(store, user))
+
+        store.remove(user, first, line_id(first, [small]))
+        store.set_quantity(user, second, [], 5)
+        store.set_quantity(user, third, [], 2)
+        snapshots.append(cart_lines(store, user))
+
+        store.delete(user, first, line_id(first, [medium]))
+        store.set_quantity(user, third, [], 0)
+        snapshots.append((cart_lines(store, user), store.count(user), store.contains_product(user, third)))
+
+        store.flush(user)
+        store.forget(user)
+        snapshots.append(cart_lines(store, user))
+
+        store.clear(user)
+        snapshots.append((cart_lines(store, user), store.count(user)))
+        return snapshots
+
+    def test_backends_behave_the_same(self):
+        orm = self.run_steps(ORMCartStore(), make_user('orm'))
+        kv = self.run_steps(KVCartStore(client=LocalKV()), make_user('kv'))
+
+        self.assertEqual(kv, orm)
+        first, second, third = [p.id for p in self.products]
+        small, medium = [v.id for v in self.sizes]
+        self.assertEqual(orm[0], {(first, (small,)): 2, (first, (medium,)): 1, (second, ()): 3})
+        self.assertEqual(orm[2], ({(first, (small,)): 1, (second, ()): 5}, 6, False))
+        self.assertEqual(orm[4], ({}, 0))
+
+    def test_flush_writes_the_kv_cart_behind(self):
+        user = make_user()
+        CartItem.objects.create(user=user, product=self.products[2], quantity=4)
+        store = KVCartStore(client=LocalKV())
+
+        store.add(user, self.products[0].id, [self.sizes[0].id], quantity=2)
+        store.set_quantity(user, self.products[2].id, [], 1)
+        self.assertEqual(cart_rows(user), {(self.products[2].id, ()): 4})  # nothing written yet
+
+        store.flush(user)
+        self.assertEqual(cart_rows(user), cart_lines(store, user))
+        self.assertEqual(cart_rows(user), {(self.products[0].id, (self.sizes[0].id,)): 2, (self.products[2].id, ()): 1})
+
+        store.set_quantity(user, self.products[0].id, [self.sizes[0].id], 0)
+        store.forget(user)
+        self.assertEqual(cart_rows(user), {(self.products[2].id, ()): 1})
+        with self.assertNumQueries(0):
+            store.flush(user)  # unchanged since the last flush
+
+    @override_settings(REDIS_URL=None)
+    def test_kv_store_needs_redis(self):
+        with self.assertRaises(ImproperlyConfigured):
+            KVCartStore()
+
+
+class BrokenKV(LocalKV):
+    # Loses the connection on the first batch write
+    def hset(self, key, field=None, value=None, mapping=None):
+        if mapping and len(mapping) > 1:
+            raise ConnectionError('connection lost')
+        return super().hset(key, field, value, mapping)
+
+
+class UpdateCartTest(TestCase):
+    def setUp(self):
+        cache.clear()  # variation maps cached for products of earlier tests with the same ids
+        self.products = make_products(GUEST_CART_MAX_LINES + 1)
+        self.small = Variation.objects.create(product=self.products[0], variation_category='size', variation_value='s')
+
+    def post(self, payload):
+        body = payload if isinstance(payload, str) else json.dumps(payload)
+        return self.client.post('/cart/update/', body, content_type='application/json')
+
+    def use_store(self, store):
+        previous, backends._store = backends._store, store
+        self.addCleanup(setattr, backends, '_store', previous)
+
+    def login(self):
+        user = make_user()
+        user.is_active = True
+        user.save()
+        self.client.force_login(user)
+        return user
+
+    def batch(self):
+        first, second = self.products[0].id, self.products[1].id
+        return {'operations': [
+            {'op': 'add', 'product_id': first, 'quantity': 2, 'variations': {'size': 's'}},
+            {'op': 'add', 'product_id': first, 'variations': {'size': 's'}},
+            {'op': 'remove', 'product_id': first, 'variations': {'size': 's'}},
+            {'op': 'set', 'product_id': second, 'quantity': 4},
+            {'op': 'add', 'product_id': self.products[2].id, 'quantity': MAX_LINE_QUANTITY},
+            {'op': 'add', 'product_id': self.products[2].id, 'quantity': 5},
+        ]}
+
+    def quantities(self, response):
+        return {(line['product_id'], tuple(line['variations'].items())): line['quantity'] for line in response.json()['lines']}
+
+    def expected(self):
+        return {
+            (self.products[0].id, (('size', 's'),)): 2,
+            (self.products[1].id, ()): 4,
+            (self.products[2].id, ()): MAX_LINE_QUANTITY,  # capped
+        }
+
+    def test_invalid_requests_are_refused(self):
+        product_id = self.products[0].id
+        for payload, error in (
+            ('not json', 'Invalid JSON.'),
+            ({'operations': []}, '"operations" must be a non-empty list.'),
+            ({'operations': [{'op': 'double', 'product_id': product_id}]}, '"op" must be one of'),
+            ({'operations': [{'op': 'add', 'product_id': 'x'}]}, 'must be integers'),
+            ({'operations': [{'op': 'add', 'product_id': product_id, 'quantity': 0}]}, 'between 1 and'),
+            ({'operations': [{'op': 'set', 'product_id': product_id, 'quantity': MAX_LINE_QUANTITY + 1}]}, 'between 0 and'),
+            ({'operations': [{'op': 'add', 'product_id': product_id, 'variations': ['red']}]}, '"variations" must be an object'),
+            ({'operations': [{'op': 'add', 'product_id': 999999}]}, 'Unknown or unavailable products: [999999]'),
+            ({'operations': [{'op': 'add', 'product_id': product_id}] * (MAX_OPERATIONS + 1)}, f'At most {MAX_OPERATIONS}'),
+        ):
+            response = self.post(payload)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn(error, response.json()['error'])
+        self.assertEqual(GuestCart.from_request(self.client.get('/cart/').wsgi_request).count(), 0)
+
+    def test_errors_while_applying_are_not_reported_as_bad_json(self):
+        payload = {'operations': [{'op': 'add', 'product_id': self.products[0].id}]}
+        with mock.patch('carts.views.apply_operations', side_effect=ValueError('bug')):
+            with self.assertRaises(ValueError):
+                self.post(payload)
+
+    def test_guest_batch(self):
+        response = self.post(self.batch())
+
+        self.assertEqual(self.quantities(response), self.expected())
+        self.assertEqual(response.json()['quantity'], 2 + 4 + MAX_LINE_QUANTITY)
+        self.assertIn('gkart_cart', response.cookies)
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.post({'operations': [{'op': 'set', 'product_id': self.products[1].id, 'quantity': 0}]})
+        self.assertNotIn((self.products[1].id, ()), self.quantities(response))
+
+    def test_guest_line_cap_refuses_the_whole_batch(self):
+        self.post({'operations': [{'op': 'add', 'product_id': p.id} for p in self.products[:GUEST_CART_MAX_LINES]]})
+
+        response = self.post({'operations': [
+            {'op': 'set', 'product_id': self.products[0].id, 'quantity': 3},
+            {'op': 'add', 'product_id': self.products[GUEST_CART_MAX_LINES].id},
+        ]})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(f'at most {GUEST_CART_MAX_LINES}', response.json()['error'])
+        cart = GuestCart.from_request(self.client.get('/cart/').wsgi_request)
+        self.assertEqual(cart.count(), GUEST_CART_MAX_LINES)  # the set wasn't applied either
+
+    def test_logged_in_batch_on_every_backend(self):
+        for store in (ORMCartStore(), KVCartStore(client=LocalKV())):
+            with self.subTest(store=store.name):
+                self.use_store(store)
+                user = self.login()
+
+                response = self.post(self.batch())
+
+                self.assertEqual(self.quantities(response), self.expected())
+                store.flush(user)
+                self.assertEqual(CartItem.objects.filter(user=user).count(), 3)
+                store.clear(user)
+                user.delete()
+
+    def test_kv_batch_is_all_or_nothing(self):
+        store = KVCartStore(client=BrokenKV())
+        user = make_user()
+        store.add(user, self.products[0].id, [])
+
+        with self.assertRaises(ConnectionError):
+            store.set_quantities(user, {(self.products[0].id, ()): 5, (self.products[1].id, ()): 1})
+
+        self.assertEqual(cart_lines(store, user), {(self.products[0].id, ()): 1})
+
+
+class GuestCartTest(TestCase):
+    def setUp(self):
+        self.products = make_products(GUEST_CART_MAX_LINES + 1)
+
+    def guest_cart(self):
+        return GuestCart.from_request(self.client.get('/cart/').wsgi_request)
+
+    def test_cart_lives_in_a_signed_cookie(self):
+        self.client.post(f'/cart/add_cart{self.products[0].id}/')
+        self.client.post(f'/cart/add_cart{self.products[0].id}/')
+
+        cookie = self.client.cookies[GUEST_CART_COOKIE]
+        self.assertTrue(cookie['httponly'])
+        self.assertTrue(cookie.value.startswith(f'{self.products[0].id}::2:'))  # value, then its signature
+        self.assertEqual(self.guest_cart().lines, {(self.products[0].id, ()): 2})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.post(f'/cart/add_cart{self.products[0].id}/')
+        signature = self.client.cookies[GUEST_CART_COOKIE].value.split(':', 3)[3]  # timestamp and signature
+        self.client.cookies[GUEST_CART_COOKIE] = f'{self.products[0].id}::100:{signature}'
+
+        self.assertEqual(self.guest_cart().lines, {})
+
+    def test_line_cap_is_reported(self):
+        cart = GuestCart()
+        for product in self.products[:GUEST_CART_MAX_LINES]:
+            cart.add(product.id, [])
+        cart.add(self.products[0].id, [])  # more of a line it already has is fine
+        with self.assertRaises(GuestCartFull):
+            cart.add(self.products[GUEST_CART_MAX_LINES].id, [])
+        with self.assertRaises(GuestCartFull):
+            cart.set(self.products[GUEST_CART_MAX_LINES].id, [], 1)
+        self.assertEqual(len(cart.lines), GUEST_CART_MAX_LINES)
+
+    def test_login_merge_is_set_based(self):
+        sizes = Variation.objects.bulk_create(
+            Variation(product=product, variation_category='size', variation_value='m') for product in self.products
+        )
+        first = (self.products[0].id, (sizes[0].id,))
+
+        def queries_for(username, count):
+            user = make_user(username)
+            add_cart_line(*first, 3, user=user)  # already in the user's cart
+            lines = {(product.id, (size.id,)): 2 for product, size in zip(self.products[:count], sizes)}
+            cart = GuestCart(dict(lines))
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as captured:
+                    cart.materialize(user)
+
+            self.assertEqual(cart.lines, {})
+            self.assertEqual(cart_rows(user), {**lines, first: 5})
+            return len(captured.captured_queries)
+
+        self.assertEqual(queries_for('small', 2), queries_for('large', GUEST_CART_MAX_LINES))
+
+    def test_failed_login_merge_can_be_retried(self):
+        user = make_user()
+        sizes = Variation.objects.bulk_create(
+            Variation(product=product, variation_category='size', variation_value='m') for product in self.products[:3]
+        )
+        lines = {(product.id, (size.id,)): 2 for product, size in zip(self.products, sizes)}
+        first = (self.products[0].id, (sizes[0].id,))
+        add_cart_line(*first, 1, user=user)
+        cart = GuestCart(dict(lines))
+
+        Through = CartItem.variations.through
+        with mock.patch.object(Through.objects, 'bulk_create', side_effect=DatabaseError('connection lost')):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(DatabaseError):
+                    cart.materialize(user)
+        self.assertEqual(cart.lines, lines)  # the cookie keeps its lines
+        self.assertEqual(cart_rows(user), {first: 1})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cart.materialize(user)
+        self.assertEqual(cart.lines, {})
+        self.assertEqual(cart_rows(user), {**lines, first: 3})  # added once
+
+    def test_add_cart_tells_the_guest_when_the_cart_is_full(self):
+        for product in self.products[:GUEST_CART_MAX_LINES]:
+            self.client.post(f'/cart/add_cart{product.id}/')
+
+        response = self.client.post(f'/cart/add_cart{self.products[GUEST_CART_MAX_LINES].id}/', follow=True)
+
+        self.assertContains(response, f'A cart holds at most {GUEST_CART_MAX_LINES} different items.')
+        self.assertEqual(len(self.guest_cart().lines), GUEST_CART_MAX_LINES)
+
+
+class PurgeCartsTest(TestCase):
+    def setUp(self):
+        self.product = make_products(1)[0]
+
+    def guest_cart(self, cart_id, days_old, touched_days_ago=None):
+        cart = Cart.objects.create(cart_id=cart_id)
+        Cart.objects.filter(id=cart.id).update(date_added=timezone.now().date() - timedelta(days=days_old))
+        if touched_days_ago is not None:
+            item = CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            CartItem.objects.filter(id=item.id).update(updated_at=timezone.now() - timedelta(days=touched_days_ago))
+        return cart
+
+    def test_old_carts_are_purged_unless_recently_touched(self):
+        self.guest_cart('abandoned', days_old=60, touched_days_ago=45)
+        self.guest_cart('empty', days_old=60)
+        kept = self.guest_cart('returning', days_old=60, touched_days_ago=2)
+        new = self.guest_cart('new', days_old=1)
+
+        deleted = purge_carts(days=30)
+
+        self.assertEqual(set(Cart.objects.values_list('id', flat=True)), {kept.id, new.id})
+        self.assertEqual(deleted['carts_cart'], 2)
+        self.assertEqual(deleted['carts_cartitem'], 1)
+        self.assertEqual(CartItem.objects.get().cart, kept)
+
+
+class CartBadgeTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.products = make_products(2)
+        self.user = make_user()
+        previous, backends._store = backends._store, ORMCartStore()
+        self.addCleanup(setattr, backends, '_store', previous)
+
+    def test_count_is_cached_until_the_cart_changes(self):
+        store = backends._store
+        self.assertEqual(get_cart_count(self.user), 0)
+        with self.assertNumQueries(0):
+            get_cart_count(self.user)
+
+        steps = [
+            (lambda: store.add(self.user, self.products[0].id, [], 2), 2),
+            (lambda: store.set_quantity(self.user, self.products[1].id, [], 3), 5),
+            (lambda: store.remove(self.user, self.products[1].id, CartItem.objects.get(product=self.products[1]).id), 4),
+            (lambda: store.delete(self.user, self.products[0].id, CartItem.objects.get(product=self.products[0]).id), 2),
+            (lambda: store.set_quantities(self.user, {(self.products[0].id, ()): 1}), 3),
+            (lambda: store.clear(self.user), 0),
+        ]
+        for change, expected in steps:
+            change()
+            self.assertEqual(get_cart_count(self.user), expected)
+
+    def test_badge_follows_the_cart(self):
+        self.user.is_active = True
+        self.user.save()
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get('/cart/').context['cart_count'], 0)
+
+        self.client.post(f'/cart/add_cart{self.products[0].id}/')
+
+        self.assertEqual(self.client.get('/cart/').context['cart_count'], 1)
+
+
+class CartSummaryTest(TestCase):
+    def test_tax_is_rounded_half_up_in_paise(self):
+        for total_paise, tax in [(0, '0.00'), (124, '0.02'), (125, '0.03'), (12345, '2.47'), (99999, '20.00')]:
+            with self.subTest(total_paise):
+                summary = CartSummary([], total_paise)
+                self.assertEqual(summary.tax, Decimal(tax))
+                self.assertEqual(summary.grand_total_paise, total_paise + summary.tax_paise)
+        self.assertEqual(CartSummary([], 12345).as_dict()['grand_total'], '125.92')
+
+    def test_totals_of_a_cart(self):
+        products = make_products(2)
+        Product.objects.filter(id=products[1].id).update(price=333)
+        user = make_user()
+        add_cart_line(products[0].id, [], 2, user=user)
+        add_cart_line(products[1].id, [], 3, user=user)
+
+        summary = CartSummary(*ORMCartStore().contents(user))
+
+        self.assertEqual((summary.quantity, summary.total, summary.tax, summary.grand_total),
+                         (5, Decimal('1199.00'), Decimal('23.98'), Decimal('1222.98')))
+
+    def test_summary_is_memoized_per_request(self):
+        make_products(1)
+        request = RequestFactory().get('/cart/')
+        request.user = make_user()
+
+        summary = get_cart_summary(request)
+        with self.assertNumQueries(0):
+            self.assertIs(get_cart_summary(request), summary)
+
+        other = RequestFactory().get('/cart/')
+        other.user = request.user
+        self.assertIsNot(get_cart_summary(other), summary)
@@ -0,0 +1,80 @@
+import hashlib
+
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import CartItem
+
+CART_COUNT_TIMEOUT = 60 * 30
+
+
+def _cart_count_key(user_id):
+    return f'carts:count:user:{user_id}'
+
+
+def get_cart_count(user):
+    # Total quantity in the user's cart: one SUM query, then cached.
+    # Guest carts live in a cookie and are counted from it (see carts.guest).
+    key = _cart_count_key(user.id)
+    count = cache.get(key)
+    if count is None:
+        count = CartItem.objects.filter(user=user).aggregate(total=Sum('quantity'))['total'] or 0
+        cache.set(key, count, CART_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_cart_count(request=None, user_id=None):
+    # Drop the cached badge count after the cart changed.
+    # Pass the request, or the user id when acting outside of it.
+    if request is not None and request.user.is_authenticated:
+        user_id = request.user.id
+    if user_id:
+        cache.delete(_cart_count_key(user_id))
+
+
+## Cart lines
+def variation_signature(variation_ids):
+    # Order-independent identity of a set of variations
+    ids = sorted({int(i) for i in variation_ids})
+    if not ids:
+        return ''
+    return hashlib.sha1(','.join(map(str, ids)).encode()).hexdigest()
+
+
+def add_cart_line(product_id, variation_ids, quantity=1, user=None, cart=None):
+    # Add quantity to the owner's line for this product + variations, creating it if needed.
+    # One indexed UPDATE when the line exists; the unique constraints make a racing
+    # insert fail so it falls back to the increment.
+    owner = {'user': user} if user is not None else {'cart': cart}
+    lookup = dict(owner, product_id=product_id, variation_signature=variation_signature(variation_ids))
+
+    if CartItem.objects.filter(**lookup).update(quantity=F('quantity') + quantity, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            cart_item = CartItem.objects.create(quantity=quantity, **lookup)
+            if variation_ids:
+                cart_item.variations.add(*variation_ids)
+    except IntegrityError:
+        CartItem.objects.filter(**lookup).update(quantity=F('quantity') + quantity, updated_at=timezone.now())
+
+
+def set_cart_line(product_id, variation_ids, quantity, user=None, cart=None):
+    # Set the quantity of the owner's line for this product + variations; 0 removes it
+    owner = {'user': user} if user is not None else {'cart': cart}
+    lookup = dict(owner, product_id=product_id, variation_signature=variation_signature(variation_ids))
+
+    if quantity <= 0:
+        CartItem.objects.filter(**lookup).delete()
+        return
+    if CartItem.objects.filter(**lookup).update(quantity=quantity, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            cart_item = CartItem.objects.create(quantity=quantity, **lookup)
+            if variation_ids:
+                cart_item.variations.add(*variation_ids)
+    except IntegrityError:
+        CartItem.objects.filter(**lookup).update(quantity=quantity, updated_at=timezone.now())
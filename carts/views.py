@@ -1,209 +1,98 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from store.models import Product, Variation
-from .models import Cart, CartItem
-from django.http import HttpResponse
-from django.core.exceptions import ObjectDoesNotExist
+from django.shortcuts import render, redirect
+from django.contrib import messages
+from store.models import Product
+from store.variations import resolve_variations
+from .backends import get_cart_store
+from .guest import GuestCart, GuestCartFull
+from django.http import HttpResponse, JsonResponse
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+from .mutations import CartMutationError, apply_operations, parse_operations
+from .summary import get_cart_summary
+import json
+import uuid
 
 # Create your views here.
 
-def _cart_id(request):
-    cart = request.session.session_key
-    if not cart:
-        cart = request.session.create() # create the cart id present in the session id
-    return cart
-
 def add_cart(request, product_id):
     current_user = request.user
     product = Product.objects.get(id=product_id) #get the product
+    product_variation = []
+    if request.method == 'POST':
+        product_variation = resolve_variations(product.id, request.POST)
+
     # If the user is authenticated
     if current_user.is_authenticated:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
-
-
-        is_cart_item_exists = CartItem.objects.filter(product=product, user=current_user).exists()
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, user=current_user)
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-
-            if product_variation in ex_var_list:
-                # increase the cart item quantity
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, user=current_user)
-                if len(product_variation) > 0:
-                    item.variations.clear()
-                    item.variations.add(*product_variation)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                user = current_user,
-            )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-        return redirect('cart')
-    # If the user is not authenticated
+        get_cart_store().add(current_user, product.id, product_variation)
+    # If the user is not authenticated, the cart lives in a cookie until login
     else:
-        product_variation = []
-        if request.method == 'POST':
-            for item in request.POST:
-                key = item
-                value = request.POST[key]
-
-                try:
-                    variation = Variation.objects.get(product=product, variation_category__iexact=key, variation_value__iexact=value)
-                    product_variation.append(variation)
-                except:
-                    pass
-
-
         try:
-            cart = Cart.objects.get(cart_id=_cart_id(request)) # get the cart using the cart_id present in the session
-        except Cart.DoesNotExist:
-            cart = Cart.objects.create(
-                cart_id = _cart_id(request)
-            )
-        cart.save()
+            GuestCart.from_request(request).add(product.id, product_variation)
+        except GuestCartFull as e:
+            messages.error(request, f'{e} Please log in to add more.')
 
-        is_cart_item_exists = CartItem.objects.filter(product=product, cart=cart).exists()
-        if is_cart_item_exists:
-            cart_item = CartItem.objects.filter(product=product, cart=cart)
-            ex_var_list = []
-            id = []
-            for item in cart_item:
-                existing_variation = item.variations.all()
-                ex_var_list.append(list(existing_variation))
-                id.append(item.id)
-
-            if product_variation in ex_var_list:
-                # increase the cart item quantity
-                index = ex_var_list.index(product_variation)
-                item_id = id[index]
-                item = CartItem.objects.get(product=product, id=item_id)
-                item.quantity += 1
-                item.save()
-
-            else:
-                item = CartItem.objects.create(product=product, quantity=1, cart=cart)
-                if len(product_variation) > 0:
-                    item.variations.clear()
-                    item.variations.add(*product_variation)
-                item.save()
-        else:
-            cart_item = CartItem.objects.create(
-                product = product,
-                quantity = 1,
-                cart = cart,
-            )
-            if len(product_variation) > 0:
-                cart_item.variations.clear()
-                cart_item.variations.add(*product_variation)
-            cart_item.save()
-        return redirect('cart')
+    return redirect('cart')
 
 def remove_cart(request, product_id, cart_item_id):
-    product = get_object_or_404(Product, id=product_id)
-    try:
-        if request.user.is_authenticated:
-            cart_item = CartItem.objects.get(product=product, user=request.user, id=cart_item_id)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-            cart_item = CartItem.objects.get(cart=cart, product=product, id=cart_item_id)
-        if cart_item.quantity > 1:
-            cart_item.quantity -= 1
-            cart_item.save()
-        else:
-            cart_item.delete()
-    except:
-        pass
-    
+    if request.user.is_authenticated:
+        get_cart_store().remove(request.user, product_id, cart_item_id)
+    else:
+        GuestCart.from_request(request).remove(cart_item_id)
     return redirect('cart')
 
 def remove_cart_item(request, product_id, cart_item_id):
-    product = get_object_or_404(Product, id=product_id)
     if request.user.is_authenticated:
-        cart_item = CartItem.objects.get(product=product, user=request.user, id=cart_item_id)
+        get_cart_store().delete(request.user, product_id, cart_item_id)
     else:
-        cart = Cart.objects.get(cart_id=_cart_id(request))
-        cart_item = CartItem.objects.get(cart=cart, product=product, id=cart_item_id)
-    cart_item.delete()
+        GuestCart.from_request(request).delete(cart_item_id)
     return redirect('cart')
 
-def cart(request, total_price=0, total_quantity=0, cart_items=None):
+@require_POST
+def update_cart(request):
+    # Apply a batch of cart changes sent as JSON and return the new cart, e.g.
+    # {"operations": [{"op": "set", "product_id": 3, "quantity": 5, "variations": {"color": "red"}}]}
+    try:
+        payload = json.loads(request.body or b'null')
+    except ValueError:
+        return JsonResponse({"error": "Invalid JSON."}, status=400)
     try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-        for item in cart_items:
-            total_price += (item.product.price * item.quantity)
-            total_quantity += item.quantity
+        summary = apply_operations(request, parse_operations(payload))
+    except CartMutationError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    return JsonResponse(summary.as_dict())
 
-        tax = (2 * total_price) / 100
-        grand_total = total_price + tax
-    except ObjectDoesNotExist:
-        pass
+def cart(request):
+    summary = get_cart_summary(request)
 
     context = {
-        "total_price": total_price,
-        "total_quantity": total_quantity,
-        "cart_items": cart_items,
-        "tax": tax,
-        "grand_total": grand_total
+        "total_price": summary.total,
+        "total_quantity": summary.quantity,
+        "cart_items": summary.items,
+        "tax": summary.tax,
+        "grand_total": summary.grand_total
     }
 
     return render(request, 'store/cart.html', context)
 
 @login_required(login_url='login')
-def checkout(request, total=0, quantity=0, cart_items=None):
-    try:
-        tax = 0
-        grand_total = 0
-        if request.user.is_authenticated:
-            cart_items = CartItem.objects.filter(user=request.user, is_active=True)
-        else:
-            cart = Cart.objects.get(cart_id=_cart_id(request))
-            cart_items = CartItem.objects.filter(cart=cart, is_active=True)
-        for cart_item in cart_items:
-            total += (cart_item.product.price * cart_item.quantity)
-            quantity += cart_item.quantity
-        tax = (2 * total)/100
-        grand_total = total + tax
-    except ObjectDoesNotExist:
-        pass #just ignore
+def checkout(request):
+    ## Write the cart to CartItem for the order, with lines added as a guest in another tab after login
+    cart_store = get_cart_store()
+    guest_cart = GuestCart.from_request(request)
+    if guest_cart.count():
+        cart_store.forget(request.user)
+        guest_cart.materialize(request.user)
+    else:
+        cart_store.flush(request.user)
+
+    summary = get_cart_summary(request)
 
     context = {
-        'total': total,
-        'quantity': quantity,
-        'cart_items': cart_items,
-        'tax'       : tax,
-        'grand_total': grand_total,
+        'total': summary.total,
+        'quantity': summary.quantity,
+        'cart_items': summary.items,
+        'tax'       : summary.tax,
+        'grand_total': summary.grand_total,
+        'idempotency_key': uuid.uuid4().hex,  # place_order runs once per rendered form
     }
     return render(request, 'store/checkout.html', context)
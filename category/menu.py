@@ -0,0 +1,24 @@
+from django.db import transaction
+
+from core.cache import bump_version, get_version
+from .models import Category
+
+MENU_NAMESPACE = 'category:menu'
+
+# (version, categories) of this process
+_menu = (None, [])
+
+
+def get_menu_links():
+    # Categories for the navbar/sidebar, reloaded only when the shared version changes
+    global _menu
+    version = get_version(MENU_NAMESPACE)
+    cached_version, links = _menu
+    if cached_version != version:
+        links = list(Category.objects.all())
+        _menu = (version, links)
+    return links
+
+
+def invalidate_menu():
+    transaction.on_commit(lambda: bump_version(MENU_NAMESPACE))
@@ -1,3 +1,52 @@
+from django.core.cache import cache
 from django.test import TestCase
 
-# Create your tests here.
+from core.cache import get_version
+from . import menu
+from .menu import MENU_NAMESPACE, get_menu_links
+from .models import Category
+
+
+class MenuTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        previous, menu._menu = menu._menu, (None, [])
+        self.addCleanup(setattr, menu, '_menu', previous)
+        self.shirts = Category.objects.create(category_name='Shirts', slug='shirts')
+
+    def names(self):
+        return [category.category_name for category in get_menu_links()]
+
+    def test_links_are_kept_until_the_version_changes(self):
+        self.assertEqual(self.names(), ['Shirts'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Shirts'])
+
+    def test_category_changes_bump_the_version(self):
+        self.names()
+
+        version = get_version(MENU_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            Category.objects.create(category_name='Shoes', slug='shoes')
+        self.assertNotEqual(get_version(MENU_NAMESPACE), version)
+        self.assertEqual(sorted(self.names()), ['Shirts', 'Shoes'])
+
+        version = get_version(MENU_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.category_name = 'Tops'
+            self.shirts.save()
+        self.assertNotEqual(get_version(MENU_NAMESPACE), version)
+        self.assertEqual(sorted(self.names()), ['Shoes', 'Tops'])
+
+        version = get_version(MENU_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirts.delete()
+        self.assertNotEqual(get_version(MENU_NAMESPACE), version)
+        self.assertEqual(self.names(), ['Shoes'])
+
+    def test_version_is_bumped_only_on_commit(self):
+        version = get_version(MENU_NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            Category.objects.create(category_name='Shoes', slug='shoes')
+        self.assertEqual(get_version(MENU_NAMESPACE), version)
+        self.assertTrue(callbacks)
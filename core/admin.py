@@ -1,3 +1,26 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import IdempotencyKey, OutboxEmail
+
+
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    list_per_page = 20
+
+
+admin.site.register(OutboxEmail, OutboxEmailAdmin)
+
+
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'key', 'status_code', 'locked_until', 'created_at')
+    list_filter = ('scope', 'status_code')
+    search_fields = ('key',)
+    readonly_fields = ('created_at',)
+    list_per_page = 20
+
+
+admin.site.register(IdempotencyKey, IdempotencyKeyAdmin)
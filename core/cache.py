@@ -0,0 +1,26 @@
+import uuid
+
+from django.core.cache import cache
+
+
+## Versioned cache namespaces
+# A namespace version lives in the shared cache backend. Keys built with
+# versioned_key() change when the version is bumped, so every worker stops
+# using the old entries at once without having to know their keys.
+def get_version(namespace):
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    version = uuid.uuid4().hex
+    cache.set(f'version:{namespace}', version, None)
+    return version
+
+
+def versioned_key(namespace, *parts):
+    return ':'.join([namespace, get_version(namespace), *map(str, parts)])
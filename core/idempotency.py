@@ -0,0 +1,117 @@
+import hashlib
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+POLL_SECONDS = 0.05
+NOT_REPLAYED = {'content-type', 'content-length'}  # set by the replayed response itself
+
+
+def header_key(request):
+    return request.headers.get('Idempotency-Key')
+
+
+def _headers(response):
+    headers = [[name, value] for name, value in response.items() if name.lower() not in NOT_REPLAYED]
+    headers += [['Set-Cookie', morsel.OutputString()] for morsel in response.cookies.values()]
+    return headers
+
+
+def _replay(record):
+    response = HttpResponse(record.body, status=record.status_code, content_type=record.content_type)
+    for name, value in record.headers:
+        if name == 'Set-Cookie':
+            response.cookies.load(value)
+        else:
+            response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _acquire(scope, key, request_hash, lock_seconds):
+    # Returns (record, owned). Owned means this request runs the view: the key is new,
+    # or the request that took it died without finishing and its lock ran out.
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(
+                scope=scope, key=key, request_hash=request_hash, locked_until=now + timedelta(seconds=lock_seconds),
+            ), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+    if record is None:  # the first request failed and gave the key back meanwhile
+        return _acquire(scope, key, request_hash, lock_seconds)
+    taken = IdempotencyKey.objects.filter(
+        id=record.id, status_code__isnull=True, locked_until__lt=now,
+    ).update(locked_until=now + timedelta(seconds=lock_seconds))
+    return record, bool(taken)
+
+
+def idempotent(scope, get_key=header_key):
+    # Run the view once per (user, key): the first successful response (or redirect) is
+    # stored with its headers and cookies and replayed for every duplicate. A duplicate
+    # arriving while the first request is still running waits up to IDEMPOTENCY_WAIT_SECONDS
+    # for its response instead of doing the work again, then gets a 409.
+    # get_key(request) returns the client's key; requests without one aren't deduplicated.
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'POST':
+                return view(request, *args, **kwargs)
+            request_hash = hashlib.sha256(request.body).hexdigest()  # read before the view consumes the stream
+            raw_key = get_key(request)
+            if not raw_key:
+                return view(request, *args, **kwargs)
+
+            key = f'{request.user.pk or "anon"}:{str(raw_key)[:200]}'
+            lock_seconds = settings.IDEMPOTENCY_LOCK_SECONDS
+            deadline = time.monotonic() + min(settings.IDEMPOTENCY_WAIT_SECONDS, lock_seconds)
+
+            record, owned = _acquire(scope, key, request_hash, lock_seconds)
+            while not owned:
+                if record.request_hash != request_hash:
+                    return JsonResponse({'error': 'This idempotency key was used for a different request.'}, status=422)
+                if record.status_code is not None:
+                    return _replay(record)
+                if time.monotonic() > deadline:
+                    return JsonResponse({'error': 'A request with this idempotency key is still being processed.'}, status=409)
+                time.sleep(POLL_SECONDS)
+                record, owned = _acquire(scope, key, request_hash, lock_seconds)
+
+            try:
+                response = view(request, *args, **kwargs)
+            except Exception:
+                IdempotencyKey.objects.filter(id=record.id).delete()  # let a retry run it again
+                raise
+
+            if 200 <= response.status_code < 400 and not response.streaming:
+                IdempotencyKey.objects.filter(id=record.id).update(
+                    request_hash=request_hash,
+                    status_code=response.status_code,
+                    content_type=response.get('Content-Type', ''),
+                    headers=_headers(response),
+                    body=response.content.decode(response.charset),
+                    locked_until=None,
+                )
+            else:
+                # Errors aren't kept: the request may succeed when retried
+                IdempotencyKey.objects.filter(id=record.id).delete()
+            return response
+        return wrapper
+    return decorator
+
+
+def purge_idempotency_keys(hours=24):
+    # Keys older than this are forgotten; returns the number deleted
+    cutoff = timezone.now() - timedelta(hours=hours)
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
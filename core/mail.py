@@ -0,0 +1,112 @@
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+logger = logging.getLogger('core')
+
+MAX_ATTEMPTS = 6
+BACKOFF_SECONDS = 60          # 1, 2, 4, 8, 16 minutes between attempts
+MAX_BACKOFF_SECONDS = 60 * 60
+CLAIM_SECONDS = 5 * 60        # how long a worker owns the emails it picked
+
+
+def queue_email(subject, body, to, from_email=None):
+    # Store the email in the outbox instead of talking to SMTP in the request.
+    # Inside a transaction it's only sent if that transaction commits.
+    return OutboxEmail.objects.create(
+        subject=subject,
+        body=body,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(to),
+        next_attempt_at=timezone.now(),
+    )
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def _due_ids(batch_size, now):
+    due = OutboxEmail.objects.filter(status=OutboxEmail.PENDING, next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+    if db_connection.features.has_select_for_update_skip_locked:
+        due = due.select_for_update(skip_locked=True)  # spreads the rows over the workers
+    return list(due.values_list('id', flat=True)[:batch_size])
+
+
+def _take(ids, now):
+    # The conditional UPDATE does the claiming: of two workers that picked the same
+    # rows, each row goes to only one of them. Returns the emails this worker got.
+    token = uuid.uuid4().hex
+    OutboxEmail.objects.filter(id__in=ids, status=OutboxEmail.PENDING, next_attempt_at__lte=now).update(
+        next_attempt_at=now + timedelta(seconds=CLAIM_SECONDS), claimed_by=token,
+    )
+    return list(OutboxEmail.objects.filter(id__in=ids, claimed_by=token).order_by('next_attempt_at', 'id'))
+
+
+def _claim(batch_size, now):
+    # Pick due emails and push their next attempt out, so a second worker running
+    # at the same time leaves them alone
+    with transaction.atomic():
+        return _take(_due_ids(batch_size, now), now)
+
+
+def _attempt_failed(email, error, retried, failed):
+    email.last_error = f'{error.__class__.__name__}: {error}'
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = OutboxEmail.FAILED
+        failed.append(email)
+        logger.error('Giving up on email %s after %s attempts: %s', email.id, email.attempts, email.last_error)
+    else:
+        email.next_attempt_at = timezone.now() + backoff(email.attempts)
+        retried.append(email)
+
+
+def send_outbox(batch_size=50, connection=None):
+    # Send one batch of due emails over a single SMTP connection. A connection
+    # passed in is opened if needed and left open, so a worker can reuse it.
+    # Failed emails are retried with exponential backoff and given up after MAX_ATTEMPTS;
+    # when the connection can't be opened, that counts as an attempt for the whole batch.
+    # Returns (sent, retried, failed).
+    now = timezone.now()
+    emails = _claim(batch_size, now)
+    if not emails:
+        return 0, 0, 0
+
+    own_connection = connection is None
+    connection = connection or get_connection()
+    sent, retried, failed = [], [], []
+    try:
+        try:
+            connection.open()
+        except Exception as e:
+            logger.warning('Could not connect to send %s emails: %s', len(emails), e)
+            for email in emails:
+                email.attempts += 1
+                _attempt_failed(email, e, retried, failed)
+            return 0, len(retried), len(failed)
+
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            email.attempts += 1
+            try:
+                message.send()
+            except Exception as e:
+                _attempt_failed(email, e, retried, failed)
+            else:
+                email.status = OutboxEmail.SENT
+                email.sent_at = timezone.now()
+                sent.append(email)
+    finally:
+        if own_connection:
+            connection.close()
+        # Emails not reached because of an unexpected error keep their claim and
+        # are picked up again once it runs out
+        OutboxEmail.objects.bulk_update(sent + retried + failed, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return len(sent), len(retried), len(failed)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.idempotency import purge_idempotency_keys
+
+
+class Command(BaseCommand):
+    help = "Delete stored idempotency keys (and their responses) older than --hours."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24)
+
+    def handle(self, *args, **options):
+        deleted = purge_idempotency_keys(options['hours'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} idempotency keys."))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from core.mail import send_outbox
+
+
+class Command(BaseCommand):
+    help = "Send the emails waiting in the outbox, in batches over one SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--loop', action='store_true', help="Keep running and poll the outbox.")
+        parser.add_argument('--interval', type=float, default=5, help="Seconds to wait when the outbox is empty (with --loop).")
+
+    def handle(self, *args, **options):
+        connection = get_connection()
+        totals = [0, 0, 0]
+        try:
+            while True:
+                try:
+                    sent, retried, failed = send_outbox(options['batch_size'], connection=connection)
+                except Exception as e:  # SMTP server down: drop the connection and try again later
+                    self.stderr.write(f"Could not send: {e}")
+                    connection.close()
+                    sent = retried = failed = 0
+                    if not options['loop']:
+                        raise
+                else:
+                    if retried or failed:
+                        connection.close()  # reconnect for the next batch
+                totals = [totals[0] + sent, totals[1] + retried, totals[2] + failed]
+
+                if sent or retried or failed:
+                    continue  # more may be due right away
+                if not options['loop']:
+                    break
+                connection.close()  # don't hold the SMTP connection while idle
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {totals[0]} emails, {totals[1]} to retry, {totals[2]} failed."))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_idempotencykey_headers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='claimed_by',
+            field=models.CharField(blank=True, max_length=32),
+        ),
+    ]
@@ -0,0 +1,170 @@
+import datetime
+
+from django.core import signing
+from django.db.models import Q
+
+CURSOR_SALT = 'core.pagination.cursor'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, has_previous, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    # Cursor (seek) pagination: every page is "WHERE key < last seen key ORDER BY key LIMIT n",
+    # so page 1000 costs the same as page 1 and no COUNT is needed.
+    # ordering: field names with an optional "-" prefix, the last one must be unique (e.g. "-id").
+    def __init__(self, queryset, per_page, ordering=('-id',)):
+        self.queryset = queryset
+        self.model = queryset.model if queryset is not None else None
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    ## Cursors
+    def _encode(self, direction, obj):
+        values = []
+        for name in self.fields:
+            value = getattr(obj, name)
+            if isinstance(value, (datetime.date, datetime.datetime)):
+                value = value.isoformat()
+            values.append(value)
+        return signing.dumps({'d': direction, 'v': values}, salt=CURSOR_SALT, compress=True)
+
+    def _decode(self, cursor):
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            direction, values = data['d'], data['v']
+        except (signing.BadSignature, KeyError, TypeError):
+            raise InvalidCursor(cursor)
+        if direction not in ('next', 'prev') or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        model = self.model
+        try:
+            values = [model._meta.get_field(name).to_python(value) for name, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+        return direction, values
+
+    ## Seeking
+    def _seek_filter(self, values, reverse):
+        # (a, b) after (x, y)  ==  a > x OR (a = x AND b > y), per field direction
+        condition = Q()
+        for i, name in enumerate(self.ordering):
+            field = self.fields[i]
+            descending = name.startswith('-') != reverse
+            lookup = f'{field}__lt' if descending else f'{field}__gt'
+            step = Q(**{lookup: values[i]})
+            for previous_field, previous_value in zip(self.fields[:i], values[:i]):
+                step &= Q(**{previous_field: previous_value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = self._decode(cursor)
+            except InvalidCursor:
+                direction, values = 'next', None  # fall back to the first page
+
+        reverse = direction == 'prev'
+        queryset = self.queryset.order_by(*(self._reversed_ordering() if reverse else self.ordering))
+        if values is not None:
+            queryset = queryset.filter(self._seek_filter(values, reverse))
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, values is not None
+
+        next_cursor = self._encode('next', rows[-1]) if has_next and rows else None
+        previous_cursor = self._encode('prev', rows[0]) if has_previous and rows else None
+        return KeysetPage(
+            rows,
+            has_next=next_cursor is not None,
+            has_previous=previous_cursor is not None,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
+
+
+class KeysetListPaginator(KeysetPaginator):
+    # The same cursors over rows already in memory (objects with the ordering fields
+    # as attributes), for result sets computed outside the database such as the
+    # facet index. model converts the cursor values back (e.g. Product).
+    def __init__(self, rows, per_page, ordering=('-id',), model=None):
+        super().__init__(None, per_page, ordering)
+        self.rows = rows
+        self.model = model
+
+    def _key(self, row):
+        return [getattr(row, name) for name in self.fields]
+
+    def _after(self, values, other):
+        # Whether values come after other in the ordering
+        for name, value, other_value in zip(self.ordering, values, other):
+            if value != other_value:
+                return value < other_value if name.startswith('-') else value > other_value
+        return False
+
+    def get_page(self, cursor=None):
+        direction, values = 'next', None
+        if cursor:
+            try:
+                direction, values = self._decode(cursor)
+            except InvalidCursor:
+                direction, values = 'next', None
+
+        rows = list(self.rows)
+        for name in reversed(self.ordering):  # stable sorts, least significant field first
+            rows.sort(key=lambda row: getattr(row, name.lstrip('-')), reverse=name.startswith('-'))
+
+        if direction == 'prev':
+            before = [row for row in rows if self._after(values, self._key(row))]
+            page = before[-(self.per_page + 1):]
+            has_next, has_previous = True, len(page) > self.per_page
+            page = page[-self.per_page:]
+        else:
+            after = [row for row in rows if values is None or self._after(self._key(row), values)]
+            page = after[:self.per_page + 1]
+            has_next, has_previous = len(page) > self.per_page, values is not None
+            page = page[:self.per_page]
+
+        next_cursor = self._encode('next', page[-1]) if has_next and page else None
+        previous_cursor = self._encode('prev', page[0]) if has_previous and page else None
+        return KeysetPage(
+            page,
+            has_next=next_cursor is not None,
+            has_previous=previous_cursor is not None,
+            next_cursor=next_cursor,
+            previous_cursor=previous_cursor,
+        )
@@ -1,3 +1,238 @@
-from django.test import TestCase
+import hashlib
+import threading
+import time
+from datetime import timedelta
 
-# Create your tests here.
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend
+from django.db import connection, transaction
+from django.contrib.auth.models import AnonymousUser
+from django.http import HttpResponseRedirect, JsonResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .idempotency import idempotent
+from .mail import MAX_ATTEMPTS, _due_ids, _take, queue_email, send_outbox
+from .pagination import KeysetListPaginator, KeysetPaginator
+from .models import IdempotencyKey, OutboxEmail
+
+
+class CountingBackend(EmailBackend):
+    opened = 0
+
+    def open(self):
+        CountingBackend.opened += 1
+        return True
+
+
+class FailingBackend(EmailBackend):
+    def send_messages(self, messages):
+        raise ConnectionRefusedError('SMTP server down')
+
+
+class UnreachableBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError('SMTP host unreachable')
+
+
+class OutboxTest(TestCase):
+    def test_queued_emails_are_sent_over_one_connection(self):
+        for i in range(3):
+            queue_email(f'Order {i}', 'Thanks', ['buyer@example.com'])
+        self.assertEqual(len(mail.outbox), 0)
+
+        CountingBackend.opened = 0
+        self.assertEqual(send_outbox(connection=CountingBackend()), (3, 0, 0))
+
+        self.assertEqual([message.subject for message in mail.outbox], ['Order 0', 'Order 1', 'Order 2'])
+        self.assertEqual(CountingBackend.opened, 1)
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.SENT).count(), 3)
+        self.assertEqual(send_outbox(), (0, 0, 0))
+
+    def test_email_of_a_rolled_back_transaction_is_never_sent(self):
+        try:
+            with transaction.atomic():
+                queue_email('Order', 'Thanks', ['buyer@example.com'])
+                raise ValueError('payment failed')
+        except ValueError:
+            pass
+        self.assertFalse(OutboxEmail.objects.exists())
+
+    def test_failures_are_retried_with_backoff_then_given_up(self):
+        email = queue_email('Order', 'Thanks', ['buyer@example.com'])
+
+        self.assertEqual(send_outbox(connection=FailingBackend()), (0, 1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=30))
+        self.assertIn('SMTP server down', email.last_error)
+        self.assertEqual(send_outbox(connection=FailingBackend()), (0, 0, 0))  # not due yet
+
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            send_outbox(connection=FailingBackend())
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboxEmail.FAILED, MAX_ATTEMPTS))
+
+    def test_unreachable_server_counts_as_an_attempt(self):
+        emails = [queue_email(f'Order {i}', 'Thanks', ['buyer@example.com']) for i in range(2)]
+
+        self.assertEqual(send_outbox(connection=UnreachableBackend()), (0, 2, 0))
+        for email in emails:
+            email.refresh_from_db()
+            self.assertEqual((email.status, email.attempts), (OutboxEmail.PENDING, 1))
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=30))
+            self.assertIn('SMTP host unreachable', email.last_error)
+        self.assertEqual(send_outbox(connection=UnreachableBackend()), (0, 0, 0))  # backing off
+
+        for attempt in range(2, MAX_ATTEMPTS + 1):
+            OutboxEmail.objects.update(next_attempt_at=timezone.now())
+            send_outbox(connection=UnreachableBackend())
+        self.assertEqual(OutboxEmail.objects.filter(status=OutboxEmail.FAILED, attempts=MAX_ATTEMPTS).count(), 2)
+
+    def test_rows_picked_by_two_workers_are_claimed_once(self):
+        for i in range(3):
+            queue_email(f'Order {i}', 'Thanks', ['buyer@example.com'])
+        now = timezone.now()
+        picked_by_a = _due_ids(10, now)
+        picked_by_b = _due_ids(10, now)  # no row locks to skip, e.g. on SQLite
+
+        self.assertEqual(len(_take(picked_by_a, now)), 3)
+        self.assertEqual(_take(picked_by_b, now), [])
+
+
+def charge_view(calls, delay=0, status=200):
+    @idempotent('charge')
+    def view(request):
+        calls.append(request.body)
+        time.sleep(delay)
+        return JsonResponse({'charge': len(calls)}, status=status)
+    return view
+
+
+def post(body, key='key-1'):
+    request = RequestFactory().post('/charge/', body, content_type='application/json', HTTP_IDEMPOTENCY_KEY=key)
+    request.user = AnonymousUser()
+    return request
+
+
+class IdempotencyTest(TestCase):
+    def test_duplicates_replay_the_first_response(self):
+        calls = []
+        view = charge_view(calls)
+
+        first = view(post('{"amount": 1}'))
+        second = view(post('{"amount": 1}'))
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(view(post('{"amount": 1}', key='key-2')).status_code, 200)
+        self.assertEqual(len(calls), 2)
+
+    def test_failed_requests_can_be_retried(self):
+        calls = []
+        charge_view(calls, status=500)(post('{"amount": 1}'))
+        self.assertFalse(IdempotencyKey.objects.exists())
+        charge_view(calls)(post('{"amount": 1}'))
+        self.assertEqual(len(calls), 2)
+
+    def test_key_reused_for_another_request_is_refused(self):
+        view = charge_view([])
+        view(post('{"amount": 1}'))
+        self.assertEqual(view(post('{"amount": 2}')).status_code, 422)
+
+    def test_redirect_is_replayed_with_its_headers_and_cookies(self):
+        @idempotent('checkout')
+        def view(request):
+            response = HttpResponseRedirect('/orders/done/')
+            response['Cache-Control'] = 'no-store'
+            response.set_cookie('receipt', 'r-1', httponly=True, samesite='Lax')
+            return response
+
+        view(post('{}'))
+        replayed = view(post('{}'))
+
+        self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+        self.assertEqual((replayed.status_code, replayed['Location'], replayed['Cache-Control']), (302, '/orders/done/', 'no-store'))
+        cookie = replayed.cookies['receipt']
+        self.assertEqual((cookie.value, cookie['httponly'], cookie['samesite']), ('r-1', True, 'Lax'))
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0.2)
+    def test_duplicate_waits_briefly_for_a_running_request(self):
+        IdempotencyKey.objects.create(scope='charge', key='anon:key-1', request_hash=hashlib.sha256(b'{"amount": 1}').hexdigest(),
+                                      locked_until=timezone.now() + timedelta(seconds=30))  # still running elsewhere
+        started = time.monotonic()
+
+        response = charge_view([])(post('{"amount": 1}'))
+
+        self.assertEqual(response.status_code, 409)
+        self.assertLess(time.monotonic() - started, 1)
+
+
+class ConcurrentIdempotencyTest(TransactionTestCase):
+    def test_concurrent_duplicate_waits_for_the_first(self):
+        calls = []
+        view = charge_view(calls, delay=0.3)
+        responses = []
+
+        def send():
+            responses.append(view(post('{"amount": 1}')))
+            connection.close()
+
+        threads = [threading.Thread(target=send) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([response.content for response in responses], [b'{"charge": 1}'] * 2)
+
+
+class KeysetPaginatorTest(TestCase):
+    ordering = ('-created_at', '-id')
+
+    def setUp(self):
+        # Pairs of rows share created_at, so pages of 3 split inside a run of equal keys
+        now = timezone.now()
+        for i in range(7):
+            email = OutboxEmail.objects.create(subject=f'Email {i}', body='', next_attempt_at=now)
+            OutboxEmail.objects.filter(id=email.id).update(created_at=now - timedelta(minutes=i // 2))
+        self.expected = list(OutboxEmail.objects.order_by(*self.ordering).values_list('id', flat=True))
+
+    def paginators(self):
+        yield KeysetPaginator(OutboxEmail.objects.all(), 3, self.ordering)
+        yield KeysetListPaginator(list(OutboxEmail.objects.all()), 3, self.ordering, model=OutboxEmail)
+
+    def walk(self, paginator):
+        pages, page = [], paginator.get_page()
+        pages.append([email.id for email in page])
+        while page.has_next:
+            page = paginator.get_page(page.next_cursor)
+            pages.append([email.id for email in page])
+        return pages, page
+
+    def test_pages_forward_and_back(self):
+        for paginator in self.paginators():
+            with self.subTest(type(paginator).__name__):
+                pages, last = self.walk(paginator)
+                self.assertEqual(pages, [self.expected[0:3], self.expected[3:6], self.expected[6:]])
+                self.assertFalse(last.has_next)
+
+                back, page = [], last
+                while page.has_previous:
+                    page = paginator.get_page(page.previous_cursor)
+                    back.append([email.id for email in page])
+                self.assertEqual(back, pages[-2::-1])
+                self.assertTrue(page.has_next)
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        for paginator in self.paginators():
+            cursor = paginator.get_page().next_cursor
+            for bad in (cursor[:-1] + ('A' if cursor[-1] != 'A' else 'B'), 'garbage', 'e30:x:y'):
+                with self.subTest(type(paginator).__name__, cursor=bad):
+                    page = paginator.get_page(bad)
+                    self.assertEqual([email.id for email in page], self.expected[:3])
+                    self.assertFalse(page.has_previous)
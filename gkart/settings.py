@@ -69,6 +69,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'carts.middleware.GuestCartMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django_session_timeout.middleware.SessionTimeoutMiddleware',
@@ -158,6 +159,39 @@ else:
         }
     }
 
+# Cache Configuration
+# Shared between gunicorn workers when REDIS_URL is set, per-process otherwise
+REDIS_URL = config('REDIS_URL', default=None)
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'gkart',
+        }
+    }
+
+## Product search backend: auto, sqlite_fts5, postgres or inverted_index
+SEARCH_BACKEND = config('SEARCH_BACKEND', default='auto')
+
+# Storage of logged in users' carts: "orm" (CartItem rows) or "kv" (a hash per
+# cart in Redis, needs REDIS_URL; written to CartItem at checkout)
+CART_BACKEND = config('CART_BACKEND', default='orm')
+
+# How long placed but unpaid orders hold their stock
+STOCK_RESERVATION_MINUTES = config('STOCK_RESERVATION_MINUTES', default=15, cast=int)
+
+# How long the first of an idempotent request (payments, place_order) holds its key,
+# and how long a duplicate waits for it before getting a 409
+IDEMPOTENCY_LOCK_SECONDS = config('IDEMPOTENCY_LOCK_SECONDS', default=30, cast=int)
+IDEMPOTENCY_WAIT_SECONDS = config('IDEMPOTENCY_WAIT_SECONDS', default=5, cast=int)
+
 AUTH_PASSWORD_VALIDATORS = []
 
 LANGUAGE_CODE = 'en-us'
@@ -255,6 +289,12 @@ SOCIALACCOUNT_ADAPTER = 'accounts.adapters.CustomSocialAccountAdapter'
 # Razorpay
 RAZORPAY_KEY_ID = config("RAZORPAY_KEY_ID")
 RAZORPAY_KEY_SECRET = config("RAZORPAY_KEY_SECRET")
+# One keep-alive client per process (orders/gateway.py); point RAZORPAY_BASE_URL
+# at a fake server to test without the real gateway
+RAZORPAY_BASE_URL = config("RAZORPAY_BASE_URL", default="https://api.razorpay.com")
+RAZORPAY_CONNECT_TIMEOUT = config("RAZORPAY_CONNECT_TIMEOUT", default=3.05, cast=float)
+RAZORPAY_READ_TIMEOUT = config("RAZORPAY_READ_TIMEOUT", default=10, cast=float)
+RAZORPAY_RETRIES = config("RAZORPAY_RETRIES", default=2, cast=int)
 
 # Determine Environment
 if DEBUG:
@@ -1,17 +1,12 @@
 from django.shortcuts import render
-from store.models import Product, ReviewRating
+from store.feed import get_home_feed
 from django.http import JsonResponse
 
 def home(request):
-    products = Product.objects.all().filter(is_available=True).order_by('-created_at')
-
-    reviews = None
-    for product in products:
-        reviews = ReviewRating.objects.filter(product_id=product.id, status=True)
+    products = get_home_feed()
 
     context = {
         "products": products,
-        "reviews": reviews
     }
     return render(request, 'home.html', context)
 
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Payment, Order, OrderProduct
+from .models import Payment, Order, OrderProduct, StockReservation
 
 class OrderProductInline(admin.TabularInline):
     model = OrderProduct
@@ -69,7 +69,16 @@ class OrderProductAdmin(admin.ModelAdmin):
         return request.user.is_superuser
     
 
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('order', 'product', 'quantity', 'expires_at', 'created_at')
+    list_per_page = 10
+
+    def has_add_permission(self, request):
+        return False
+
+
 # Register your models here.
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(Order, OrderAdmin)
-admin.site.register(OrderProduct, OrderProductAdmin)
\ No newline at end of file
+admin.site.register(OrderProduct, OrderProductAdmin)
+admin.site.register(StockReservation, StockReservationAdmin)
@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import Account
+from carts.backends import get_cart_store
+from carts.models import CartItem
+from .models import Order, OrderProduct
+from .receipts import build_receipt, receipt_line
+from .reservations import convert_reservations
+
+
+def materialize_order(order, payment):
+    # Turn the buyer's cart into the paid order: mark the order paid with a snapshot
+    # of its receipt, copy the cart lines into OrderProducts with their variations,
+    # turn the stock held for the order into sales and empty the cart. One transaction
+    # and a fixed number of queries whatever the number of lines. Returns the OrderProducts,
+    # or None if the order was already paid (e.g. by a second payment with another transID).
+    user = order.user
+    with transaction.atomic():
+        # Claim the order first: of two payments racing for it, only one gets here
+        if not Order.objects.filter(id=order.id, is_ordered=False).update(is_ordered=True):
+            return None
+
+        cart_items = list(
+            CartItem.objects.filter(user=user)
+            .select_related('product')
+            .prefetch_related('variations')
+            .order_by('id')
+        )
+
+        order.payment = payment
+        order.is_ordered = True
+        order.receipt = build_receipt(order, payment, [
+            receipt_line(item.product.product_name, item.quantity, item.product.price, item.variations.all())
+            for item in cart_items
+        ])
+        order.save()
+
+        order_products = OrderProduct.objects.bulk_create([
+            OrderProduct(
+                order=order,
+                payment=payment,
+                user=user,  # buyer
+                product_id=item.product_id,
+                seller_id=item.product.owner_id,
+                quantity=item.quantity,
+                product_price=item.product.price,
+                ordered=True,
+            )
+            for item in cart_items
+        ])
+
+        Through = OrderProduct.variations.through
+        Through.objects.bulk_create([
+            Through(orderproduct_id=order_product.id, variation_id=variation.id)
+            for order_product, item in zip(order_products, cart_items)
+            for variation in item.variations.all()
+        ])
+
+        # The stock was held at place_order; settle the difference in a single UPDATE
+        sold = {}
+        for item in cart_items:
+            sold[item.product_id] = sold.get(item.product_id, 0) + item.quantity
+        convert_reservations(order, sold)
+
+        # Read by the dashboard instead of counting the orders on every visit
+        Account.objects.filter(id=user.id).update(order_count=F('order_count') + 1)
+
+        get_cart_store().clear(user)
+
+    return order_products
@@ -0,0 +1,213 @@
+import logging
+import random
+import threading
+import time
+from collections import deque
+
+import razorpay
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+logger = logging.getLogger('core')
+
+
+class GatewayUnavailable(Exception):
+    # The gateway is down, too slow or the circuit is open: try again later
+    pass
+
+
+class CircuitBreaker:
+    # Closed: calls go through. After `threshold` failures in a row it opens and
+    # calls fail immediately for `reset_seconds`; then one trial call is let through
+    # (half-open) and its outcome closes or re-opens the circuit.
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half-open'
+
+    def __init__(self, threshold=5, reset_seconds=30, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                return True
+            return False  # open, or a trial call is already in flight
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        # The call ended before the gateway answered either way (e.g. a bug on our
+        # side): nothing learnt, so a trial call is given back to the next caller
+        with self.lock:
+            if self.state == self.HALF_OPEN:
+                self.state = self.OPEN
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                if self.state != self.OPEN:
+                    logger.warning('Payment gateway circuit opened after %s failures', self.failures)
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+
+
+class LatencyStats:
+    # Per-operation call counts, errors and latency percentiles over the last `window` calls,
+    # of this process. Shown to staff at orders/gateway_stats/.
+    def __init__(self, window=500):
+        self.window = window
+        self.operations = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, seconds, ok):
+        with self.lock:
+            stats = self.operations.setdefault(operation, {'calls': 0, 'errors': 0, 'latencies': deque(maxlen=self.window)})
+            stats['calls'] += 1
+            stats['errors'] += not ok
+            stats['latencies'].append(seconds * 1000)
+
+    def snapshot(self):
+        with self.lock:
+            result = {}
+            for operation, stats in self.operations.items():
+                latencies = sorted(stats['latencies'])
+                result[operation] = {
+                    'calls': stats['calls'],
+                    'errors': stats['errors'],
+                    'p50_ms': round(latencies[len(latencies) // 2], 1),
+                    'p95_ms': round(latencies[min(len(latencies) - 1, len(latencies) * 95 // 100)], 1),
+                    'max_ms': round(latencies[-1], 1),
+                }
+            return result
+
+
+class TimeoutSession(requests.Session):
+    # The razorpay client doesn't pass a timeout; give every request one
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+# Errors worth retrying: the request may not have reached the gateway, or the gateway failed
+RETRYABLE = (requests.ConnectionError, requests.Timeout, razorpay.errors.ServerError, razorpay.errors.GatewayError)
+
+
+def not_sent(error):
+    # True if the connection couldn't be opened, so the gateway never saw the request.
+    # A read timeout or a dropped connection may come after the gateway acted on it.
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], 'reason', None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+class RazorpayGateway:
+    # One per process: the HTTP session keeps its TLS connections to the gateway alive
+    # between checkouts instead of handshaking on every request.
+    def __init__(self, key_id, key_secret, base_url=None, connect_timeout=3.05, read_timeout=10,
+                 retries=2, backoff=0.2, pool_size=10, breaker=None):
+        self.session = TimeoutSession((connect_timeout, read_timeout))
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        options = {'base_url': base_url} if base_url else {}
+        self.client = razorpay.Client(session=self.session, auth=(key_id, key_secret), **options)
+        self.key_id = key_id
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = LatencyStats()
+
+    def call(self, operation, func, *args, safe_to_repeat=True, **kwargs):
+        # Run func with retries and jittered exponential backoff. Errors the gateway
+        # reports about the request itself (bad amount, auth) are raised as they are;
+        # repeated transport or server errors end in GatewayUnavailable. Calls that aren't
+        # safe_to_repeat are only retried when the gateway can't have acted on them.
+        if not self.breaker.allow():
+            raise GatewayUnavailable('Payment gateway is temporarily unavailable.')
+
+        for attempt in range(self.retries + 1):
+            started = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except RETRYABLE as e:
+                self.stats.record(operation, time.perf_counter() - started, ok=False)
+                logger.warning('Payment gateway %s failed (attempt %s): %s', operation, attempt + 1, e)
+                error = e
+                if not safe_to_repeat and isinstance(e, requests.RequestException) and not not_sent(e):
+                    break
+                if attempt < self.retries:
+                    time.sleep(self.backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+            except razorpay.errors.BadRequestError:
+                self.stats.record(operation, time.perf_counter() - started, ok=False)
+                self.breaker.record_success()  # the gateway answered
+                raise
+            except Exception:
+                self.stats.record(operation, time.perf_counter() - started, ok=False)
+                self.breaker.release()
+                raise
+            else:
+                self.stats.record(operation, time.perf_counter() - started, ok=True)
+                self.breaker.record_success()
+                return result
+
+        self.breaker.record_failure()
+        raise GatewayUnavailable('Payment gateway is temporarily unavailable.') from error
+
+    def create_order(self, amount, currency='INR', receipt=None):
+        # amount in paise; receipt is our order number, so a gateway order can be matched
+        # to the order it was created for. Not repeated after a read timeout: the gateway
+        # may have created the order already.
+        data = {
+            'amount': amount,
+            'currency': currency,
+            'payment_capture': 1,
+        }
+        if receipt:
+            data['receipt'] = receipt
+        return self.call('order.create', self.client.order.create, data, safe_to_repeat=False)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = RazorpayGateway(
+                    settings.RAZORPAY_KEY_ID,
+                    settings.RAZORPAY_KEY_SECRET,
+                    base_url=settings.RAZORPAY_BASE_URL,
+                    connect_timeout=settings.RAZORPAY_CONNECT_TIMEOUT,
+                    read_timeout=settings.RAZORPAY_READ_TIMEOUT,
+                    retries=settings.RAZORPAY_RETRIES,
+                )
+    return _gateway
+
+
+def set_gateway(gateway):
+    # Swap the process-wide gateway, e.g. for one pointed at a fake server in tests.
+    # Returns the previous one.
+    global _gateway
+    previous, _gateway = _gateway, gateway
+    return previous
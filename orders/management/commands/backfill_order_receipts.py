@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.receipts import backfill_receipts
+
+
+class Command(BaseCommand):
+    help = "Build the receipt snapshot of paid orders placed before receipts were stored."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        done = backfill_receipts(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Stored receipts for {done} orders."))
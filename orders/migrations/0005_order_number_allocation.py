@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:32
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+def start_sequence_and_fix_numbers(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderNumberSequence = apps.get_model('orders', 'OrderNumberSequence')
+
+    # Orders numbered "ddmmyyyy" + id so far; the sequence continues after the last id
+    last_id = Order.objects.aggregate(last=Max('id'))['last'] or 0
+    OrderNumberSequence.objects.create(name='order', next_value=last_id + 1)
+
+    # Empty or repeated numbers would break the unique index: renumber all but the first
+    duplicates = Order.objects.values('order_number').annotate(n=Count('id')).filter(n__gt=1).values_list('order_number', flat=True)
+    seen = set()
+    for order in Order.objects.filter(order_number__in=list(duplicates)).order_by('id'):
+        if order.order_number and order.order_number not in seen:
+            seen.add(order.order_number)
+            continue
+        order.order_number = f"{order.created_at.strftime('%d%m%Y')}{order.id}"
+        order.save(update_fields=['order_number'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_stockreservation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberSequence',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('next_value', models.BigIntegerField(default=1)),
+            ],
+        ),
+        migrations.RunPython(start_sequence_and_fix_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='order',
+            name='order_number',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
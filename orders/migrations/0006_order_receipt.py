@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_number_allocation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='receipt',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -15,17 +15,27 @@ class Payment(models.Model):
         return self.payment_id
 
 
+class OrderNumberSequence(models.Model):
+    ## Next free order number; handed out in blocks by orders.numbers
+    name = models.CharField(max_length=50, primary_key=True)
+    next_value = models.BigIntegerField(default=1)
+
+    def __str__(self):
+        return f'{self.name}: {self.next_value}'
+
+
 class Order(models.Model):
     STATUS = (
         ('New', 'New'),
         ('Accepted', 'Accepted'),
         ('Completed', 'Completed'),
         ('Cancelled', 'Cancelled'),
+        ('Review', 'Review'),  # paid but short of stock, see orders.reservations
     )
 
     user = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True)
     payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, blank=True, null=True)
-    order_number = models.CharField(max_length=20)
+    order_number = models.CharField(max_length=20, unique=True)  # see orders.numbers
     first_name = models.CharField(max_length=50)
     last_name = models.CharField(max_length=50)
     phone = models.CharField(max_length=15)
@@ -44,7 +54,11 @@ class Order(models.Model):
     is_ordered = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    receipt = models.JSONField(null=True, blank=True)  # snapshot taken when paid, see orders.receipts
 
+    class Meta:
+        # a buyer's order history, newest first (accounts.views.my_orders)
+        indexes = [models.Index(fields=['user', 'is_ordered', 'created_at', 'id'], name='order_user_history_idx')]
 
     def full_name(self):
         return f'{self.first_name} {self.last_name}'
@@ -70,4 +84,17 @@ class OrderProduct(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return self.product.product_name
\ No newline at end of file
+        return self.product.product_name
+
+
+class StockReservation(models.Model):
+    ## Stock held for an order that isn't paid yet. Product.stock is already
+    ## lowered by it; the quantity goes back when the hold expires (see orders.reservations).
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE)
+    quantity = models.IntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} for order {self.order_id}'
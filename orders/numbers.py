@@ -0,0 +1,42 @@
+import threading
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OrderNumberSequence
+
+SEQUENCE = 'order'
+BLOCK_SIZE = 20
+
+# [next, end) of the block of numbers this process owns
+_lock = threading.Lock()
+_block = [0, 0]
+
+
+def _take_block(size):
+    # Reserve the next `size` numbers for this process with one UPDATE.
+    # Runs in its own transaction; must not be called inside another one, or a
+    # rollback there would hand the same block out twice.
+    with transaction.atomic():
+        if not OrderNumberSequence.objects.filter(name=SEQUENCE).update(next_value=F('next_value') + size):
+            try:
+                with transaction.atomic():
+                    OrderNumberSequence.objects.create(name=SEQUENCE, next_value=1 + size)
+                return 1, 1 + size
+            except IntegrityError:  # created by another process meanwhile
+                OrderNumberSequence.objects.filter(name=SEQUENCE).update(next_value=F('next_value') + size)
+        end = OrderNumberSequence.objects.get(name=SEQUENCE).next_value
+    return end - size, end
+
+
+def next_order_number(today=None):
+    # "ddmmyyyy" + a number unique across processes, known before the order is inserted.
+    # Numbers of a block left unused when a process stops are skipped.
+    with _lock:
+        if _block[0] >= _block[1]:
+            _block[:] = _take_block(BLOCK_SIZE)
+        value = _block[0]
+        _block[0] += 1
+    today = today or timezone.localdate()
+    return f"{today.strftime('%d%m%Y')}{value}"
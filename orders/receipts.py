@@ -0,0 +1,94 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db.models import Prefetch
+
+from .models import Order, OrderProduct
+
+
+def to_paise(rupees):
+    # Order amounts are floats; go through their shortest repr so 10.2 is 1020, not 1019
+    return int((Decimal(str(rupees)) * 100).quantize(Decimal('1'), rounding=ROUND_HALF_UP))
+
+
+def to_rupees(paise):
+    return (Decimal(paise) / 100).quantize(Decimal('0.01'))
+
+
+def receipt_line(product_name, quantity, price, variations):
+    return {
+        'product': product_name,
+        'quantity': quantity,
+        'price_paise': to_paise(price),
+        'variations': [[v.variation_category, v.variation_value] for v in variations],
+    }
+
+
+def build_receipt(order, payment, lines):
+    # Everything order_complete and order_detail show about a paid order, so they
+    # render from the order row alone. A paid order doesn't change, nor does its receipt.
+    # Amounts are kept in paise, as in carts.summary, and formatted by display_receipt.
+    return {
+        'lines': lines,
+        'subtotal_paise': sum(line['price_paise'] * line['quantity'] for line in lines),
+        'tax_paise': to_paise(order.tax),
+        'grand_total_paise': to_paise(order.order_total),
+        'payment_id': payment.payment_id if payment else '',
+        'payment_status': payment.status if payment else '',
+    }
+
+
+def receipt_from_order_products(order):
+    # For orders paid before receipts existed; expects orderproduct_set prefetched
+    # with product and variations to build many at once
+    return build_receipt(order, order.payment, [
+        receipt_line(item.product.product_name, item.quantity, item.product_price, item.variations.all())
+        for item in order.orderproduct_set.all()
+    ])
+
+
+def order_products_prefetch():
+    return Prefetch(
+        'orderproduct_set',
+        queryset=OrderProduct.objects.select_related('product').prefetch_related('variations').order_by('id'),
+    )
+
+
+def get_receipt(order):
+    # The order's receipt, built and stored first if the order predates receipts
+    if order.receipt is None:
+        loaded = Order.objects.select_related('payment').prefetch_related(order_products_prefetch()).get(id=order.id)
+        order.receipt = receipt_from_order_products(loaded)
+        Order.objects.filter(id=order.id).update(receipt=order.receipt)
+    return order.receipt
+
+
+def display_receipt(receipt):
+    # The receipt with its amounts in rupees, as Decimals, for the templates
+    return {
+        **receipt,
+        'lines': [{**line, 'price': to_rupees(line['price_paise'])} for line in receipt['lines']],
+        'subtotal': to_rupees(receipt['subtotal_paise']),
+        'tax': to_rupees(receipt['tax_paise']),
+        'grand_total': to_rupees(receipt['grand_total_paise']),
+    }
+
+
+def backfill_receipts(batch_size=200):
+    # Build the receipt of paid orders from before receipts existed, from their
+    # OrderProducts. Returns the number of orders updated.
+    done = 0
+    last_id = 0
+    while True:
+        orders = list(
+            Order.objects.filter(is_ordered=True, receipt__isnull=True, id__gt=last_id)
+            .select_related('payment')
+            .prefetch_related(order_products_prefetch())
+            .order_by('id')[:batch_size]
+        )
+        if not orders:
+            return done
+        for order in orders:
+            order.receipt = receipt_from_order_products(order)
+        Order.objects.bulk_update(orders, ['receipt'])
+        done += len(orders)
+        last_id = orders[-1].id
@@ -0,0 +1,135 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from store.detail import invalidate_product_detail
+from store.models import Product
+from .models import Order, StockReservation
+
+logger = logging.getLogger('core')
+
+
+class InsufficientStock(Exception):
+    def __init__(self, products):
+        self.products = products  # names of the products that ran out
+        super().__init__(', '.join(products))
+
+
+def take_stock(quantities):
+    # Take {product_id: quantity} from Product.stock, each product with a conditional
+    # UPDATE (stock >= quantity) so stock never goes negative. Products are taken in
+    # id order, the same lock order for every caller. Returns the ids of the products
+    # that didn't have enough left; those are left untouched.
+    short = []
+    for product_id, quantity in sorted(quantities.items()):
+        if quantity > 0 and not Product.objects.filter(id=product_id, stock__gte=quantity).update(stock=F('stock') - quantity):
+            short.append(product_id)
+    return short
+
+
+def restock(quantities):
+    # Give {product_id: quantity} back to Product.stock in a single UPDATE
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return
+    Product.objects.filter(id__in=quantities).update(stock=Case(
+        *(When(id=product_id, then=F('stock') + quantity) for product_id, quantity in quantities.items()),
+        default=F('stock'),
+    ))
+
+
+def _invalidate(product_ids):
+    # The product page shows "out of stock"
+    if product_ids:
+        invalidate_product_detail(*Product.objects.filter(id__in=product_ids).values_list('slug', flat=True))
+
+
+def _quantities(lines):
+    quantities = {}
+    for line in lines:
+        quantities[line.product.id] = quantities.get(line.product.id, 0) + line.quantity
+    return quantities
+
+
+def reserve_stock(order, lines, minutes=None):
+    # Hold the stock of the cart lines for the order. Each product is taken with a
+    # conditional UPDATE (stock >= quantity), so concurrent checkouts can't oversell.
+    # Raises InsufficientStock, holding nothing, when a product doesn't have enough left.
+    minutes = minutes or settings.STOCK_RESERVATION_MINUTES
+    quantities = _quantities(lines)
+    expires_at = timezone.now() + timedelta(minutes=minutes)
+
+    with transaction.atomic():
+        short = take_stock(quantities)
+        if short:
+            raise InsufficientStock(list(Product.objects.filter(id__in=short).values_list('product_name', flat=True)))
+
+        StockReservation.objects.bulk_create(
+            StockReservation(order=order, product_id=product_id, quantity=quantity, expires_at=expires_at)
+            for product_id, quantity in quantities.items()
+        )
+    invalidate_product_detail(*{line.product.slug for line in lines})
+
+
+def _take(reservations):
+    # Lock and delete reservations, returning the quantities they held per product
+    held = {}
+    rows = list(reservations.select_for_update().values_list('id', 'product_id', 'quantity'))
+    for _, product_id, quantity in rows:
+        held[product_id] = held.get(product_id, 0) + quantity
+    if rows:
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+    return held
+
+
+def release_reservations(reservations):
+    # Give the stock held by reservations back. Returns the number of products touched.
+    with transaction.atomic():
+        held = _take(reservations)
+        restock(held)
+    _invalidate(held)
+    return len(held)
+
+
+def release_unpaid(user):
+    # Holds of the user's earlier, abandoned checkouts
+    return release_reservations(StockReservation.objects.filter(order__user=user, order__is_ordered=False))
+
+
+def convert_reservations(order, sold):
+    # Turn the order's holds into sales. sold: {product_id: quantity} actually ordered.
+    # Stock was already taken for the held quantities; anything sold beyond them
+    # (e.g. the hold expired before payment) is taken now if there's enough left,
+    # anything held but not sold goes back. Stock never goes negative: when there
+    # isn't enough left the order is marked for review and the shortfall logged.
+    # Returns the ids of the products that were short.
+    with transaction.atomic():
+        held = _take(order.reservations.all())
+        extra = {product_id: quantity - held.get(product_id, 0) for product_id, quantity in sold.items()}
+        unsold = {product_id: quantity - sold.get(product_id, 0) for product_id, quantity in held.items()}
+        short = take_stock(extra)
+        restock(unsold)
+        if short:
+            order.status = 'Review'
+            Order.objects.filter(id=order.id).update(status=order.status)
+            logger.error('Order %s was paid without enough stock for products %s: %s',
+                         order.order_number, short, {product_id: extra[product_id] for product_id in short})
+    _invalidate({product_id for product_id, quantity in extra.items() if quantity > 0 and product_id not in short}
+                | {product_id for product_id, quantity in unsold.items() if quantity > 0})
+    return short
+
+
+def release_expired(now=None, batch_size=500):
+    # Sweep holds past their expiry in batches. Returns the number of reservations released.
+    now = now or timezone.now()
+    released = 0
+    while True:
+        ids = list(StockReservation.objects.filter(expires_at__lte=now).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return released
+        release_reservations(StockReservation.objects.filter(id__in=ids, expires_at__lte=now))
+        released += len(ids)
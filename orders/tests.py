@@ -1,3 +1,547 @@
-from django.test import TestCase
+import json
+import threading
+import time
+from unittest import mock
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from django.db import OperationalError, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import QuerySet
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from accounts.models import Account
+from carts.models import CartItem
+from category.models import Category
+from core.models import OutboxEmail
+from store.models import Product, Variation
+from .checkout import materialize_order
+from .gateway import CircuitBreaker, GatewayUnavailable, RazorpayGateway, set_gateway
+from . import numbers
+from .models import Order, OrderNumberSequence, OrderProduct, Payment, StockReservation
+from .receipts import backfill_receipts, display_receipt
+from .reservations import InsufficientStock, release_expired, reserve_stock, take_stock
+
+
+class MaterializeOrderTest(TestCase):
+    def setUp(self):
+        self.seller = Account.objects.create_user(email='seller@example.com', username='seller', first_name='Sell', last_name='Er')
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.products = Product.objects.bulk_create(
+            Product(product_name=f'Product {i}', slug=f'product-{i}', price=100 + i, stock=50, category=category, owner=self.seller)
+            for i in range(40)
+        )
+        self.variations = Variation.objects.bulk_create(
+            Variation(product=product, variation_category='size', variation_value='m') for product in self.products
+        )
+
+    def make_buyer(self, username, lines):
+        buyer = Account.objects.create_user(email=f'{username}@example.com', username=username, first_name='Buy', last_name='Er')
+        for product, variation in zip(self.products[:lines], self.variations):
+            item = CartItem.objects.create(user=buyer, product=product, quantity=2)
+            item.variations.add(variation)
+        order = Order.objects.create(
+            user=buyer, order_number=f'ORD-{username}', first_name='Buy', last_name='Er', phone='1', email=buyer.email,
+            address_line_1='Street', pin_code='1', city='City', state='State', country='India', order_total=1, tax=0,
+        )
+        payment = Payment.objects.create(user=buyer, payment_id=f'pay-{username}', payment_method='Razorpay', amount_paid='1', status='captured')
+        return buyer, order, payment
+
+    def test_cart_becomes_order_lines(self):
+        buyer, order, payment = self.make_buyer('buyer', 3)
+
+        materialize_order(order, payment)
+
+        order.refresh_from_db()
+        self.assertTrue(order.is_ordered)
+        self.assertEqual(order.payment, payment)
+        order_products = list(OrderProduct.objects.filter(order=order).order_by('id'))
+        self.assertEqual([(op.product_id, op.quantity, op.seller_id, op.product_price) for op in order_products],
+                         [(p.id, 2, self.seller.id, p.price) for p in self.products[:3]])
+        self.assertEqual([list(op.variations.all()) for op in order_products], [[v] for v in self.variations[:3]])
+        self.assertEqual(list(Product.objects.filter(id__in=[p.id for p in self.products[:4]]).order_by('id').values_list('stock', flat=True)), [48, 48, 48, 50])
+        self.assertFalse(CartItem.objects.filter(user=buyer).exists())
+        self.assertEqual(order.receipt['lines'][0], {
+            'product': 'Product 0', 'quantity': 2, 'price_paise': 10000, 'variations': [['size', 'm']],
+        })
+        self.assertEqual(order.receipt['subtotal_paise'], sum(200 * p.price for p in self.products[:3]))
+        self.assertEqual(order.receipt['payment_id'], payment.payment_id)
+        buyer.refresh_from_db()
+        self.assertEqual(buyer.order_count, 1)
+
+    def test_second_payment_does_not_materialize_the_order_again(self):
+        buyer, order, payment = self.make_buyer('twice', 2)
+        stale = Order.objects.get(id=order.id)  # loaded by a racing request before the first payment
+        other = Payment.objects.create(user=buyer, payment_id='pay-other', payment_method='Razorpay', amount_paid='1', status='captured')
+
+        self.assertEqual(len(materialize_order(order, payment)), 2)
+        self.assertIsNone(materialize_order(stale, other))
+
+        order.refresh_from_db()
+        self.assertEqual(order.payment, payment)
+        self.assertEqual(len(order.receipt['lines']), 2)
+        self.assertEqual(OrderProduct.objects.filter(order=order).count(), 2)
+        self.assertEqual(Product.objects.get(id=self.products[0].id).stock, 48)
+        buyer.refresh_from_db()
+        self.assertEqual(buyer.order_count, 1)
+
+    def test_query_count_does_not_grow_with_the_order(self):
+        def queries_for(username, lines):
+            buyer, order, payment = self.make_buyer(username, lines)
+            reserve_stock(order, CartItem.objects.filter(user=buyer).select_related('product'))  # held at place_order
+            with CaptureQueriesContext(connection) as captured:
+                materialize_order(order, payment)
+            self.assertEqual(OrderProduct.objects.filter(order=order).count(), lines)
+            return len(captured.captured_queries)
+
+        self.assertEqual(queries_for('small', 1), queries_for('large', 40))
+
+    def test_payments_view(self):
+        buyer, order, _ = self.make_buyer('viewer', 2)
+        buyer.is_active = True  # accounts are activated by email
+        buyer.save()
+        self.client.force_login(buyer)
+
+        response = self.client.post('/orders/payments/', json.dumps({
+            'orderID': order.order_number, 'transID': 'pay-1', 'payment_method': 'Razorpay', 'status': 'captured',
+        }), content_type='application/json')
+
+        self.assertEqual(response.json(), {'order_number': order.order_number, 'transID': 'pay-1'})
+        self.assertEqual(OrderProduct.objects.filter(order=order, payment__payment_id='pay-1').count(), 2)
+
+    def test_receipt_pages_render_from_the_snapshot(self):
+        buyer, order, payment = self.make_buyer('reader', 3)
+        buyer.is_active = True
+        buyer.save()
+        order.order_number = '18102026100'  # order_detail takes a numeric order number
+        materialize_order(order, payment)
+        self.client.force_login(buyer)
+
+        for url in (f'/orders/order_complete/?order_number={order.order_number}&payment_id={payment.payment_id}',
+                    f'/accounts/order_detail/{order.order_number}/'):
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get(url)
+            self.assertContains(response, 'Product 2')
+            self.assertContains(response, 'Size : M')
+            self.assertContains(response, '₹102.00 INR')  # price of Product 2
+            self.assertContains(response, '₹606.00 INR')  # subtotal
+            self.assertFalse([q for q in captured.captured_queries if 'orders_orderproduct' in q['sql']])
+
+    def test_order_history_is_paged_newest_first(self):
+        buyer, order, payment = self.make_buyer('loyal', 1)
+        buyer.is_active = True
+        buyer.save()
+        Order.objects.bulk_create([
+            Order(user=buyer, order_number=f'900{i}', first_name='Buy', last_name='Er', phone='1', email=buyer.email,
+                  address_line_1='Street', pin_code='1', city='City', state='State', country='India',
+                  order_total=i, tax=0, is_ordered=True)
+            for i in range(45)
+        ])
+        self.client.force_login(buyer)
+
+        seen = []
+        response = self.client.get('/accounts/my_orders/')
+        while True:
+            seen += [order.order_number for order in response.context['orders']]
+            if not response.context['orders'].has_next:
+                break
+            response = self.client.get('/accounts/my_orders/', {'cursor': response.context['orders'].next_cursor})
+
+        self.assertEqual(seen, [f'900{i}' for i in reversed(range(45))])
+
+    def test_receipt_amounts_are_exact(self):
+        _, order, payment = self.make_buyer('exact', 1)
+        order.order_total, order.tax = 204.2, 4.2  # not exact as floats
+        materialize_order(order, payment)
+
+        receipt = Order.objects.get(id=order.id).receipt
+        self.assertEqual((receipt['tax_paise'], receipt['grand_total_paise']), (420, 20420))
+        self.assertEqual(str(display_receipt(receipt)['grand_total']), '204.20')
+
+    def test_backfill_builds_missing_receipts(self):
+        _, order, payment = self.make_buyer('old', 2)
+        materialize_order(order, payment)
+        receipt = Order.objects.get(id=order.id).receipt
+        Order.objects.update(receipt=None)
+
+        self.assertEqual(backfill_receipts(batch_size=1), 1)
+        self.assertEqual(Order.objects.get(id=order.id).receipt, receipt)
+
+    def test_replayed_payment_is_stored_once(self):
+        buyer, order, _ = self.make_buyer('retrier', 2)
+        buyer.is_active = True
+        buyer.save()
+        self.client.force_login(buyer)
+        body = json.dumps({'orderID': order.order_number, 'transID': 'pay-2', 'payment_method': 'Razorpay', 'status': 'captured'})
+
+        first = self.client.post('/orders/payments/', body, content_type='application/json')
+        second = self.client.post('/orders/payments/', body, content_type='application/json')
+
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(Payment.objects.filter(payment_id='pay-2').count(), 1)
+        self.assertEqual(OrderProduct.objects.filter(order=order).count(), 2)
+        self.assertEqual(OutboxEmail.objects.count(), 1)
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.product = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=category)
+        self.buyer = Account.objects.create_user(email='buyer@example.com', username='buyer', first_name='Buy', last_name='Er')
+
+    def make_order(self, number):
+        return Order.objects.create(
+            user=self.buyer, order_number=number, first_name='Buy', last_name='Er', phone='1', email=self.buyer.email,
+            address_line_1='Street', pin_code='1', city='City', state='State', country='India', order_total=1, tax=0,
+        )
+
+    def line(self, quantity):
+        return CartItem(user=self.buyer, product=self.product, quantity=quantity)
+
+    def stock(self):
+        return Product.objects.get(id=self.product.id).stock
+
+    def test_reserving_takes_stock_and_refuses_to_oversell(self):
+        reserve_stock(self.make_order('A'), [self.line(3)])
+        self.assertEqual(self.stock(), 2)
+
+        with self.assertRaises(InsufficientStock):
+            reserve_stock(self.make_order('B'), [self.line(3)])
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+    def test_expired_holds_are_released(self):
+        reserve_stock(self.make_order('A'), [self.line(3)], minutes=1)
+
+        self.assertEqual(release_expired(now=timezone.now()), 0)
+        self.assertEqual(release_expired(now=timezone.now() + timedelta(minutes=2)), 1)
+        self.assertEqual(self.stock(), 5)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_payment_converts_the_hold(self):
+        order = self.make_order('A')
+        reserve_stock(order, [self.line(3)])
+        CartItem.objects.create(user=self.buyer, product=self.product, quantity=3)
+        payment = Payment.objects.create(user=self.buyer, payment_id='pay', payment_method='Razorpay', amount_paid='1', status='captured')
+
+        materialize_order(order, payment)
+
+        self.assertEqual(self.stock(), 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_stock_is_only_taken_when_there_is_enough(self):
+        other = Product.objects.create(product_name='Hat', slug='hat', price=50, stock=1, category=self.product.category)
+
+        self.assertEqual(take_stock({self.product.id: 2, other.id: 3}), [other.id])
+
+        self.assertEqual(self.stock(), 3)
+        self.assertEqual(Product.objects.get(id=other.id).stock, 1)
+
+    def test_payment_after_the_hold_expired_takes_the_stock_if_left(self):
+        order = self.make_order('A')
+        reserve_stock(order, [self.line(3)])
+        release_expired(now=timezone.now() + timedelta(days=1))
+        CartItem.objects.create(user=self.buyer, product=self.product, quantity=3)
+        payment = Payment.objects.create(user=self.buyer, payment_id='pay', payment_method='Razorpay', amount_paid='1', status='captured')
+
+        materialize_order(order, payment)
+
+        self.assertEqual(self.stock(), 2)
+        self.assertEqual(Order.objects.get(id=order.id).status, 'New')
+
+    def test_payment_after_the_hold_expired_never_oversells(self):
+        order = self.make_order('A')
+        reserve_stock(order, [self.line(3)])
+        release_expired(now=timezone.now() + timedelta(days=1))
+        reserve_stock(self.make_order('B'), [self.line(4)])  # someone else bought the stock meanwhile
+        CartItem.objects.create(user=self.buyer, product=self.product, quantity=3)
+        payment = Payment.objects.create(user=self.buyer, payment_id='pay', payment_method='Razorpay', amount_paid='1', status='captured')
+
+        with self.assertLogs('core', 'ERROR'):
+            materialize_order(order, payment)
+
+        self.assertEqual(self.stock(), 1)
+        order.refresh_from_db()
+        self.assertTrue(order.is_ordered)
+        self.assertEqual(order.status, 'Review')
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    # Many buyers placing orders for the same product at once
+    BUYERS = 20
+    STOCK = 7
+
+    def test_parallel_checkouts_never_oversell(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        product = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=self.STOCK, category=category)
+        orders = []
+        for i in range(self.BUYERS):
+            buyer = Account.objects.create_user(email=f'buyer{i}@example.com', username=f'buyer{i}', first_name='Buy', last_name='Er')
+            orders.append(Order.objects.create(
+                user=buyer, order_number=str(i), first_name='Buy', last_name='Er', phone='1', email=buyer.email,
+                address_line_1='Street', pin_code='1', city='City', state='State', country='India', order_total=1, tax=0,
+            ))
+
+        results = []
+        barrier = threading.Barrier(self.BUYERS)
+
+        def checkout(order):
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        reserve_stock(order, [CartItem(product=product, quantity=1)])
+                        results.append('reserved')
+                        return
+                    except InsufficientStock:
+                        results.append('sold out')
+                        return
+                    except OperationalError:  # SQLite: database is locked, try again
+                        time.sleep(0.01)
+                results.append('gave up')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(order,)) for order in orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('reserved'), self.STOCK)
+        self.assertEqual(results.count('sold out'), self.BUYERS - self.STOCK)
+        self.assertEqual(Product.objects.get(id=product.id).stock, 0)
+        self.assertEqual(StockReservation.objects.count(), self.STOCK)
+
+
+class OrderNumberTest(TestCase):
+    def setUp(self):
+        previous = list(numbers._block)
+        numbers._block[:] = [0, 0]
+        self.addCleanup(numbers._block.__setitem__, slice(None), previous)
+
+    def test_numbers_keep_rising_across_blocks(self):
+        values = [int(numbers.next_order_number(date(2026, 10, 18))[8:]) for _ in range(numbers.BLOCK_SIZE * 2 + 5)]
+
+        self.assertEqual(values, list(range(1, numbers.BLOCK_SIZE * 2 + 6)))
+        self.assertEqual(OrderNumberSequence.objects.get().next_value, numbers.BLOCK_SIZE * 3 + 1)
+        self.assertEqual(numbers.next_order_number(date(2026, 10, 18))[:8], '18102026')
+
+    def test_sequence_created_by_another_process_meanwhile(self):
+        OrderNumberSequence.objects.all().delete()  # seeded by the migration
+        OrderNumberSequence.objects.create(name=numbers.SEQUENCE, next_value=101)  # the other process took 1-100
+        real_update = QuerySet.update
+        calls = []
+
+        def update_before_the_row_existed(queryset, **kwargs):
+            calls.append(kwargs)
+            return 0 if len(calls) == 1 else real_update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', autospec=True, side_effect=update_before_the_row_existed):
+            self.assertEqual(numbers._take_block(5), (101, 106))
+        self.assertEqual(OrderNumberSequence.objects.get().next_value, 106)
+
+
+class ConcurrentOrderNumberTest(TransactionTestCase):
+    def run_threads(self, count, work):
+        barrier = threading.Barrier(count)
+
+        def run():
+            try:
+                barrier.wait()
+                work()
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def retry(self, func):
+        for attempt in range(100):
+            try:
+                return func()
+            except OperationalError:  # SQLite: database is locked, try again
+                time.sleep(0.01)
+        raise AssertionError('gave up')
+
+    def test_processes_never_get_the_same_block(self):
+        # Each thread stands for a process taking blocks; none exists yet, so they race to create it
+        blocks = []
+
+        def take_blocks():
+            for _ in range(10):
+                blocks.append(self.retry(lambda: numbers._take_block(5)))
+
+        self.run_threads(4, take_blocks)
+
+        taken = sorted(value for start, end in blocks for value in range(start, end))
+        self.assertEqual(taken, list(range(1, 201)))
+
+    def test_threads_never_get_the_same_number(self):
+        previous = list(numbers._block)
+        numbers._block[:] = [0, 0]
+        self.addCleanup(numbers._block.__setitem__, slice(None), previous)
+        allocated = []
+
+        def allocate():
+            for _ in range(numbers.BLOCK_SIZE):
+                allocated.append(self.retry(numbers.next_order_number))
+
+        self.run_threads(5, allocate)
+
+        self.assertEqual(len(set(allocated)), len(allocated))
+
+
+class OrderNumberMigrationTest(TransactionTestCase):
+    before = [('orders', '0004_stockreservation')]
+    after = [('orders', '0005_order_number_allocation')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def test_sequence_is_seeded_and_repeated_numbers_renumbered(self):
+        apps = self.migrate(self.before)
+        self.addCleanup(self.migrate, MigrationExecutor(connection).loader.graph.leaf_nodes())
+        Order = apps.get_model('orders', 'Order')
+        fields = dict(first_name='Buy', last_name='Er', phone='1', email='b@example.com', address_line_1='Street',
+                      pin_code='1', city='City', state='State', country='India', order_total=1, tax=0)
+        orders = [Order.objects.create(order_number=number, **fields) for number in ('', '', '777', '777', '888')]
+
+        apps = self.migrate(self.after)
+
+        Order = apps.get_model('orders', 'Order')
+        day = orders[0].created_at.strftime('%d%m%Y')
+        self.assertEqual(
+            list(Order.objects.order_by('id').values_list('order_number', flat=True)),
+            [f'{day}{orders[0].id}', f'{day}{orders[1].id}', '777', f'{day}{orders[3].id}', '888'],
+        )
+        self.assertEqual(apps.get_model('orders', 'OrderNumberSequence').objects.get(name='order').next_value, orders[-1].id + 1)
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real gateway
+    fail = False
+    delay = 0
+    connections = set()
+    received = []
+
+    def do_POST(self):
+        FakeGatewayHandler.connections.add(self.client_address)
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        FakeGatewayHandler.received.append(body)
+        time.sleep(self.delay)
+        if self.fail:
+            status, reply = 500, {'error': {'code': 'SERVER_ERROR', 'description': 'Down'}}
+        else:
+            status, reply = 200, {'id': 'order_fake', 'amount': body['amount'], 'currency': body['currency']}
+        payload = json.dumps(reply).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeGateway(ThreadingHTTPServer):
+    def handle_error(self, request, client_address):
+        pass  # the client hung up on a slow reply
+
+
+class GatewayTest(TestCase):
+    def setUp(self):
+        FakeGatewayHandler.fail, FakeGatewayHandler.delay = False, 0
+        FakeGatewayHandler.connections = set()
+        FakeGatewayHandler.received = []
+        self.server = FakeGateway(('127.0.0.1', 0), FakeGatewayHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.gateway = RazorpayGateway('key', 'secret', base_url=f'http://127.0.0.1:{self.server.server_port}',
+                                       read_timeout=0.5, retries=1, backoff=0, breaker=CircuitBreaker(threshold=2, reset_seconds=60))
+        self.addCleanup(set_gateway, set_gateway(self.gateway))
+
+    def test_orders_are_created_over_one_kept_alive_connection(self):
+        for _ in range(3):
+            response = self.client.post('/orders/create_razorpay_order/', json.dumps({'amount': '12.50', 'receipt': '18102026100'}),
+                                        content_type='application/json')
+            self.assertEqual(response.json()['order_id'], 'order_fake')
+            self.assertEqual(response.json()['amount'], 1250)
+        self.assertEqual(len(FakeGatewayHandler.connections), 1)
+        self.assertEqual(FakeGatewayHandler.received[0]['receipt'], '18102026100')
+        self.assertEqual(self.gateway.stats.snapshot()['order.create']['calls'], 3)
+
+    def test_circuit_opens_when_the_gateway_keeps_failing(self):
+        FakeGatewayHandler.fail = True
+        for _ in range(2):
+            with self.assertRaises(GatewayUnavailable):
+                self.gateway.create_order(100)
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.gateway.stats.snapshot()['order.create']['errors'], 4)  # two tries each
+
+        FakeGatewayHandler.fail = False
+        response = self.client.post('/orders/create_razorpay_order/', json.dumps({'amount': '1'}), content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.gateway.stats.snapshot()['order.create']['calls'], 4)  # failed fast
+
+        self.gateway.breaker.opened_at -= 60
+        self.assertEqual(self.gateway.create_order(100)['id'], 'order_fake')
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_slow_gateway_times_out(self):
+        FakeGatewayHandler.delay = 3
+        started = time.monotonic()
+        with self.assertRaises(GatewayUnavailable):
+            self.gateway.create_order(100)
+        self.assertLess(time.monotonic() - started, 2)  # not waiting for the reply
+        # The gateway may have created the order: asking again could create a second one
+        self.assertEqual(len(FakeGatewayHandler.received), 1)
+
+    def test_errors_of_our_own_leave_the_circuit_alone(self):
+        def broken(*args):
+            raise TypeError('bug in the caller')
+
+        self.gateway.breaker.record_failure()
+        with self.assertRaises(TypeError):
+            self.gateway.call('order.create', broken)
+        self.assertEqual(self.gateway.breaker.failures, 1)  # not reset
+
+        self.gateway.breaker.record_failure()
+        self.gateway.breaker.opened_at -= 60
+        with self.assertRaises(TypeError):
+            self.gateway.call('order.create', broken)  # the trial call
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.OPEN)
+        self.assertEqual(self.gateway.create_order(100)['id'], 'order_fake')  # the next caller gets the trial
+        self.assertEqual(self.gateway.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_stats_are_shown_to_staff(self):
+        self.gateway.create_order(100)
+        user = Account.objects.create_user(email='ops@example.com', username='ops', first_name='Op', last_name='S')
+        user.is_active = True
+        user.save()
+        self.client.force_login(user)
+
+        self.assertEqual(self.client.get('/orders/gateway_stats/').status_code, 302)  # to the admin login
+
+        user.is_staff = True
+        user.save()
+        stats = self.client.get('/orders/gateway_stats/').json()
+        self.assertEqual(stats['circuit'], CircuitBreaker.CLOSED)
+        self.assertEqual(stats['operations']['order.create']['calls'], 1)
+
+    def test_refused_connection_is_retried(self):
+        self.server.shutdown()
+        self.server.server_close()  # nothing listens on the port any more
+        with self.assertRaises(GatewayUnavailable):
+            self.gateway.create_order(100)
+        self.assertEqual(self.gateway.stats.snapshot()['order.create']['errors'], 2)
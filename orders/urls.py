@@ -8,4 +8,5 @@ urlpatterns = [
     path('place_order/', views.place_order, name='place_order'),
     path('payments/', views.payments, name='payments'),
     path('order_complete/', views.order_complete, name='order_complete'),
+    path('gateway_stats/', views.gateway_stats, name='gateway_stats'),
 ]
@@ -1,31 +1,45 @@
 from django.shortcuts import render, redirect
-from carts.models import CartItem
+from django.contrib import messages
+from carts.backends import get_cart_store
+from carts.summary import get_cart_summary
+from .checkout import materialize_order
 from .forms import OrderForm
-from .models import Order, Payment, OrderProduct
-import datetime, json
-from store.models import Product
-from django.core.mail import EmailMessage
+from .gateway import GatewayUnavailable, get_gateway
+from .numbers import next_order_number
+from .receipts import display_receipt, get_receipt
+from .reservations import InsufficientStock, release_unpaid, reserve_stock
+from .models import Order, Payment
+import json
+from django.db import transaction
 from django.template.loader import render_to_string
 from django.http import HttpResponseBadRequest, JsonResponse
 
+from core.idempotency import header_key, idempotent
+from core.mail import queue_email
 from core.utils import log_event
 
-import razorpay
 from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
 from core.utils import get_client_ip
 
 # Create your views here.
-def place_order(request, total=0, quantity=0):
+def _place_order_key(request):
+    # checkout.html renders a fresh key into the form, so a double submit sends it twice
+    return header_key(request) or request.POST.get('idempotency_key')
+
+@idempotent('place_order', _place_order_key)
+def place_order(request):
     current_user = request.user
-    cart_items = CartItem.objects.filter(user=current_user)
-    if cart_items.count() <= 0:
+    if current_user.is_authenticated:
+        get_cart_store().flush(current_user)  # the order is built from CartItem rows
+    summary = get_cart_summary(request)
+    if not summary.items:
         return redirect('store')
-    
-    for cart_item in cart_items:
-        total += (cart_item.product.price * cart_item.quantity)
-        quantity += cart_item.quantity
-    tax = (2 * total)/100
-    grand_total = total + tax
+
+    cart_items = summary.items
+    total = summary.total
+    tax = summary.tax
+    grand_total = summary.grand_total
     
     if request.method == "POST":
         form = OrderForm(request.POST)
@@ -44,22 +58,23 @@ def place_order(request, total=0, quantity=0):
             data.state = form.cleaned_data['state']
             data.country = form.cleaned_data['country']
             data.order_note = form.cleaned_data['order_note']
-            data.order_total = grand_total
-            data.tax = tax
+            data.order_total = float(grand_total)
+            data.tax = float(tax)
             data.ip = get_client_ip(request)
-            data.save()
-            # Generating order number
-            yr = int(datetime.date.today().strftime('%Y'))
-            dt = int(datetime.date.today().strftime('%d'))
-            mt = int(datetime.date.today().strftime('%m'))
-            d = datetime.date(yr,mt,dt)
-            current_date = d.strftime("%d%m%Y") #14092025
-            order_number = current_date + str(data.id)
-            data.order_number = order_number
-            data.save()
-
-
-            order = Order.objects.get(user=current_user, is_ordered=False, order_number=order_number)
+            # Order number allocated up front (outside the transaction), so the order is inserted once
+            data.order_number = next_order_number() #14092025 + sequence
+            try:
+                with transaction.atomic():
+                    data.save()
+
+                    # Hold the stock until payment, giving back holds of earlier attempts
+                    release_unpaid(current_user)
+                    reserve_stock(data, cart_items)
+            except InsufficientStock as e:
+                messages.error(request, f"Sorry, not enough stock left for: {e}. Please update your cart.")
+                return redirect('cart')
+
+            order = data
             context = {
                 'order': order,
                 'cart_items': cart_items,
@@ -71,12 +86,20 @@ def place_order(request, total=0, quantity=0):
                 event_type="order_placed",
                 request=request,
                 user=request.user,
-                extra={"order_id": order.id, "total": total, "tax": tax, "grand_total": grand_total}
+                extra={"order_id": order.id, "total": str(total), "tax": str(tax), "grand_total": str(grand_total)}
             )
             return render(request, 'orders/payments.html', context)
     
     return redirect('checkout')
 
+def _payment_key(request):
+    # the gateway's payment id identifies a payment, whoever sends it
+    try:
+        return header_key(request) or json.loads(request.body).get('transID')
+    except (ValueError, AttributeError):
+        return None
+
+@idempotent('payments', _payment_key)
 def payments(request):
     body = json.loads(request.body)
     order = Order.objects.get(user=request.user, is_ordered=False, order_number=body['orderID'])
@@ -89,7 +112,26 @@ def payments(request):
         amount_paid = order.order_total,
         status = body['status'],
     )
-    payment.save()
+    with transaction.atomic():
+        payment.save()
+        if materialize_order(order, payment) is None:
+            # Paid meanwhile by another payment; this one is kept so it can be refunded
+            log_event(
+                event_type="order_already_paid",
+                request=request,
+                user=request.user,
+                extra={"transaction_id": body['transID'], "order_number": order.order_number}
+            )
+            return JsonResponse({'error': 'This order has already been paid.'}, status=409)
+
+        # Queue order recieved email to customer, sent by the send_queued_email worker
+        mail_subject = 'Thank you for your order'
+        message = render_to_string('orders/order_recieved_email.html', {
+            'user': request.user,
+            'order': order,
+        })
+        to_email = request.user.email
+        queue_email(mail_subject, message, [to_email])
 
     log_event(
         event_type="payment_stored_in _db",
@@ -98,52 +140,11 @@ def payments(request):
         extra={"transaction_id": body['transID'], "payment_method": body['payment_method'], "amount_paid": order.order_total}
     )
 
-    order.payment = payment
-    order.is_ordered = True
-    order.save()
-    
-    cart_items = CartItem.objects.filter(user=request.user)
-
-    for item in cart_items:
-        orderproduct = OrderProduct()
-        orderproduct.order_id = order.id
-        orderproduct.payment = payment
-        orderproduct.user_id = request.user.id ## buyer
-        orderproduct.product_id = item.product_id
-        orderproduct.seller_id = item.product.owner.id  # seller assigned
-        orderproduct.quantity = item.quantity
-        orderproduct.product_price = item.product.price
-        orderproduct.ordered = True
-        orderproduct.save()
-
-        cart_item = CartItem.objects.get(id=item.id)
-        product_variation = cart_item.variations.all()
-        orderproduct = OrderProduct.objects.get(id=orderproduct.id)
-        orderproduct.variations.set(product_variation)
-        orderproduct.save()
-
-        product = Product.objects.get(id=item.product_id)
-        product.stock -= item.quantity
-        product.save()
-
-    # Clear cart
-    CartItem.objects.filter(user=request.user).delete()
-
-    # Send order recieved email to customer
-    mail_subject = 'Thank you for your order'
-    message = render_to_string('orders/order_recieved_email.html', {
-        'user': request.user,
-        'order': order,
-    })
-    to_email = request.user.email
-    send_email = EmailMessage(mail_subject, message, to=[to_email])
-    send_email.send()
-
     log_event(
-        event_type="sent_order_recieved_mail",
+        event_type="queued_order_recieved_mail",
         request=request,
         user=request.user,
-        extra={"to_email": to_email, "status": "Successful", "order_number": order.order_number, 'transID': payment.payment_id}
+        extra={"to_email": to_email, "status": "Queued", "order_number": order.order_number, 'transID': payment.payment_id}
     )
 
      # Send order number and transaction id back to sendData method via JsonResponse
@@ -157,72 +158,68 @@ def order_complete(request):
     order_number = request.GET.get('order_number')
     transID = request.GET.get('payment_id')
 
-    try:
-        order = Order.objects.get(order_number=order_number, is_ordered=True)
-        ordered_products = OrderProduct.objects.filter(order_id=order.id)
-
-        subtotal = 0
-        for i in ordered_products:
-            subtotal += i.product_price * i.quantity
-
-        payment = Payment.objects.get(payment_id=transID)
-
-        context = {
-            'order': order,
-            'ordered_products': ordered_products,
-            'order_number': order.order_number,
-            'transID': payment.payment_id,
-            'payment': payment,
-            'subtotal': subtotal,
-        }
-
-        log_event(
-            event_type="order_completed",
-            request=request,
-            user=request.user,
-            extra={
-                'order': order,
-                'ordered_products': ordered_products,
-                'order_number': order.order_number,
-                'transID': payment.payment_id,
-                'payment': payment,
-                'subtotal': subtotal,
-            }
-        )
-        
-        return render(request, 'orders/order_complete.html', context)
-    
-    except (Payment.DoesNotExist, Order.DoesNotExist):
+    # Rendered from the receipt snapshot taken at payment, in one query
+    order = Order.objects.filter(order_number=order_number, is_ordered=True).first()
+    receipt = get_receipt(order) if order else None
+    if not receipt or receipt['payment_id'] != transID:
         log_event(
             event_type="order_not_completed",
             request=request,
             user=request.user,
             extra={
-                'order_number': order.order_number,
-                'transID': payment.payment_id
+                'order_number': order_number,
+                'transID': transID
             }
         )
         return redirect('home')
 
+    context = {
+        'order': order,
+        'receipt': display_receipt(receipt),
+        'order_number': order.order_number,
+        'transID': transID,
+    }
+
+    log_event(
+        event_type="order_completed",
+        request=request,
+        user=request.user,
+        extra={
+            'order_number': order.order_number,
+            'transID': transID,
+            'subtotal_paise': receipt['subtotal_paise'],
+        }
+    )
+
+    return render(request, 'orders/order_complete.html', context)
+
 # -------------------------
 # Razorpay: create order (AJAX) - called from frontend
 # -------------------------
+@idempotent('create_razorpay_order')
 def create_razorpay_order(request):
     try:
         data = json.loads(request.body)
         amount = int(float(data.get("amount")) * 100)
-        client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-        razorpay_order = client.order.create({
-            "amount": amount,
-            "currency": "INR",
-            "payment_capture": 1
-        })
+        razorpay_order = get_gateway().create_order(amount, receipt=data.get("receipt"))
         return JsonResponse({
             "order_id": razorpay_order["id"],
             "amount": razorpay_order["amount"],
             "key": settings.RAZORPAY_KEY_ID
         })
+    except GatewayUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=503)
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=400)
 
-    # return JsonResponse({"error": "Invalid request"}, status=400)
\ No newline at end of file
+    # return JsonResponse({"error": "Invalid request"}, status=400)
+
+
+@staff_member_required
+def gateway_stats(request):
+    # Payment gateway latency and errors as seen by the process serving this request
+    gateway = get_gateway()
+    return JsonResponse({
+        "circuit": gateway.breaker.state,
+        "operations": gateway.stats.snapshot(),
+    })
@@ -0,0 +1,60 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Prefetch
+
+from core.pagination import KeysetPaginator
+from .models import Product, ProductGallery, ReviewRating, Variation
+
+DETAIL_TIMEOUT = 60 * 30
+REVIEWS_PER_PAGE = 10
+REVIEW_ORDERING = ('-updated_at', '-id')
+
+
+def _detail_key(product_slug):
+    return f'store:product_detail:{product_slug}'
+
+
+def review_paginator(product_id):
+    # Approved reviews of a product, newest first, a page at a time
+    reviews = (
+        ReviewRating.objects.filter(product_id=product_id, status=True)
+        .select_related('user')
+        .only('id', 'subject', 'review', 'rating', 'updated_at', 'user', 'user__first_name', 'user__last_name')
+    )
+    return KeysetPaginator(reviews, REVIEWS_PER_PAGE, ordering=REVIEW_ORDERING)
+
+
+def load_product_detail(product_slug):
+    # Everything on the product page that is the same for every visitor:
+    # product + category, gallery, active variations and the first page of reviews.
+    # Four queries on a cache miss, none on a hit. Raises Product.DoesNotExist.
+    key = _detail_key(product_slug)
+    detail = cache.get(key)
+    if detail is None:
+        product = (
+            Product.objects.select_related('category')
+            .prefetch_related(
+                Prefetch('productgallery_set', queryset=ProductGallery.objects.order_by('id'), to_attr='gallery'),
+                Prefetch('variation_set', queryset=Variation.objects.filter(is_active=True), to_attr='active_variations'),
+            )
+            .get(slug=product_slug)
+        )
+        reviews = review_paginator(product.id).get_page()
+        detail = {
+            'product': product,
+            'gallery': product.gallery,
+            'colors': [v for v in product.active_variations if v.variation_category == 'color'],
+            'sizes': [v for v in product.active_variations if v.variation_category == 'size'],
+            'reviews': reviews,
+        }
+        cache.set(key, detail, DETAIL_TIMEOUT)
+    return detail
+
+
+def invalidate_product_detail(*product_slugs):
+    keys = [_detail_key(slug) for slug in product_slugs if slug]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def invalidate_product_detail_by_id(product_id):
+    invalidate_product_detail(*Product.objects.filter(id=product_id).values_list('slug', flat=True))
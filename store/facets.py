@@ -0,0 +1,127 @@
+from collections import namedtuple
+
+from django.db import transaction
+
+from core.cache import bump_version, get_version
+from .models import Product, Variation
+
+FACETS_NAMESPACE = 'store:facets'
+
+# (key, label, min price inclusive, max price exclusive)
+PRICE_RANGES = (
+    ('0-500', 'Under ₹500', 0, 500),
+    ('500-1000', '₹500 - ₹1000', 500, 1000),
+    ('1000-2500', '₹1000 - ₹2500', 1000, 2500),
+    ('2500-5000', '₹2500 - ₹5000', 2500, 5000),
+    ('5000+', '₹5000 & above', 5000, None),
+)
+FACETS = ('price', 'color', 'size')
+
+# What the listing sorts matching products by (store.listing.SORT_OPTIONS)
+FacetRow = namedtuple('FacetRow', ['id', 'price'])
+
+# (version, index) of this process
+_index = (None, None)
+
+
+def _price_range(price):
+    for key, label, low, high in PRICE_RANGES:
+        if price >= low and (high is None or price < high):
+            return key
+    return None
+
+
+def build_facet_index():
+    # Product id sets of every available product, per category and per facet value.
+    # Two queries for the whole catalog.
+    index = {'all': set(), 'rows': {}, 'category': {}, 'price': {}, 'color': {}, 'size': {}}
+    for product_id, category_id, price in Product.objects.filter(is_available=True).values_list('id', 'category_id', 'price'):
+        index['all'].add(product_id)
+        index['rows'][product_id] = FacetRow(product_id, price)
+        index['category'].setdefault(category_id, set()).add(product_id)
+        index['price'].setdefault(_price_range(price), set()).add(product_id)
+
+    variations = Variation.objects.filter(is_active=True, product__is_available=True).values_list(
+        'product_id', 'variation_category', 'variation_value'
+    )
+    for product_id, variation_category, variation_value in variations:
+        if variation_category in index:
+            index[variation_category].setdefault(variation_value.strip().lower(), set()).add(product_id)
+
+    # Freeze so the shared structure can't be modified by a caller
+    index['all'] = frozenset(index['all'])
+    for facet in ('category', *FACETS):
+        index[facet] = {value: frozenset(ids) for value, ids in index[facet].items()}
+    return index
+
+
+def get_facet_index():
+    # Rebuilt in this process only when the shared version changes
+    global _index
+    version = get_version(FACETS_NAMESPACE)
+    cached_version, index = _index
+    if cached_version != version:
+        index = build_facet_index()
+        _index = (version, index)
+    return index
+
+
+def invalidate_facets():
+    transaction.on_commit(lambda: bump_version(FACETS_NAMESPACE))
+
+
+def sort_rows(product_ids):
+    # FacetRows of the matching products, for sorting and paging them in memory
+    rows = get_facet_index()['rows']
+    return [rows[product_id] for product_id in product_ids]
+
+
+def parse_selection(query_dict):
+    # {facet: set of selected values} from ?price=..&color=..&size=..
+    return {facet: {v.strip().lower() for v in query_dict.getlist(facet) if v.strip()} for facet in FACETS}
+
+
+def _union(values):
+    result = set()
+    for ids in values:
+        result |= ids
+    return result
+
+
+def filter_products(category_id, selection):
+    # Set arithmetic over the facet index.
+    # Returns (matching product ids, facet options with counts).
+    # Values of one facet are OR-ed, facets are AND-ed; each facet's counts
+    # apply the other facets' selections so they show what a click would give.
+    index = get_facet_index()
+    base = index['category'].get(category_id, frozenset()) if category_id else index['all']
+
+    selected_sets = {
+        facet: _union(index[facet].get(value, frozenset()) for value in values)
+        for facet, values in selection.items() if values
+    }
+
+    matching = base
+    for ids in selected_sets.values():
+        matching = matching & ids
+
+    facets = {}
+    for facet in FACETS:
+        facet_base = base
+        for other, ids in selected_sets.items():
+            if other != facet:
+                facet_base = facet_base & ids
+
+        if facet == 'price':
+            options = [(key, label) for key, label, low, high in PRICE_RANGES]
+        else:
+            options = [(value, value.capitalize()) for value in sorted(index[facet])]
+
+        facets[facet] = []
+        for value, label in options:
+            count = len(facet_base & index[facet].get(value, frozenset()))
+            selected = value in selection.get(facet, ())
+            if count or selected:
+                facets[facet].append({'value': value, 'label': label, 'count': count, 'selected': selected})
+
+    return matching, facets
@@ -0,0 +1,22 @@
+from django.core.cache import cache
+
+from .models import Product
+
+HOME_FEED_SIZE = 20
+HOME_FEED_CACHE_KEY = 'store:home_feed'
+HOME_FEED_TIMEOUT = 60 * 15  # 15 minutes, changes invalidate it earlier
+
+
+def get_home_feed():
+    # Newest available products for the home page.
+    # One query on a cache miss (rating columns and the page path live on Product),
+    # no queries on a hit.
+    products = cache.get(HOME_FEED_CACHE_KEY)
+    if products is None:
+        products = list(Product.objects.filter(is_available=True).order_by('-created_at')[:HOME_FEED_SIZE])
+        cache.set(HOME_FEED_CACHE_KEY, products, HOME_FEED_TIMEOUT)
+    return products
+
+
+def invalidate_home_feed():
+    cache.delete(HOME_FEED_CACHE_KEY)
@@ -0,0 +1,31 @@
+from django.core.cache import cache
+
+from core.cache import bump_version, versioned_key
+
+LISTING_NAMESPACE = 'store:listing'
+LISTING_COUNT_TIMEOUT = 60 * 10
+PRODUCTS_PER_PAGE = 10
+
+# ?sort= value -> keyset ordering (last field unique)
+SORT_OPTIONS = {
+    'newest': ('-id',),
+    'price_low': ('price', 'id'),
+    'price_high': ('-price', '-id'),
+}
+DEFAULT_SORT = 'newest'
+
+
+def get_ordering(sort):
+    if sort not in SORT_OPTIONS:
+        sort = DEFAULT_SORT
+    return sort, SORT_OPTIONS[sort]
+
+
+def listing_count(queryset, *key_parts):
+    # Cached "N items found" count; exact when computed, refreshed when products change
+    key = versioned_key(LISTING_NAMESPACE, 'count', *key_parts)
+    return cache.get_or_set(key, queryset.count, LISTING_COUNT_TIMEOUT)
+
+
+def invalidate_listings():
+    bump_version(LISTING_NAMESPACE)
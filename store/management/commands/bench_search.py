@@ -0,0 +1,71 @@
+import random
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from category.models import Category
+from core.benchmark import benchmark_database, timed
+from store.models import Product
+from store.search import BACKENDS
+
+VOCABULARY = (
+    'cotton shirt jeans denim jacket leather shoes sneakers running sports casual formal '
+    'slim fit regular printed striped checked solid blue black white red green grey navy '
+    'men women kids summer winter classic premium wireless bluetooth headphones speaker '
+    'watch smart analog digital steel strap backpack travel laptop bag wallet sunglasses'
+).split()
+QUERIES = ('shirt', 'blue denim', 'run', 'wireless head', 'premium leather jacket', 'nothingmatches')
+
+
+class Command(BaseCommand):
+    help = "Benchmark product search backends against the old icontains query on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with benchmark_database():
+            category = Category.objects.create(category_name='Bench', slug='bench')
+            backends = [cls() for cls in BACKENDS.values() if cls.is_available()]
+            seeded = 0
+            for size in sorted(options['sizes']):
+                self._seed(category, seeded, size)
+                seeded = size
+                self.stdout.write(f"\n{size} products")
+                for backend in backends:
+                    backend.rebuild()
+                for query in QUERIES:
+                    row = [f"  {query!r:26}", f"icontains {timed(lambda: self._icontains(query), options['repeat']):8.2f} ms"]
+                    for backend in backends:
+                        elapsed = timed(lambda: self._indexed(backend, query), options['repeat'])
+                        row.append(f"{backend.name} {elapsed:8.2f} ms")
+                    self.stdout.write(' | '.join(row))
+
+    def _seed(self, category, start, end):
+        rng = random.Random(start)
+        batch = []
+        for i in range(start, end):
+            batch.append(Product(
+                product_name=f"{' '.join(rng.sample(VOCABULARY, 3))} {i}",
+                slug=f'bench-{i}',
+                description=' '.join(rng.choices(VOCABULARY, k=30)),
+                price=rng.randint(100, 5000),
+                stock=10,
+                category=category,
+                product_images='photos/products/bench.jpg',
+            ))
+            if len(batch) == 5000:
+                Product.objects.bulk_create(batch)
+                batch = []
+        Product.objects.bulk_create(batch)
+
+    def _icontains(self, keyword):
+        # The old store.views.search query: count plus the first page
+        products = Product.objects.order_by('-created_at').filter(Q(description__icontains=keyword) | Q(product_name__icontains=keyword))
+        products.count()
+        list(products[:10])
+
+    def _indexed(self, backend, keyword):
+        ids = backend.search(keyword, limit=1000)
+        list(Product.objects.in_bulk(ids[:10]).values())
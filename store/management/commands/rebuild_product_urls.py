@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.paths import rebuild_product_paths
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored product page path of every product (run after changing the product URL pattern)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        changed = rebuild_product_paths(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Updated the path of {changed} products."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from store.ratings import rebuild_ratings
+
+
+class Command(BaseCommand):
+    help = "Recompute avg_rating, review_count and the star histogram of every product from ReviewRating."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updated = rebuild_ratings(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {updated} products."))
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:09
+
+import math
+
+from django.db import migrations, models
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Product = apps.get_model('store', 'Product')
+    ReviewRating = apps.get_model('store', 'ReviewRating')
+
+    aggregates = {}
+    for product_id, rating in ReviewRating.objects.filter(status=True).values_list('product_id', 'rating'):
+        row = aggregates.setdefault(product_id, {'count': 0, 'total': 0, 'histogram': {}})
+        star = str(min(max(math.ceil(rating), 1), 5))
+        row['count'] += 1
+        row['total'] += rating
+        row['histogram'][star] = row['histogram'].get(star, 0) + 1
+
+    products = list(Product.objects.filter(id__in=aggregates.keys()))
+    for product in products:
+        row = aggregates[product.id]
+        product.review_count = row['count']
+        product.rating_total = row['total']
+        product.avg_rating = row['total'] / row['count']
+        product.rating_histogram = row['histogram']
+    Product.objects.bulk_update(products, ['avg_rating', 'review_count', 'rating_total', 'rating_histogram'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_product_owner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_rating',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_histogram',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='rating_total',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations
+
+FTS_TABLE = 'store_product_fts'
+PG_INDEX = 'store_product_search_idx'
+PG_DOCUMENT = "to_tsvector('english', coalesce(product_name, '') || ' ' || coalesce(description, ''))"
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                    f"USING fts5(product_name, description, tokenize='porter unicode61')"
+                )
+            except Exception:
+                return  # SQLite built without FTS5, the pure-Python index is used instead
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, product_name, description) "
+                f"SELECT id, product_name, description FROM store_product"
+            )
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {PG_INDEX} ON store_product USING GIN ({PG_DOCUMENT})")
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {PG_INDEX}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_product_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:15
+
+from django.db import migrations, models
+
+
+def backfill_url_path(apps, schema_editor):
+    # The product_detail path as routed when this migration was written, spelled out
+    # so later URLconf changes don't alter history; rebuild_product_urls recomputes
+    # the paths from the current URLconf.
+    Product = apps.get_model('store', 'Product')
+    products = list(Product.objects.select_related('category'))
+    for product in products:
+        product.url_path = f'/store/category/{product.category.slug}/{product.slug}/'
+    Product.objects.bulk_update(products, ['url_path'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='url_path',
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.RunPython(backfill_url_path, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:52
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_product_url_path'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reviewrating',
+            index=models.Index(fields=['product', 'status', '-updated_at', '-id'], name='review_product_page_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+from django.db import migrations
+
+FTS_TABLE = 'store_product_fts'
+
+
+def recreate_fts_table(tokenize):
+    # Prefix queries skip the porter stemmer, so "runn"* missed "running": index the
+    # words unstemmed, with prefix indexes, and stem on the query side instead
+    def recreate(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite' or FTS_TABLE not in connection.introspection.table_names():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {FTS_TABLE}")
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(product_name, description, {tokenize})"
+            )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE} (rowid, product_name, description) "
+                f"SELECT id, product_name, description FROM store_product"
+            )
+    return recreate
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_reviewrating_page_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            recreate_fts_table("tokenize='unicode61', prefix='2 3'"),
+            recreate_fts_table("tokenize='porter unicode61'"),
+        ),
+    ]
@@ -2,7 +2,6 @@ from django.db import models
 from category.models import Category
 from django.urls import reverse
 from accounts.models import Account
-from django.db.models import Avg, Count
 
 from django.conf import settings
 
@@ -21,25 +20,37 @@ class Product(models.Model):
 
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True)
 
-    def get_url(self):
+    ## Canonical product page path, kept in sync on save and by store.paths
+    url_path         = models.CharField(max_length=255, blank=True, editable=False)
+
+    ## Denormalized review aggregates, kept in sync by store.ratings
+    avg_rating       = models.FloatField(default=0, editable=False)
+    review_count     = models.IntegerField(default=0, editable=False)
+    rating_total     = models.FloatField(default=0, editable=False)
+    rating_histogram = models.JSONField(default=dict, blank=True, editable=False)  # {"1": n, ..., "5": n}
+
+    def build_url_path(self):
         return reverse('product_detail', args=[self.category.slug, self.slug])
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'slug', 'category'}.intersection(update_fields):
+            self.url_path = self.build_url_path()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'url_path'}
+        super().save(*args, **kwargs)
+
+    def get_url(self):
+        return self.url_path
+
     def __str__(self):
         return self.product_name
     
     def averageReview(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(average=Avg('rating'))
-        avg = 0
-        if reviews['average'] is not None:
-            avg = float(reviews['average'])
-        return avg
+        return self.avg_rating
     
     def countReview(self):
-        reviews = ReviewRating.objects.filter(product=self, status=True).aggregate(count=Count('id'))
-        count = 0
-        if reviews['count'] is not None:
-            count = int(reviews['count'])
-        return count
+        return self.review_count
 
 class VariationManager(models.Manager):
     def colors(self):
@@ -83,6 +94,12 @@ class ReviewRating(models.Model):
     def __str__(self):
         return self.subject
 
+    class Meta:
+        indexes = [
+            # Review pages on the product page, see store.detail
+            models.Index(fields=['product', 'status', '-updated_at', '-id'], name='review_product_page_idx'),
+        ]
+
 
 class ProductGallery(models.Model):
     product = models.ForeignKey(Product, default=None, on_delete=models.CASCADE)
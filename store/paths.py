@@ -0,0 +1,24 @@
+from .models import Product
+
+
+def rebuild_product_paths(queryset=None, batch_size=500):
+    # Recompute Product.url_path in bulk, e.g. after a category slug change.
+    # Returns the number of products whose path changed.
+    if queryset is None:
+        queryset = Product.objects.all()
+
+    changed = 0
+    batch = []
+    for product in queryset.select_related('category').only('id', 'slug', 'url_path', 'category__slug').iterator(chunk_size=batch_size):
+        path = product.build_url_path()
+        if path != product.url_path:
+            product.url_path = path
+            batch.append(product)
+        if len(batch) >= batch_size:
+            Product.objects.bulk_update(batch, ['url_path'])
+            changed += len(batch)
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ['url_path'])
+        changed += len(batch)
+    return changed
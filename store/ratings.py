@@ -0,0 +1,100 @@
+import math
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+
+from .models import Product, ReviewRating
+
+STARS = ('1', '2', '3', '4', '5')
+
+
+def star_bucket(rating):
+    # Half stars round up into the next bucket: 0.5 -> 1, 4.5 -> 5
+    star = min(max(math.ceil(rating), 1), 5)
+    return str(star)
+
+
+def _bucket_filter(star):
+    # SQL equivalent of star_bucket()
+    if star == '1':
+        return Q(rating__lte=1)
+    return Q(rating__gt=int(star) - 1, rating__lte=int(star))
+
+
+def apply_rating_change(product_id, added=None, removed=None):
+    # Incrementally adjust the rating aggregates of one product.
+    # added / removed: rating value of a visible review that appeared / disappeared
+    if added is None and removed is None:
+        return
+
+    with transaction.atomic():
+        product = (
+            Product.objects.select_for_update()
+            .only('id', 'avg_rating', 'review_count', 'rating_total', 'rating_histogram')
+            .filter(id=product_id)
+            .first()
+        )
+        if product is None:  # product is being deleted
+            return
+
+        histogram = dict(product.rating_histogram or {})
+        if removed is not None:
+            product.review_count -= 1
+            product.rating_total -= removed
+            bucket = star_bucket(removed)
+            histogram[bucket] = histogram.get(bucket, 0) - 1
+            if histogram[bucket] <= 0:
+                del histogram[bucket]
+        if added is not None:
+            product.review_count += 1
+            product.rating_total += added
+            bucket = star_bucket(added)
+            histogram[bucket] = histogram.get(bucket, 0) + 1
+
+        if product.review_count <= 0:
+            product.review_count = 0
+            product.rating_total = 0
+            product.avg_rating = 0
+        else:
+            product.avg_rating = product.rating_total / product.review_count
+        product.rating_histogram = histogram
+        product.save(update_fields=['avg_rating', 'review_count', 'rating_total', 'rating_histogram'])
+
+
+def rebuild_ratings(batch_size=500):
+    # Recompute the aggregates of every product from ReviewRating in bulk.
+    # Returns the number of products updated.
+    buckets = {f'star_{star}': Count('id', filter=_bucket_filter(star)) for star in STARS}
+    aggregates = {
+        row['product_id']: row
+        for row in ReviewRating.objects.filter(status=True)
+        .values('product_id')
+        .annotate(count=Count('id'), total=Sum('rating'), **buckets)
+        .order_by()
+    }
+
+    updated = 0
+    batch = []
+    for product in Product.objects.only('id').iterator(chunk_size=batch_size):
+        row = aggregates.get(product.id)
+        if row:
+            product.review_count = row['count']
+            product.rating_total = row['total'] or 0
+            product.avg_rating = product.rating_total / product.review_count
+            product.rating_histogram = {star: row[f'star_{star}'] for star in STARS if row[f'star_{star}']}
+        else:
+            product.review_count = 0
+            product.rating_total = 0
+            product.avg_rating = 0
+            product.rating_histogram = {}
+        batch.append(product)
+
+        if len(batch) >= batch_size:
+            Product.objects.bulk_update(batch, ['avg_rating', 'review_count', 'rating_total', 'rating_histogram'])
+            updated += len(batch)
+            batch = []
+
+    if batch:
+        Product.objects.bulk_update(batch, ['avg_rating', 'review_count', 'rating_total', 'rating_histogram'])
+        updated += len(batch)
+    return updated
@@ -0,0 +1,36 @@
+from django.conf import settings
+
+from .backends import (
+    InvertedIndexBackend,
+    PostgresSearchBackend,
+    SearchBackend,
+    SQLiteFTSBackend,
+)
+
+BACKENDS = {
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+    PostgresSearchBackend.name: PostgresSearchBackend,
+    InvertedIndexBackend.name: InvertedIndexBackend,
+}
+
+# Tried in this order when SEARCH_BACKEND is "auto"
+AUTO_ORDER = (SQLiteFTSBackend, PostgresSearchBackend, InvertedIndexBackend)
+
+_backend = None
+
+
+def get_search_backend():
+    # One backend instance per process, picked from settings.SEARCH_BACKEND
+    global _backend
+    if _backend is None:
+        name = getattr(settings, 'SEARCH_BACKEND', 'auto')
+        if name == 'auto':
+            backend_class = next(cls for cls in AUTO_ORDER if cls.is_available())
+        else:
+            backend_class = BACKENDS[name]
+        _backend = backend_class()
+    return _backend
+
+
+def search_products(query, limit=None):
+    return get_search_backend().search(query, limit=limit)
@@ -0,0 +1,332 @@
+import bisect
+import math
+import threading
+import uuid
+from collections import defaultdict
+
+from django.core.cache import cache
+from django.db import connection
+
+from store.models import Product
+from .text import TOKEN_RE, stem, tokenize, words
+
+FTS_TABLE = 'store_product_fts'
+
+
+class SearchBackend:
+    # Common interface of the product search backends.
+    # search() returns product ids, best match first.
+    name = None
+
+    def search(self, query, limit=None):
+        raise NotImplementedError
+
+    def index_product(self, product):
+        pass
+
+    def remove_product(self, product_id):
+        pass
+
+    def rebuild(self):
+        raise NotImplementedError
+
+
+def query_terms(query):
+    # Each word with its stem, as the inverted index matches them: "runn" finds
+    # "running" through "run", "batteries" finds "battery" through "battery"
+    return [(term, stem(term)) for term in TOKEN_RE.findall((query or '').lower())]
+
+
+class SQLiteFTSBackend(SearchBackend):
+    # SQLite FTS5 table keyed by product id, ranked with bm25. Words are indexed as
+    # they are (unicode61, with prefix indexes) and stemming happens on the query
+    # side, since prefix queries don't go through a stemming tokenizer.
+    # The table is created by store migrations 0013 and 0016.
+    name = 'sqlite_fts5'
+    NAME_WEIGHT = 10.0
+    DESCRIPTION_WEIGHT = 1.0
+
+    @classmethod
+    def is_available(cls):
+        return connection.vendor == 'sqlite' and FTS_TABLE in connection.introspection.table_names()
+
+    def _match_expression(self, query):
+        # Every word must match, each as a prefix of itself or of its stem:
+        # "cott runn" -> "cott"* AND ("runn"* OR "run"*)
+        return ' AND '.join(
+            f'"{term}"*' if stemmed == term else f'("{term}"* OR "{stemmed}"*)'
+            for term, stemmed in query_terms(query)
+        )
+
+    def search(self, query, limit=None):
+        expression = self._match_expression(query)
+        if not expression:
+            return []
+        sql = (
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s)'
+        )
+        params = [expression, self.NAME_WEIGHT, self.DESCRIPTION_WEIGHT]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def index_product(self, product):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product.id])
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, product_name, description) VALUES (%s, %s, %s)',
+                [product.id, product.product_name, product.description],
+            )
+
+    def remove_product(self, product_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [product_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, product_name, description) '
+                f'SELECT id, product_name, description FROM {Product._meta.db_table}'
+            )
+            cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+            return cursor.fetchone()[0]
+
+
+class PostgresSearchBackend(SearchBackend):
+    # tsvector expression with a GIN index (store migration 0013).
+    # Postgres keeps the index up to date itself, so there is nothing to do on save/delete.
+    name = 'postgres'
+    DOCUMENT = "to_tsvector('english', coalesce(product_name, '') || ' ' || coalesce(description, ''))"
+
+    @classmethod
+    def is_available(cls):
+        return connection.vendor == 'postgresql'
+
+    def _tsquery(self, query):
+        # Every word must match, each as a prefix of itself or of its stem:
+        # "cott runn" -> "cott:* & (runn:* | run:*)"
+        return ' & '.join(
+            f'{term}:*' if stemmed == term else f'({term}:* | {stemmed}:*)'
+            for term, stemmed in query_terms(query)
+        )
+
+    def search(self, query, limit=None):
+        tsquery = self._tsquery(query)
+        if not tsquery:
+            return []
+        sql = (
+            f'SELECT id FROM {Product._meta.db_table} '
+            f"WHERE {self.DOCUMENT} @@ to_tsquery('english', %s) "
+            f"ORDER BY ts_rank({self.DOCUMENT}, to_tsquery('english', %s)) DESC, id DESC"
+        )
+        params = [tsquery, tsquery]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def rebuild(self):
+        return Product.objects.count()
+
+
+class InvertedIndexBackend(SearchBackend):
+    # Pure-Python fallback: in-process inverted index ranked with BM25.
+    # Built lazily from the database. A save/delete updates this process's copy
+    # and is appended to a change log in the shared cache (a sequence number and
+    # one key per change), so other workers re-read just the changed products on
+    # their next search. They rebuild everything only when they fell too far
+    # behind, the log was evicted, or rebuild() started a new generation.
+    name = 'inverted_index'
+    GENERATION_CACHE_KEY = 'store:search_index_generation'
+    SEQUENCE_CACHE_KEY = 'store:search_index_sequence'
+    CHANGE_CACHE_KEY = 'store:search_index_change:{}'
+    CHANGE_TIMEOUT = 60 * 60 * 24
+    MAX_CATCH_UP = 500  # more changes than this: rebuild instead
+    NAME_WEIGHT = 3
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._generation = None
+        self._sequence = 0
+        self._postings = {}       # term -> {product_id: weighted term frequency}
+        self._doc_terms = {}      # product_id -> {term: weighted term frequency}
+        self._doc_length = {}     # product_id -> weighted length
+        self._total_length = 0
+        self._vocabulary = []     # sorted terms, for prefix lookups
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    ## Index maintenance
+    def _document_terms(self, product_name, description):
+        terms = defaultdict(int)
+        for term in tokenize(product_name):
+            terms[term] += self.NAME_WEIGHT
+        for term in tokenize(description):
+            terms[term] += 1
+        return terms
+
+    def _add(self, product_id, product_name, description):
+        terms = self._document_terms(product_name, description)
+        self._doc_terms[product_id] = terms
+        self._doc_length[product_id] = sum(terms.values())
+        self._total_length += self._doc_length[product_id]
+        for term, frequency in terms.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._vocabulary, term)
+            postings[product_id] = frequency
+
+    def _remove(self, product_id):
+        terms = self._doc_terms.pop(product_id, None)
+        if terms is None:
+            return
+        self._total_length -= self._doc_length.pop(product_id)
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                del self._vocabulary[bisect.bisect_left(self._vocabulary, term)]
+
+    def _load(self):
+        self._postings, self._doc_terms, self._doc_length = {}, {}, {}
+        self._total_length = 0
+        self._vocabulary = []
+        rows = Product.objects.values_list('id', 'product_name', 'description').iterator(chunk_size=2000)
+        for product_id, product_name, description in rows:
+            terms = self._document_terms(product_name, description)
+            self._doc_terms[product_id] = terms
+            self._doc_length[product_id] = sum(terms.values())
+            self._total_length += self._doc_length[product_id]
+            for term, frequency in terms.items():
+                self._postings.setdefault(term, {})[product_id] = frequency
+        self._vocabulary = sorted(self._postings)
+
+    ## Change log shared by the workers
+    def _shared_generation(self):
+        generation = cache.get(self.GENERATION_CACHE_KEY)
+        if generation is None:
+            cache.add(self.GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+            generation = cache.get(self.GENERATION_CACHE_KEY)
+        return generation
+
+    def _shared_sequence(self):
+        return cache.get(self.SEQUENCE_CACHE_KEY) or 0
+
+    def _publish(self, product_id):
+        try:
+            cache.add(self.SEQUENCE_CACHE_KEY, 0, None)
+            sequence = cache.incr(self.SEQUENCE_CACHE_KEY)
+        except ValueError:  # the counter was evicted meanwhile: make everyone rebuild
+            cache.set(self.GENERATION_CACHE_KEY, uuid.uuid4().hex, None)
+            return
+        cache.set(self.CHANGE_CACHE_KEY.format(sequence), product_id, self.CHANGE_TIMEOUT)
+        if sequence == self._sequence + 1:
+            self._sequence = sequence  # already applied here; otherwise catch up with the others first
+
+    def _reload(self, generation):
+        sequence = self._shared_sequence()  # read first: changes made during the load are applied again later
+        self._load()
+        self._generation, self._sequence = generation, sequence
+
+    def _ensure_fresh(self):
+        generation = self._shared_generation()
+        if generation != self._generation:
+            self._reload(generation)
+            return
+        sequence = self._shared_sequence()
+        if sequence == self._sequence:
+            return
+        if not 0 < sequence - self._sequence <= self.MAX_CATCH_UP:
+            self._reload(generation)
+            return
+        keys = [self.CHANGE_CACHE_KEY.format(n) for n in range(self._sequence + 1, sequence + 1)]
+        changes = cache.get_many(keys)
+        if len(changes) < len(keys):  # evicted, or not written yet
+            self._reload(generation)
+            return
+        product_ids = set(changes.values())
+        for product_id in product_ids:
+            self._remove(product_id)
+        for product_id, product_name, description in Product.objects.filter(id__in=product_ids).values_list('id', 'product_name', 'description'):
+            self._add(product_id, product_name, description)
+        self._sequence = sequence
+
+    def index_product(self, product):
+        with self._lock:
+            self._ensure_fresh()
+            self._remove(product.id)
+            self._add(product.id, product.product_name, product.description)
+            self._publish(product.id)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._ensure_fresh()
+            self._remove(product_id)
+            self._publish(product_id)
+
+    def rebuild(self):
+        with self._lock:
+            generation = uuid.uuid4().hex
+            cache.set(self.GENERATION_CACHE_KEY, generation, None)
+            self._reload(generation)
+            return len(self._doc_terms)
+
+    ## Querying
+    def _expand(self, word):
+        # Exact stem plus every indexed term the typed word is a prefix of
+        terms = set()
+        stemmed = tokenize(word)
+        if stemmed and stemmed[0] in self._postings:
+            terms.add(stemmed[0])
+        start = bisect.bisect_left(self._vocabulary, word)
+        for term in self._vocabulary[start:]:
+            if not term.startswith(word):
+                break
+            terms.add(term)
+        return terms
+
+    def search(self, query, limit=None):
+        query_words = words(query)
+        if not query_words:
+            return []
+
+        with self._lock:
+            self._ensure_fresh()
+            total_docs = len(self._doc_terms)
+            if not total_docs:
+                return []
+            average_length = self._total_length / total_docs
+
+            scores = None
+            for word in query_words:
+                word_scores = defaultdict(float)
+                for term in self._expand(word):
+                    postings = self._postings[term]
+                    idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for product_id, frequency in postings.items():
+                        norm = self.K1 * (1 - self.B + self.B * self._doc_length[product_id] / average_length)
+                        word_scores[product_id] += idf * frequency * (self.K1 + 1) / (frequency + norm)
+
+                # Every word has to match
+                if scores is None:
+                    scores = word_scores
+                else:
+                    scores = {pid: score + word_scores[pid] for pid, score in scores.items() if pid in word_scores}
+                if not scores:
+                    return []
+
+        ranked = sorted(scores, key=lambda pid: (-scores[pid], -pid))
+        return ranked[:limit] if limit else ranked
@@ -0,0 +1,38 @@
+import re
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+STOPWORDS = frozenset((
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is', 'it',
+    'of', 'on', 'or', 'that', 'the', 'this', 'to', 'with',
+))
+
+# Longest suffix first; (suffix, replacement)
+SUFFIXES = (
+    ('ational', 'ate'), ('ization', 'ize'), ('fulness', 'ful'), ('ousness', 'ous'),
+    ('iveness', 'ive'), ('ement', ''), ('ment', ''), ('ness', ''), ('ings', ''),
+    ('ing', ''), ('ies', 'y'), ('ied', 'y'), ('edly', ''), ('ed', ''), ('ly', ''),
+    ('es', ''), ('s', ''),
+)
+
+
+def words(text):
+    # Lowercased raw words, stopwords kept out
+    return [w for w in TOKEN_RE.findall((text or '').lower()) if w not in STOPWORDS]
+
+
+def stem(word):
+    # Light suffix stripping stemmer, enough to match "shirts"/"shirt", "running"/"run".
+    # Never shortens a word below three characters.
+    for suffix, replacement in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) + len(replacement) >= 3:
+            word = word[:len(word) - len(suffix)] + replacement
+            break
+    # running -> runn -> run
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in 'lsz':
+        word = word[:-1]
+    return word
+
+
+def tokenize(text):
+    return [stem(w) for w in words(text)]
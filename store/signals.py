@@ -0,0 +1,154 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from category.models import Category
+from .detail import invalidate_product_detail, invalidate_product_detail_by_id
+from .facets import invalidate_facets
+from .feed import invalidate_home_feed
+from .listing import invalidate_listings
+from .models import Product, ProductGallery, ReviewRating, Variation
+from .paths import rebuild_product_paths
+from .ratings import apply_rating_change
+from .search import get_search_backend
+from .variations import invalidate_variation_map
+
+
+## Review rating aggregates
+@receiver(pre_save, sender=ReviewRating)
+def remember_previous_rating(sender, instance, **kwargs):
+    # Keep the stored version so post_save can apply only the difference
+    instance._previous_rating = None
+    if instance.pk:
+        instance._previous_rating = (
+            ReviewRating.objects.filter(pk=instance.pk).values('product_id', 'rating', 'status').first()
+        )
+
+
+@receiver(post_save, sender=ReviewRating)
+def update_rating_on_save(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_previous_rating', None)
+    added = instance.rating if instance.status else None
+
+    if previous and previous['status']:
+        if previous['product_id'] != instance.product_id:
+            apply_rating_change(previous['product_id'], removed=previous['rating'])
+        elif added is not None and previous['rating'] == added:
+            return  # nothing that affects the aggregates changed
+        else:
+            apply_rating_change(instance.product_id, added=added, removed=previous['rating'])
+            return
+
+    apply_rating_change(instance.product_id, added=added)
+
+
+@receiver(post_delete, sender=ReviewRating)
+def update_rating_on_delete(sender, instance, **kwargs):
+    if instance.status:
+        apply_rating_change(instance.product_id, removed=instance.rating)
+
+
+## Home feed cache
+# Rating changes re-save the Product, so reviews are covered by the Product receivers
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_home_feed_on_change(sender, **kwargs):
+    transaction.on_commit(invalidate_home_feed)
+
+
+## Search index
+SEARCH_FIELDS = {'product_name', 'description'}
+
+
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not SEARCH_FIELDS.intersection(update_fields):
+        return  # e.g. rating or stock updates
+    transaction.on_commit(lambda: get_search_backend().index_product(instance))
+
+
+@receiver(post_delete, sender=Product)
+def remove_product_from_index(sender, instance, **kwargs):
+    product_id = instance.id
+    transaction.on_commit(lambda: get_search_backend().remove_product(product_id))
+
+
+## Store listing counts
+LISTING_FIELDS = {'is_available', 'category'}
+
+
+@receiver(post_save, sender=Product)
+def invalidate_listings_on_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not LISTING_FIELDS.intersection(update_fields):
+        return
+    transaction.on_commit(invalidate_listings)
+
+
+@receiver(post_delete, sender=Product)
+def invalidate_listings_on_delete(sender, **kwargs):
+    transaction.on_commit(invalidate_listings)
+
+
+## Facet index
+FACET_FIELDS = {'is_available', 'category', 'price'}
+
+
+@receiver(post_save, sender=Product)
+def invalidate_facets_on_product_save(sender, instance, update_fields=None, **kwargs):
+    if update_fields and not FACET_FIELDS.intersection(update_fields):
+        return
+    invalidate_facets()
+
+
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def invalidate_facets_on_change(sender, **kwargs):
+    invalidate_facets()
+
+
+## Product detail cache
+@receiver(pre_save, sender=Product)
+def remember_previous_slug(sender, instance, update_fields=None, **kwargs):
+    instance._previous_slug = None
+    if instance.pk and (not update_fields or 'slug' in update_fields):
+        instance._previous_slug = Product.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_detail_on_product_change(sender, instance, **kwargs):
+    invalidate_product_detail(instance.slug, getattr(instance, '_previous_slug', None))
+
+
+@receiver(post_save, sender=ProductGallery)
+@receiver(post_delete, sender=ProductGallery)
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+@receiver(post_save, sender=ReviewRating)
+@receiver(post_delete, sender=ReviewRating)
+def invalidate_detail_on_related_change(sender, instance, **kwargs):
+    invalidate_product_detail_by_id(instance.product_id)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_detail_on_category_change(sender, instance, **kwargs):
+    # The cached page carries the category slug used to validate the URL
+    invalidate_product_detail(*Product.objects.filter(category_id=instance.pk).values_list('slug', flat=True))
+
+
+## Stored product paths
+@receiver(post_save, sender=Category)
+def rebuild_paths_on_category_save(sender, instance, created, **kwargs):
+    if not created:
+        rebuild_product_paths(Product.objects.filter(category=instance))
+
+
+## Variation lookup map
+@receiver(post_save, sender=Variation)
+@receiver(post_delete, sender=Variation)
+def invalidate_variation_map_on_change(sender, instance, **kwargs):
+    invalidate_variation_map(instance.product_id)
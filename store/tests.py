@@ -1,3 +1,367 @@
+import importlib
+import re
+from unittest import mock
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connection
+from django.http import QueryDict
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Account
+from category.models import Category
+from .detail import REVIEWS_PER_PAGE, load_product_detail
+from .facets import filter_products, parse_selection
+from .feed import get_home_feed
+from .listing import PRODUCTS_PER_PAGE
+from .models import Product, ProductGallery, ReviewRating, Variation
+from .ratings import rebuild_ratings
+from .search.backends import InvertedIndexBackend, SQLiteFTSBackend
+from .variations import get_variation_map, resolve_variations
 
 # Create your tests here.
+
+
+def selection(**values):
+    return {facet: set(values.get(facet, ())) for facet in ('price', 'color', 'size')}
+
+
+class FacetTest(TestCase):
+    def setUp(self):
+        # Signals refresh the facet index when the transaction commits
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+            self.red_m = self.product('red-m', 300, color='red', size='m')
+            self.red_l = self.product('red-l', 800, color='red', size='l')
+            self.blue_m = self.product('blue-m', 1200, color='blue', size='m')
+            self.green_m = self.product('green-m', 400, color='green', size='m')
+
+    def product(self, slug, price, **variations):
+        product = Product.objects.create(product_name=slug, slug=slug, price=price, stock=5, category=self.category)
+        for category, value in variations.items():
+            Variation.objects.create(product=product, variation_category=category, variation_value=value)
+        return product
+
+    def test_values_of_a_facet_are_or_ed_and_facets_and_ed(self):
+        matching, facets = filter_products(None, selection(color={'red', 'blue'}, size={'m'}))
+
+        self.assertEqual(matching, {self.red_m.id, self.blue_m.id})
+        colors = {option['value']: option['count'] for option in facets['color']}
+        self.assertEqual(colors, {'blue': 1, 'green': 1, 'red': 1})  # counts apply the size selection only
+        sizes = {option['value']: option['count'] for option in facets['size']}
+        self.assertEqual(sizes, {'l': 1, 'm': 2})
+
+    def test_price_ranges(self):
+        matching, _ = filter_products(self.category.id, selection(price={'0-500'}))
+        self.assertEqual(matching, {self.red_m.id, self.green_m.id})
+
+    def test_index_follows_product_and_variation_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Variation.objects.create(product=self.green_m, variation_category='color', variation_value='Red')
+        self.assertIn(self.green_m.id, filter_products(None, selection(color={'red'}))[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.red_m.price = 3000
+            self.red_m.save()
+        self.assertEqual(filter_products(None, selection(price={'2500-5000'}))[0], {self.red_m.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.blue_m.is_available = False
+            self.blue_m.save()
+        self.assertEqual(filter_products(None, selection(size={'m'}))[0], {self.red_m.id, self.green_m.id})
+
+    def test_parse_selection(self):
+        self.assertEqual(parse_selection(QueryDict('color=Red&color=+blue&size=')), selection(color={'red', 'blue'}))
+
+
+class FilteredListingTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(category_name='Shirts', slug='shirts')
+            self.products = Product.objects.bulk_create(
+                Product(product_name=f'Shirt {i}', slug=f'shirt-{i}', price=(i * 37) % 900 + 100, stock=5, category=category,
+                        product_images='photos/products/shirt.jpg')
+                for i in range(25)
+            )
+            Variation.objects.bulk_create(
+                Variation(product=product, variation_category='color', variation_value='red') for product in self.products
+            )
+            Product.objects.create(product_name='Plain', slug='plain', price=50, stock=5, category=category,
+                                   product_images='photos/products/plain.jpg')  # not red
+
+    def test_pages_are_sorted_in_memory_and_fetched_by_id(self):
+        seen = []
+        params = {'color': 'red', 'sort': 'price_low'}
+        while True:
+            with CaptureQueriesContext(connection) as captured:
+                response = self.client.get('/store/', params)
+            page = response.context['products']
+            seen += [product.id for product in page]
+            self.assertEqual(response.context['products_count'], 25)
+            # Only the ids of the page go to the database, not the whole match set
+            for query in captured.captured_queries:
+                for ids in re.findall(r'"store_product"\."id" IN \(([^)]*)\)', query['sql']):
+                    self.assertLessEqual(len(ids.split(',')), PRODUCTS_PER_PAGE)
+            if not page.has_next:
+                break
+            params['cursor'] = page.next_cursor
+
+        expected = sorted(self.products, key=lambda product: (product.price, product.id))
+        self.assertEqual(seen, [product.id for product in expected])
+
+        previous = self.client.get('/store/', {**params, 'cursor': page.previous_cursor}).context['products']
+        self.assertEqual([product.id for product in previous], [product.id for product in expected[10:20]])
+
+
+class InvertedIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()  # the shared change log
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.category = category
+        self.cotton = self.product('Cotton Shirt', 'Soft shirt for summer')
+        self.linen = self.product('Linen Trousers', 'Pairs well with a cotton shirt')
+        self.running = self.product('Running Shoes', 'Light shoes')
+
+    def product(self, name, description):
+        return Product.objects.create(product_name=name, slug=name.lower().replace(' ', '-'), description=description,
+                                      price=100, stock=5, category=self.category)
+
+    def test_ranking(self):
+        backend = InvertedIndexBackend()
+
+        self.assertEqual(backend.search('cotton shirt'), [self.cotton.id, self.linen.id])  # name beats description
+        self.assertEqual(backend.search('shirts'), [self.cotton.id, self.linen.id])  # stemmed
+        self.assertEqual(backend.search('run'), [self.running.id])
+        self.assertEqual(backend.search('cott'), [self.cotton.id, self.linen.id])  # prefix
+        self.assertEqual(backend.search('cotton shoes'), [])  # every word has to match
+        self.assertEqual(backend.search('the'), [])
+        self.assertEqual(backend.search('shirt', limit=1), [self.cotton.id])
+
+    def test_other_workers_apply_changes_without_rebuilding(self):
+        worker_a, worker_b = InvertedIndexBackend(), InvertedIndexBackend()
+        worker_a.search('shirt')
+        worker_b.search('shirt')
+
+        self.running.product_name = 'Running Shirt'
+        self.running.save()
+        worker_a.index_product(self.running)
+        worker_a.remove_product(self.linen.id)
+        self.linen.delete()
+
+        with mock.patch.object(worker_b, '_load') as load:
+            self.assertEqual(worker_b.search('shirt'), [self.cotton.id, self.running.id])
+            self.assertEqual(worker_a.search('shirt'), [self.cotton.id, self.running.id])
+        load.assert_not_called()
+
+    def test_rebuild_makes_every_worker_reload(self):
+        worker_a, worker_b = InvertedIndexBackend(), InvertedIndexBackend()
+        worker_b.search('shirt')
+        Product.objects.filter(id=self.running.id).update(product_name='Running Shirt')  # no signals
+
+        self.assertEqual(worker_a.rebuild(), 3)
+        self.assertEqual(worker_b.search('shirt'), [self.cotton.id, self.running.id, self.linen.id])
+
+
+class SQLiteFTSBackendTest(TestCase):
+    product = InvertedIndexTest.product
+
+    def setUp(self):
+        if not SQLiteFTSBackend.is_available():
+            self.skipTest('needs SQLite with FTS5')
+        InvertedIndexTest.setUp(self)
+
+    def test_same_matches_as_the_inverted_index(self):
+        fts, inverted = SQLiteFTSBackend(), InvertedIndexBackend()
+        fts.rebuild()
+
+        for query in ('runn', 'running', 'run', 'shirts', 'cott', 'cotton shirt', 'trousers', 'light shoes', 'cotton shoes'):
+            with self.subTest(query):
+                self.assertEqual(set(fts.search(query)), set(inverted.search(query)))
+        self.assertEqual(fts.search('runn'), [self.running.id])
+        self.assertEqual(fts.search('cotton shirt'), [self.cotton.id, self.linen.id])  # name beats description
+
+
+class SearchViewTest(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            category = Category.objects.create(category_name='Shirts', slug='shirts')
+            for i in range(5):
+                Product.objects.create(product_name=f'Shirt {i}', slug=f'shirt-{i}', price=100, stock=5,
+                                       category=category, product_images='photos/products/shirt.jpg')
+
+    def test_count_shows_when_results_were_capped(self):
+        self.assertEqual(self.client.get('/store/search/', {'keyword': 'shirt'}).context['products_count'], 5)
+        with mock.patch('store.views.SEARCH_RESULT_LIMIT', 3):
+            response = self.client.get('/store/search/', {'keyword': 'shirt'})
+        self.assertEqual(response.context['products_count'], '3+')
+        self.assertContains(response, '<b>3+</b> Items found')
+
+
+class ProductDetailTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.product = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=self.category,
+                                              product_images='photos/products/shirt.jpg')
+        ProductGallery.objects.create(product=self.product, image='store/products/shirt.jpg')
+        Variation.objects.create(product=self.product, variation_category='color', variation_value='red')
+        Variation.objects.create(product=self.product, variation_category='size', variation_value='m')
+        reviewer = Account.objects.create_user(email='r@example.com', username='r', first_name='Re', last_name='Viewer')
+        ReviewRating.objects.bulk_create(
+            ReviewRating(product=self.product, user=reviewer, subject=f'Review {i}', rating=4) for i in range(25)
+        )
+        # Same updated_at for many rows: the id breaks the ties
+        self.reviews = list(ReviewRating.objects.order_by('-updated_at', '-id').values_list('subject', flat=True))
+
+    def test_detail_is_loaded_in_four_queries_then_cached(self):
+        with self.assertNumQueries(4):
+            detail = load_product_detail('shirt')
+        with self.assertNumQueries(0):
+            load_product_detail('shirt')
+
+        self.assertEqual(detail['product'], self.product)
+        self.assertEqual(len(detail['gallery']), 1)
+        self.assertEqual([v.variation_value for v in detail['colors']], ['red'])
+        self.assertEqual([v.variation_value for v in detail['sizes']], ['m'])
+        self.assertEqual([review.subject for review in detail['reviews']], self.reviews[:REVIEWS_PER_PAGE])
+
+    def test_every_review_can_be_reached(self):
+        url = '/store/category/shirts/shirt/'
+        seen = []
+        response = self.client.get(url)
+        while True:
+            reviews = response.context['reviews']
+            seen += [review.subject for review in reviews]
+            if not reviews.has_next:
+                break
+            response = self.client.get(url, {'reviews': reviews.next_cursor})
+        self.assertEqual(seen, self.reviews)
+
+        newer = self.client.get(url, {'reviews': reviews.previous_cursor}).context['reviews']
+        self.assertEqual([review.subject for review in newer], self.reviews[10:20])
+
+    def test_product_under_another_category_is_not_found(self):
+        Category.objects.create(category_name='Shoes', slug='shoes')
+        self.assertEqual(self.client.get('/store/category/shoes/shirt/').status_code, 404)
+        self.assertEqual(self.client.get('/store/category/shirts/missing/').status_code, 404)
+        self.assertEqual(self.client.get('/store/category/shirts/shirt/').status_code, 200)
+
+
+class RatingAggregateTest(TestCase):
+    def setUp(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=category)
+        self.shoe = Product.objects.create(product_name='Shoe', slug='shoe', price=100, stock=5, category=category)
+        self.user = Account.objects.create_user(email='r@example.com', username='r', first_name='Re', last_name='Viewer')
+
+    def aggregates(self):
+        return {
+            row['id']: row for row in
+            Product.objects.values('id', 'avg_rating', 'review_count', 'rating_total', 'rating_histogram')
+        }
+
+    def assertMatchesRebuild(self):
+        incremental = self.aggregates()
+        rebuild_ratings()
+        self.assertEqual(incremental, self.aggregates())
+
+    def test_incremental_aggregates_match_a_rebuild(self):
+        review = ReviewRating.objects.create(product=self.shirt, user=self.user, rating=4.5)
+        ReviewRating.objects.create(product=self.shirt, user=self.user, rating=2)
+        self.assertMatchesRebuild()
+        shirt = self.aggregates()[self.shirt.id]
+        self.assertEqual((shirt['review_count'], shirt['avg_rating'], shirt['rating_histogram']), (2, 3.25, {'5': 1, '2': 1}))
+
+        steps = [
+            ('edit', {'rating': 3}),
+            ('hide', {'status': False}),
+            ('edit while hidden', {'rating': 1}),
+            ('show', {'status': True}),
+            ('move', {'product': self.shoe}),
+            ('move back and hide', {'product': self.shirt, 'status': False}),
+            ('move while hidden', {'product': self.shoe}),
+            ('show', {'status': True}),
+        ]
+        for name, changes in steps:
+            with self.subTest(name):
+                for field, value in changes.items():
+                    setattr(review, field, value)
+                review.save()
+                self.assertMatchesRebuild()
+
+        review.delete()
+        self.assertMatchesRebuild()
+        self.assertEqual(self.aggregates()[self.shoe.id]['review_count'], 0)
+        self.assertEqual(self.aggregates()[self.shirt.id]['review_count'], 1)
+
+
+class ProductPathTest(TestCase):
+    def test_migration_backfill_matches_the_urlconf(self):
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        product = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=category)
+        Product.objects.update(url_path='')
+
+        importlib.import_module('store.migrations.0014_product_url_path').backfill_url_path(apps, None)
+
+        self.assertEqual(Product.objects.get(id=product.id).url_path, product.build_url_path())
+
+
+class VariationMapTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=category)
+        self.red = Variation.objects.create(product=self.shirt, variation_category='color', variation_value='Red')
+
+    def test_map_is_cached_per_product(self):
+        self.assertEqual(get_variation_map(self.shirt.id), {('color', 'red'): self.red.id})
+        with self.assertNumQueries(0):
+            self.assertEqual(resolve_variations(self.shirt.id, {'COLOR': 'red', 'csrfmiddlewaretoken': 'x'}), [self.red.id])
+
+    def test_saving_or_deleting_a_variation_refreshes_the_map(self):
+        get_variation_map(self.shirt.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blue = Variation.objects.create(product=self.shirt, variation_category='color', variation_value='Blue')
+        self.assertEqual(get_variation_map(self.shirt.id), {('color', 'red'): self.red.id, ('color', 'blue'): blue.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.red.variation_value = 'Crimson'
+            self.red.save()
+        self.assertEqual(get_variation_map(self.shirt.id), {('color', 'crimson'): self.red.id, ('color', 'blue'): blue.id})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            blue.delete()
+        self.assertEqual(get_variation_map(self.shirt.id), {('color', 'crimson'): self.red.id})
+
+
+class HomeFeedTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(category_name='Shirts', slug='shirts')
+        self.shirt = Product.objects.create(product_name='Shirt', slug='shirt', price=100, stock=5, category=self.category)
+
+    def names(self):
+        return [product.product_name for product in get_home_feed()]
+
+    def test_feed_is_cached(self):
+        self.assertEqual(self.names(), ['Shirt'])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ['Shirt'])
+
+    def test_product_changes_refresh_the_feed(self):
+        self.names()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe = Product.objects.create(product_name='Shoe', slug='shoe', price=100, stock=5, category=self.category)
+        self.assertEqual(self.names(), ['Shoe', 'Shirt'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shirt.is_available = False
+            self.shirt.save()
+        self.assertEqual(self.names(), ['Shoe'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            shoe.delete()
+        self.assertEqual(self.names(), [])
@@ -0,0 +1,42 @@
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Variation
+
+VARIATION_MAP_TIMEOUT = 60 * 60
+IGNORED_FIELDS = ('csrfmiddlewaretoken',)
+
+
+def _map_key(product_id):
+    return f'store:variation_map:{product_id}'
+
+
+def get_variation_map(product_id):
+    # {(category, value) lowercased: variation id} of one product; one query, then cached
+    key = _map_key(product_id)
+    variation_map = cache.get(key)
+    if variation_map is None:
+        variation_map = {
+            (category.lower(), value.lower()): variation_id
+            for variation_id, category, value in Variation.objects.filter(product_id=product_id)
+            .values_list('id', 'variation_category', 'variation_value')
+        }
+        cache.set(key, variation_map, VARIATION_MAP_TIMEOUT)
+    return variation_map
+
+
+def resolve_variations(product_id, data):
+    # Variation ids for the submitted {category: value} pairs, unknown pairs ignored
+    variation_map = get_variation_map(product_id)
+    variation_ids = []
+    for key, value in data.items():
+        if key in IGNORED_FIELDS:
+            continue
+        variation_id = variation_map.get((key.lower(), str(value).lower()))
+        if variation_id is not None:
+            variation_ids.append(variation_id)
+    return variation_ids
+
+
+def invalidate_variation_map(product_id):
+    transaction.on_commit(lambda: cache.delete(_map_key(product_id)))
@@ -1,78 +1,125 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404
 from .models import Product, ReviewRating, ProductGallery
 from category.models import Category
-from carts.models import CartItem
-from carts.views import _cart_id
+from carts.backends import get_cart_store
+from carts.guest import GuestCart
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
-from django.db.models import Q
+from core.pagination import KeysetListPaginator, KeysetPaginator
+from .detail import load_product_detail, review_paginator
+from .facets import filter_products, parse_selection, sort_rows
+from .listing import PRODUCTS_PER_PAGE, get_ordering, listing_count
 from .forms import ReviewForm
+from .search import search_products
 from django.contrib import messages
 from orders.models import OrderProduct
 
+SEARCH_RESULT_LIMIT = 1000  # results shown; more matches show as "1000+ items found"
+
+def _querystring(request, **params):
+    query = request.GET.copy()
+    for key, value in params.items():
+        if value is None:
+            query.pop(key, None)
+        else:
+            query[key] = value
+    return query.urlencode()
 
 # Create your views here.
 def store(request, category_slug=None):
-    products = None
-    products_count = None
+    products = Product.objects.filter(is_available=True)
+    category_id = None
     if category_slug != None:
         categories = get_object_or_404(Category, slug=category_slug)
-        products   = Product.objects.filter(category=categories, is_available=True).order_by('-id')
-        paginator = Paginator(products, 10)
-        page = request.GET.get('page')
-        paged_products = paginator.get_page(page)
-        products_count = products.count()
+        products = products.filter(category=categories)
+        category_id = categories.id
+
+    ## Facets: matching ids and counts come from the in-memory facet index
+    selection = parse_selection(request.GET)
+    matching_ids, facets = filter_products(category_id, selection)
+    is_filtered = any(selection.values())
+
+    ## Keyset pagination: flat cost at any depth and no COUNT per request
+    sort, ordering = get_ordering(request.GET.get('sort'))
+    if is_filtered:
+        # Sorted and sliced in memory, only the products of the page are fetched
+        paginator = KeysetListPaginator(sort_rows(matching_ids), PRODUCTS_PER_PAGE, ordering=ordering, model=Product)
+        paged_products = paginator.get_page(request.GET.get('cursor'))
+        found = products.in_bulk([row.id for row in paged_products])
+        paged_products.object_list = [found[row.id] for row in paged_products if row.id in found]
+    else:
+        paginator = KeysetPaginator(products, PRODUCTS_PER_PAGE, ordering=ordering)
+        paged_products = paginator.get_page(request.GET.get('cursor'))
+    if is_filtered:
+        products_count = len(matching_ids)
     else:
-        products = Product.objects.all().filter(is_available=True).order_by('-id')
-        paginator = Paginator(products, 10)
-        page = request.GET.get('page')
-        paged_products = paginator.get_page(page)
-        products_count = products.count()
+        products_count = listing_count(products, category_slug or 'all')
+
     context = {
         "products": paged_products,
-        "products_count": products_count
+        "products_count": products_count,
+        "facets": facets,
+        "is_filtered": is_filtered,
+        "cursor_pagination": True,
+        "sort": sort,
+        "next_query": _querystring(request, cursor=paged_products.next_cursor),
+        "previous_query": _querystring(request, cursor=paged_products.previous_cursor),
     }
     return render(request, 'store/store.html', context)
 
 def product_detail(request, category_slug, product_slug):
     try:
-        single_product = Product.objects.get(category__slug=category_slug, slug=product_slug)
-        in_cart = CartItem.objects.filter(cart__cart_id=_cart_id(request), product=single_product).exists()
-    except Exception as e:
-        raise e
-    
+        detail = load_product_detail(product_slug)
+    except Product.DoesNotExist:
+        raise Http404("Product not found")
+    single_product = detail['product']
+    if single_product.category.slug != category_slug:
+        raise Http404("Product not found")
+
+    # Later pages of reviews aren't cached, each is one indexed query
+    reviews = detail['reviews']
+    if request.GET.get('reviews'):
+        reviews = review_paginator(single_product.id).get_page(request.GET['reviews'])
+
+    ## Per-visitor bits, everything else comes from the cached detail
     if request.user.is_authenticated:
-        try:
-            orderproduct = OrderProduct.objects.filter(user=request.user, product_id=single_product.id).exists()
-        except OrderProduct.DoesNotExist:
-            orderproduct = None
+        in_cart = get_cart_store().contains_product(request.user, single_product.id)
+        orderproduct = OrderProduct.objects.filter(user=request.user, product_id=single_product.id).exists()
     else:
+        in_cart = GuestCart.from_request(request).contains_product(single_product.id)
         orderproduct = None
 
-    reviews = ReviewRating.objects.filter(product_id=single_product.id, status=True)
-
-    product_gallery = ProductGallery.objects.filter(product_id=single_product.id)
-    
     context = {
         "single_product": single_product,
         "in_cart": in_cart,
         "orderproduct": orderproduct,
         "reviews": reviews,
-        "product_gallery": product_gallery
+        "product_gallery": detail['gallery'],
+        "colors": detail['colors'],
+        "sizes": detail['sizes'],
     }
     return render(request, 'store/product_detail.html', context)
 
 def search(request):
     products = None
     products_count = 0
-    if 'keyword' in request.GET:
-        keyword = request.GET['keyword']
-        if keyword:
-            products = Product.objects.order_by('-created_at').filter(Q(description__icontains=keyword) | Q(product_name__icontains=keyword))
-            products_count = products.count()
+    keyword = request.GET.get('keyword', '').strip()
+    if keyword:
+        ## Ranked product ids from the search index, then one query for the current page
+        # One more than the cap tells whether there are more matches than shown
+        product_ids = search_products(keyword, limit=SEARCH_RESULT_LIMIT + 1)
+        capped = len(product_ids) > SEARCH_RESULT_LIMIT
+        product_ids = product_ids[:SEARCH_RESULT_LIMIT]
+        paginator = Paginator(product_ids, 10)
+        products = paginator.get_page(request.GET.get('page'))
+        page_products = Product.objects.in_bulk(products.object_list)
+        products.object_list = [page_products[pid] for pid in products.object_list if pid in page_products]
+        products_count = f'{SEARCH_RESULT_LIMIT}+' if capped else paginator.count
 
     context = {
         "products": products,
-        "products_count": products_count
+        "products_count": products_count,
+        "keyword": keyword,
     }
     return render(request, 'store/store.html', context)
 